@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Dict, List, Union, Literal
+from typing import Dict, List, Optional, Union, Literal
 from data_model.db_bench_options import DBBenchOptions
 
 class INIConfig(BaseModel):
@@ -8,10 +8,16 @@ class INIConfig(BaseModel):
     CFOptions: Union[List[str], None]
     TableOptionsBlockBasedTable: Union[List[str], None]
 
+class OptionChange(BaseModel):
+    offset_seconds: float
+    options: List[str]
+
 class Action(BaseModel):
     changed_db_options: INIConfig
     changed_db_bench_options: DBBenchOptions
     reason: str
+    prior: Optional[float] = None
+    option_schedule: Optional[List[OptionChange]] = None
 
 class ActionList(BaseModel):
     actions: List[Action]
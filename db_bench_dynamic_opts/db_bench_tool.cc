@@ -92,6 +92,7 @@
 #include "utilities/persistent_cache/block_cache_tier.h"
 
 #include <sys/mman.h>
+#include <sys/stat.h>
 
 // For JsonConfigured Benchmark
 #include <chrono>
@@ -2754,6 +2755,42 @@ class Benchmark {
   int mmap_dynamic_file_desc_ = 0;
   void *mmap_dynamic_file_ = nullptr;
   char *mmap_dynamic_file_addr_ = nullptr;
+  // Sequence of the last applied dynamic options, see LoadAndApplyDynamicOptions
+  std::atomic<uint64_t> dynamic_options_sequence_{0};
+  std::atomic<bool> dynamic_options_ready_{false};
+  std::mutex dynamic_options_mutex_;
+
+  // Layout of the dynamic options file, written by utils/mmap_utils.py
+  static constexpr uint32_t kDynamicOptionsMagic = 0x504F4452;  // "RDOP"
+  static constexpr uint32_t kDynamicOptionsVersion = 1;
+  static constexpr size_t kDynamicOptionsFileSize = 4096;
+  static constexpr size_t kDynamicOptionsHeaderSize = 64;
+  static constexpr size_t kDynamicOptionsSequenceOffset = 8;
+  static constexpr size_t kDynamicOptionsCountOffset = 16;
+  static constexpr size_t kDynamicOptionsEntrySizeOffset = 20;
+  static constexpr size_t kDynamicOptionsAppliedOffset = 24;
+  static constexpr size_t kDynamicOptionsEntrySize = 80;
+  static constexpr size_t kDynamicOptionsNameSize = 48;
+  static constexpr size_t kDynamicOptionsTypeOffset = 48;
+  static constexpr size_t kDynamicOptionsScopeOffset = 49;
+  static constexpr size_t kDynamicOptionsValueOffset = 56;
+  static constexpr size_t kDynamicOptionsValueSize = 24;
+  static constexpr size_t kDynamicOptionsMaxFields =
+      (kDynamicOptionsFileSize - kDynamicOptionsHeaderSize) /
+      kDynamicOptionsEntrySize;
+
+  enum DynamicOptionType : uint8_t {
+    kDynamicOptionInt64 = 1,
+    kDynamicOptionUInt64 = 2,
+    kDynamicOptionDouble = 3,
+    kDynamicOptionBool = 4,
+    kDynamicOptionString = 5,
+  };
+
+  enum DynamicOptionScope : uint8_t {
+    kDynamicOptionDB = 0,
+    kDynamicOptionCF = 1,
+  };
 
 
   class ErrorHandlerListener : public EventListener {
@@ -5076,7 +5113,16 @@ class Benchmark {
       ErrorExit();
     }
 
-    mmap_dynamic_file_ = mmap(nullptr, 1024, PROT_WRITE, MAP_SHARED, 
+    struct stat file_stat;
+    if (fstat(mmap_dynamic_file_desc_, &file_stat) != 0 ||
+        static_cast<size_t>(file_stat.st_size) < kDynamicOptionsFileSize) {
+      fprintf(stderr, "Dynamic options file %s is smaller than %zu bytes\n",
+              FLAGS_dynamic_options_file.c_str(), kDynamicOptionsFileSize);
+      ErrorExit();
+    }
+
+    mmap_dynamic_file_ = mmap(nullptr, kDynamicOptionsFileSize,
+                              PROT_READ | PROT_WRITE, MAP_SHARED,
                               mmap_dynamic_file_desc_, 0);
     if (mmap_dynamic_file_ == MAP_FAILED) {
       fprintf(stderr, "Failed to mmap dynamic options file %s\n",
@@ -5090,7 +5136,7 @@ class Benchmark {
   // To Do: Figure out where to insert this function call
   void CloseDynamicOptionsFile() {
     if (mmap_dynamic_file_ != nullptr) {
-      munmap(mmap_dynamic_file_, 1024);
+      munmap(mmap_dynamic_file_, kDynamicOptionsFileSize);
       mmap_dynamic_file_ = nullptr;
     }
     if (mmap_dynamic_file_desc_ != 0) {
@@ -5099,73 +5145,144 @@ class Benchmark {
     }
   }
 
+  uint64_t LoadDynamicOptionsSequence() {
+    return __atomic_load_n(reinterpret_cast<uint64_t *>(
+                               mmap_dynamic_file_addr_ +
+                               kDynamicOptionsSequenceOffset),
+                           __ATOMIC_ACQUIRE);
+  }
+
+  static std::string DecodeDynamicOption(const char *entry) {
+    const char *value = entry + kDynamicOptionsValueOffset;
+    switch (static_cast<uint8_t>(entry[kDynamicOptionsTypeOffset])) {
+      case kDynamicOptionInt64: {
+        int64_t number;
+        memcpy(&number, value, sizeof(number));
+        return std::to_string(number);
+      }
+      case kDynamicOptionUInt64: {
+        uint64_t number;
+        memcpy(&number, value, sizeof(number));
+        return std::to_string(number);
+      }
+      case kDynamicOptionDouble: {
+        double number;
+        memcpy(&number, value, sizeof(number));
+        return std::to_string(number);
+      }
+      case kDynamicOptionBool: {
+        int64_t number;
+        memcpy(&number, value, sizeof(number));
+        return number ? "true" : "false";
+      }
+      case kDynamicOptionString:
+        return std::string(value, strnlen(value, kDynamicOptionsValueSize));
+      default:
+        return "";
+    }
+  }
+
   void LoadAndApplyDynamicOptions() {
-    // Use db_ and SetDBOptions to change options while online
-    // Use FLAGS_dynamic_options_file to load dynamic options
-    // It is assumed that FLAGS_dynamic_options_file is a mmaped json file
+    // Use db_ and SetDBOptions/SetOptions to change options while online
+    // FLAGS_dynamic_options_file is a mmaped table of typed options guarded by
+    // a seqlock: the writer makes the sequence odd, writes the table and makes
+    // it even again. A table is applied once, when its sequence is even and
+    // did not change while it was copied.
+
+    // Fast path of the benchmark loops: nothing new was published
+    if (dynamic_options_ready_.load(std::memory_order_acquire) &&
+        LoadDynamicOptionsSequence() ==
+            dynamic_options_sequence_.load(std::memory_order_relaxed)) {
+      return;
+    }
+
+    // Another thread is already applying the options
+    std::unique_lock<std::mutex> lock(dynamic_options_mutex_, std::try_to_lock);
+    if (!lock.owns_lock()) {
+      return;
+    }
 
     if (mmap_dynamic_file_desc_ == 0) {
       OpenDynamicOptionsFile();
+      dynamic_options_ready_.store(true, std::memory_order_release);
     }
 
-    if (mmap_dynamic_file_addr_[0] == 1) { 
-      int mddf_max_open_file = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 1);
-      int mddf_max_total_wal_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 5);
-      // int mddf_delete_obsolete_files_period_micros = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 9);
-      int mddf_max_background_jobs = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 13);
-      int mddf_max_background_compactions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 17);
-      int mddf_max_subcompactions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 21);
-      int mddf_stats_dump_period_sec = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 25);
-      int mddf_compaction_readahead_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 29);
-      int mddf_writable_file_max_buffer_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 33);
-      int mddf_bytes_per_sync = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 37);
-      int mddf_wal_bytes_per_sync = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 41);
-      int mddf_delayed_write_rate = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 45);
-      int mddf_avoid_flush_during_shutdown = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 49);
-
-      int mddf_write_buffer_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 53);
-      int mddf_compression = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 57);
-      int mddf_level0_file_num_compaction_trigger = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 61);
-      int mddf_max_bytes_for_level_base = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 65);
-      int mddf_disable_auto_compactions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 69);
-      int mddf_memtable_max_range_deletions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 73);
-
-        // {"delete_obsolete_files_period_micros", std::to_string(mddf_delete_obsolete_files_period_micros)},
-      db_.db->SetDBOptions({
-        {"max_open_files", std::to_string(mddf_max_open_file)},
-        {"max_total_wal_size", std::to_string(mddf_max_total_wal_size)},
-        {"max_background_jobs", std::to_string(mddf_max_background_jobs)},
-        {"max_background_compactions", std::to_string(mddf_max_background_compactions)},
-        {"max_subcompactions", std::to_string(mddf_max_subcompactions)},
-        {"stats_dump_period_sec", std::to_string(mddf_stats_dump_period_sec)},
-        {"compaction_readahead_size", std::to_string(mddf_compaction_readahead_size)},
-        {"writable_file_max_buffer_size", std::to_string(mddf_writable_file_max_buffer_size)},
-        {"bytes_per_sync", std::to_string(mddf_bytes_per_sync)},
-        {"wal_bytes_per_sync", std::to_string(mddf_wal_bytes_per_sync)},
-        {"delayed_write_rate", std::to_string(mddf_delayed_write_rate)},
-        {"avoid_flush_during_shutdown", std::to_string(mddf_avoid_flush_during_shutdown)}
-      });
-
-      db_.db->SetOptions({
-        {"write_buffer_size", std::to_string(mddf_write_buffer_size)},
-        {"compression", std::to_string(mddf_compression)},
-        {"level0_file_num_compaction_trigger", std::to_string(mddf_level0_file_num_compaction_trigger)},
-        {"max_bytes_for_level_base", std::to_string(mddf_max_bytes_for_level_base)},
-        {"disable_auto_compactions", std::to_string(mddf_disable_auto_compactions)},
-        {"memtable_max_range_deletions", std::to_string(mddf_memtable_max_range_deletions)}
-      });
-
-      fprintf(stderr, "Received dynamic options\n");
-      fprintf(stderr, "max_open_files: %d\n", mddf_max_open_file);
-      fprintf(stderr, "max_total_wal_size: %d\n", mddf_max_total_wal_size);
-      fprintf(stderr, "max_background_jobs: %d\n", mddf_max_background_jobs);
-      fprintf(stderr, "memtable_max_range_deletions: %d\n", mddf_memtable_max_range_deletions);
-    }
-
-    mmap_dynamic_file_addr_[0] = 0;
-
-    // Temporary solution to close the file after reading
-    // CloseDynamicOptionsFile();
+    uint64_t sequence = LoadDynamicOptionsSequence();
+    if ((sequence & 1) ||
+        sequence == dynamic_options_sequence_.load(std::memory_order_relaxed)) {
+      return;
+    }
+
+    uint32_t magic, version, count, entry_size;
+    memcpy(&magic, mmap_dynamic_file_addr_, sizeof(magic));
+    memcpy(&version, mmap_dynamic_file_addr_ + 4, sizeof(version));
+    memcpy(&count, mmap_dynamic_file_addr_ + kDynamicOptionsCountOffset,
+           sizeof(count));
+    memcpy(&entry_size,
+           mmap_dynamic_file_addr_ + kDynamicOptionsEntrySizeOffset,
+           sizeof(entry_size));
+    if (magic != kDynamicOptionsMagic || version != kDynamicOptionsVersion ||
+        entry_size != kDynamicOptionsEntrySize) {
+      fprintf(stderr,
+              "Ignoring dynamic options with magic %x, version %u and entry "
+              "size %u\n",
+              magic, version, entry_size);
+      dynamic_options_sequence_.store(sequence, std::memory_order_relaxed);
+      return;
+    }
+    count = std::min<uint32_t>(count, kDynamicOptionsMaxFields);
+
+    char table[kDynamicOptionsFileSize];
+    memcpy(table, mmap_dynamic_file_addr_ + kDynamicOptionsHeaderSize,
+           count * kDynamicOptionsEntrySize);
+    std::atomic_thread_fence(std::memory_order_acquire);
+    if (LoadDynamicOptionsSequence() != sequence) {
+      // The writer is updating the table, it is read again on the next call
+      return;
+    }
+
+    std::unordered_map<std::string, std::string> db_options;
+    std::unordered_map<std::string, std::string> cf_options;
+    for (uint32_t i = 0; i < count; i++) {
+      const char *entry = table + i * kDynamicOptionsEntrySize;
+      std::string name(entry, strnlen(entry, kDynamicOptionsNameSize));
+      std::string value = DecodeDynamicOption(entry);
+      if (name.empty() || value.empty()) {
+        continue;
+      }
+      if (entry[kDynamicOptionsScopeOffset] == kDynamicOptionDB) {
+        db_options[name] = value;
+      } else {
+        cf_options[name] = value;
+      }
+    }
+
+    fprintf(stderr, "Received dynamic options (sequence %" PRIu64 ")\n",
+            sequence);
+    if (!db_options.empty()) {
+      Status s = db_.db->SetDBOptions(db_options);
+      if (!s.ok()) {
+        fprintf(stderr, "SetDBOptions failed: %s\n", s.ToString().c_str());
+      }
+    }
+    if (!cf_options.empty()) {
+      Status s = db_.db->SetOptions(cf_options);
+      if (!s.ok()) {
+        fprintf(stderr, "SetOptions failed: %s\n", s.ToString().c_str());
+      }
+    }
+    for (const auto &option : db_options) {
+      fprintf(stderr, "%s: %s\n", option.first.c_str(), option.second.c_str());
+    }
+    for (const auto &option : cf_options) {
+      fprintf(stderr, "%s: %s\n", option.first.c_str(), option.second.c_str());
+    }
+
+    dynamic_options_sequence_.store(sequence, std::memory_order_relaxed);
+    // Acknowledge the sequence so the writer knows the options are live
+    __atomic_store_n(reinterpret_cast<uint64_t *>(mmap_dynamic_file_addr_ +
+                                                  kDynamicOptionsAppliedOffset),
+                     sequence, __ATOMIC_RELEASE);
   }
 
   void DoWrite(ThreadState* thread, WriteMode write_mode) {
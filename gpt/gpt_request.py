@@ -1,8 +1,15 @@
+import asyncio
 import os
 import re
-from openai import OpenAI
-from utils.constants import EMBEDDING_MODEL, LLM_MODEL, RAG, ENABLE_MCTS, OUTPUT_PATH
+import threading
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from openai.types.chat import ChatCompletion, ParsedChatCompletion
+from utils.constants import EMBEDDING_MODEL, LLM_MODEL, RAG, ENABLE_MCTS, OUTPUT_PATH, LLM_MAX_CONCURRENCY, LLM_MAX_RETRIES
+from utils.constants import LLM_CACHE, LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
 from utils.utils import log_gpt_response, log_update
+from gpt.response_cache import ResponseCache, CacheMiss, request_key
+from utils.results_store import results_store
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.messages import HumanMessage, AIMessage
@@ -12,19 +19,154 @@ from langchain.chains import create_retrieval_chain
 import json
 from datetime import datetime
 
-# Environment variables
-client = OpenAI(
+# All requests run on one event loop in a background thread and share its connection pool,
+# the synchronous functions below submit to it so they can be called from any thread
+loop = asyncio.new_event_loop()
+threading.Thread(target=loop.run_forever, name="llm_event_loop", daemon=True).start()
+semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# Keep enough connections alive for every concurrent request
+http_client = DefaultAsyncHttpxClient(
+    limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY),
+)
+
+# Environment variables, OPENAI_BASE_URL points the client to a local OpenAI-compatible server
+# Failed requests (connection errors, 408, 409, 429 and 5xx) are retried with exponential backoff
+client = AsyncOpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
+    max_retries=LLM_MAX_RETRIES,
+    http_client=http_client,
 )
 
 if 'llama' in LLM_MODEL:
-    client = OpenAI(
+    client = AsyncOpenAI(
         api_key=os.getenv("LLAMA_API_KEY"),
         base_url = "https://api.llama-api.com",
+        max_retries=LLM_MAX_RETRIES,
+        http_client=http_client,
     )
 
 embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
 
+# Responses recorded by previous runs, "replay" never calls the API
+response_cache = None
+if LLM_CACHE != "off":
+    response_cache = ResponseCache(
+        LLM_CACHE_PATH,
+        mode=LLM_CACHE,
+        ttl_seconds=LLM_CACHE_TTL,
+        max_entries=LLM_CACHE_MAX_ENTRIES,
+        stats_path=os.path.join(OUTPUT_PATH, "gpt_cache_stats.txt"),
+    )
+
+def submit(coroutine):
+    '''
+    Schedule a request coroutine on the shared event loop without waiting for it
+
+    Parameters:
+    - coroutine: coroutine of one of the async_* request functions
+
+    Returns:
+    - future: concurrent.futures.Future resolving to the result of the coroutine
+    '''
+    return asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+def run(coroutine):
+    '''
+    Run a request coroutine on the shared event loop and wait for its result
+
+    Parameters:
+    - coroutine: coroutine of one of the async_* request functions
+
+    Returns:
+    - result: the result of the coroutine
+    '''
+    return submit(coroutine).result()
+
+def log_gpt_cost(response):
+    '''
+    Append the token usage of a response to gpt_cost.txt and the results store
+
+    Parameters:
+    - response: chat completion returned by the API
+
+    Returns:
+    - None
+    '''
+    # if not exist file add header
+    cost_log_file_path = os.path.join(OUTPUT_PATH, "gpt_cost.txt")
+    if not os.path.exists(cost_log_file_path):
+        with open(cost_log_file_path, "w") as file:
+            file.write("timestamp\tmodel\ttokens\tprompt_tokens\tcompletion_tokens\tcached_tokens\n")
+    with open(cost_log_file_path, "a") as file:
+        timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        file.write(f"{timestamp_str}\t{LLM_MODEL}\t{response.usage.total_tokens}\t{response.usage.prompt_tokens}\t{response.usage.completion_tokens}\t{response.usage.prompt_tokens_details.cached_tokens}\n")
+    store = results_store()
+    if store is not None:
+        store.record_llm_usage(LLM_MODEL, response.usage)
+
+async def cached_request(request, send, load):
+    '''
+    Answer a request from the response cache, or send it and record the response
+
+    Parameters:
+    - request: dictionary of the arguments sent to the API
+    - send: coroutine function sending the request
+    - load: function rebuilding the response from its recorded JSON
+
+    Returns:
+    - response: the recorded or the new response
+    '''
+    if response_cache is None:
+        return await send()
+
+    key = request_key(request)
+    occurrence = response_cache.next_occurrence(key)
+    cached = response_cache.get(key, occurrence)
+    if cached is not None:
+        log_update(f"[GPTR] Cache hit: {key[:16]} ({occurrence})")
+        return load(cached)
+    if response_cache.mode == "replay":
+        raise CacheMiss(f"No recorded response for request {key} ({occurrence}) in replay mode")
+
+    response = await send()
+    response_cache.put(key, occurrence, request["model"], response.model_dump_json())
+    return response
+
+async def create_completion(**kwargs):
+    '''
+    Send a chat completion request once a concurrency slot is free
+
+    Parameters:
+    - kwargs: arguments of client.chat.completions.create
+
+    Returns:
+    - completion: the chat completion
+    '''
+    async def send():
+        async with semaphore:
+            return await client.chat.completions.create(**kwargs)
+
+    return await cached_request(kwargs, send, ChatCompletion.model_validate_json)
+
+async def parse_completion(**kwargs):
+    '''
+    Send a structured output request once a concurrency slot is free
+
+    Parameters:
+    - kwargs: arguments of client.beta.chat.completions.parse
+
+    Returns:
+    - completion: the parsed chat completion
+    '''
+    async def send():
+        async with semaphore:
+            response = await client.beta.chat.completions.parse(**kwargs)
+        log_gpt_cost(response)
+        return response
+
+    return await cached_request(kwargs, send, ParsedChatCompletion[kwargs["response_format"]].model_validate_json)
+
 def request_gpt_rag(system_content, user_contents, assistant_content, temperature):
     '''
     Function to make an API call to GPT-4
@@ -112,7 +254,7 @@ def request_gpt_rag(system_content, user_contents, assistant_content, temperatur
         return None
 
 
-def request_gpt(system_content, user_contents, assistant_content, temperature):
+async def async_request_gpt(system_content, user_contents, assistant_content, temperature):
     '''
     Function to make an API call to GPT-4
 
@@ -130,7 +272,8 @@ def request_gpt(system_content, user_contents, assistant_content, temperature):
     '''
 
     if RAG:
-        return request_gpt_rag(system_content, user_contents, assistant_content, temperature)
+        # The RAG chain is synchronous, keep it off the event loop
+        return await asyncio.to_thread(request_gpt_rag, system_content, user_contents, assistant_content, temperature)
 
     messages = [{"role": "user", "content": system_content}]
 
@@ -155,7 +298,7 @@ def request_gpt(system_content, user_contents, assistant_content, temperature):
     #     presence_penalty=0,
     # )
 
-    completion = client.chat.completions.create(
+    completion = await create_completion(
         model=LLM_MODEL,
         messages=messages,
     )
@@ -181,7 +324,22 @@ def request_gpt(system_content, user_contents, assistant_content, temperature):
         file.write(assistant_reply + "\n\n" + "-" * 150 + "\n\n")
     return None
 
-def send_gpt_request(system_contents, user_contents, temperature):
+def request_gpt(system_content, user_contents, assistant_content, temperature):
+    '''
+    Synchronous version of async_request_gpt
+
+    Parameters:
+    - system_content: string containing the system information
+    - user_contents: list of strings containing the user inputs
+    - assistant_content: list of strings containing the assistant responses
+    - temperature: Float (0-1) controlling GPT-4's output randomness.
+
+    Returns:
+    - matches: string containing the options file generated by GPT-4
+    '''
+    return run(async_request_gpt(system_content, user_contents, assistant_content, temperature))
+
+async def async_send_gpt_request(system_contents, user_contents, temperature):
     '''
     Function to send a request to GPT-4
 
@@ -205,7 +363,7 @@ def send_gpt_request(system_contents, user_contents, temperature):
     #     presence_penalty=0,
     # )
 
-    completion = client.chat.completions.create(
+    completion = await create_completion(
         model=LLM_MODEL,
         messages=messages,
     )
@@ -216,10 +374,23 @@ def send_gpt_request(system_contents, user_contents, temperature):
 
     return assistant_reply
 
+def send_gpt_request(system_contents, user_contents, temperature):
+    '''
+    Synchronous version of async_send_gpt_request
 
+    Parameters:
+    - user_contents: list of strings containing the user inputs
+    - temperature: Float (0-1) controlling GPT-4's output randomness.
+
+    Returns:
+    - matches: string containing the options file generated by GPT-4
+    '''
+    return run(async_send_gpt_request(system_contents, user_contents, temperature))
 
 
-def request_gpt_with_json_response(system_content, user_contents, assistant_content, temperature):
+
+
+async def async_request_gpt_with_json_response(system_content, user_contents, assistant_content, temperature):
     '''
     Function to make an API call to GPT-4
 
@@ -254,7 +425,7 @@ def request_gpt_with_json_response(system_content, user_contents, assistant_cont
 
     we_did_not_specify_stop_tokens = True
     try:
-        response = client.chat.completions.create(
+        response = await create_completion(
             model=LLM_MODEL,
             messages=messages,
             temperature=temperature,
@@ -302,8 +473,23 @@ def request_gpt_with_json_response(system_content, user_contents, assistant_cont
         raise e
     return json_dict
 
+def request_gpt_with_json_response(system_content, user_contents, assistant_content, temperature):
+    '''
+    Synchronous version of async_request_gpt_with_json_response
+
+    Parameters:
+    - system_content: string containing the system information
+    - user_contents: list of strings containing the user inputs
+    - assistant_content: list of strings containing the assistant responses
+    - temperature: Float (0-1) controlling GPT-4's output randomness.
 
-def request_gpt_with_structured_output(system_content, user_contents, assistant_content, response_format, temperature):
+    Returns:
+    - response: python dictionary containing the JSON response from GPT-4
+    '''
+    return run(async_request_gpt_with_json_response(system_content, user_contents, assistant_content, temperature))
+
+
+async def async_request_gpt_with_structured_output(system_content, user_contents, assistant_content, response_format, temperature):
     '''
     Function to make an API call to GPT-4
 
@@ -338,21 +524,13 @@ def request_gpt_with_structured_output(system_content, user_contents, assistant_
 
     we_did_not_specify_stop_tokens = True
     try:
-        response = client.beta.chat.completions.parse(
+        response = await parse_completion(
             model=LLM_MODEL,
             messages=messages,
             temperature=temperature,
             response_format=response_format,
         )
-        # if not exist file add header
-        cost_log_file_path = os.path.join(OUTPUT_PATH, "gpt_cost.txt")
-        if not os.path.exists(cost_log_file_path):
-            with open(cost_log_file_path, "w") as file:
-                file.write("timestamp\tmodel\ttokens\tprompt_tokens\tcompletion_tokens\tcached_tokens\n")
-        with open(cost_log_file_path, "a") as file:
-            timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            file.write(f"{timestamp_str}\t{LLM_MODEL}\t{response.usage.total_tokens}\t{response.usage.prompt_tokens}\t{response.usage.completion_tokens}\t{response.usage.prompt_tokens_details.cached_tokens}\n")
-            
+
         # print(response.choices[0].message)
         # print(response.choices[0])
         # Check if the conversation was too long for the context window, resulting in incomplete JSON 
@@ -388,4 +566,20 @@ def request_gpt_with_structured_output(system_content, user_contents, assistant_
         print(e)
         raise e
     
-    return response.choices[0].message.parsed
\ No newline at end of file
+    return response.choices[0].message.parsed
+
+def request_gpt_with_structured_output(system_content, user_contents, assistant_content, response_format, temperature):
+    '''
+    Synchronous version of async_request_gpt_with_structured_output
+
+    Parameters:
+    - system_content: string containing the system information
+    - user_contents: list of strings containing the user inputs
+    - assistant_content: list of strings containing the assistant responses
+    - response_format: pydantic model of the expected response
+    - temperature: Float (0-1) controlling GPT-4's output randomness.
+
+    Returns:
+    - response: instance of response_format parsed from the response of GPT-4
+    '''
+    return run(async_request_gpt_with_structured_output(system_content, user_contents, assistant_content, response_format, temperature))
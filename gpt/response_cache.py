@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.utils import log_update
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (key, occurrence)
+)
+"""
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+def request_key(request):
+    '''
+    Compute the content address of a request
+
+    Parameters:
+    - request (dict): The arguments sent to the API: model, temperature, messages and response_format.
+                      A pydantic response_format is replaced by its JSON schema
+
+    Returns:
+    - str: The key of the request
+    '''
+    response_format = request.get("response_format")
+    if hasattr(response_format, "model_json_schema"):
+        request = dict(request, response_format={"name": response_format.__name__, "schema": response_format.model_json_schema()})
+    payload = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """SQLite store of LLM responses addressed by the hash of the request."""
+
+    def __init__(self, path, mode="on", ttl_seconds=0, max_entries=0, stats_path=None):
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats_path = stats_path
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # The n-th identical request of a run maps to the n-th recorded response,
+        # retries of the same prompt still get fresh answers and a rerun replays them in order
+        self.occurrences = {}
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+        self.evict()
+
+    def next_occurrence(self, key):
+        with self.lock:
+            occurrence = self.occurrences.get(key, 0)
+            self.occurrences[key] = occurrence + 1
+        return occurrence
+
+    def get(self, key, occurrence):
+        '''
+        Look up a recorded response
+
+        Parameters:
+        - key (str): The key of the request
+        - occurrence (int): How many identical requests were sent before in this run
+
+        Returns:
+        - str: The recorded response as JSON, None on a miss
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT response, created FROM responses WHERE key = ? AND occurrence = ?", (key, occurrence)
+            ).fetchone()
+            now = time.time()
+            if row is not None and self.ttl_seconds > 0 and now - row[1] > self.ttl_seconds:
+                self.connection.execute("DELETE FROM responses WHERE key = ? AND occurrence = ?", (key, occurrence))
+                self.stats["evictions"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+            else:
+                self.connection.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ? AND occurrence = ?", (now, key, occurrence)
+                )
+                self.stats["hits"] += 1
+            self.connection.commit()
+        self.write_stats()
+        return row[0] if row is not None else None
+
+    def put(self, key, occurrence, model, response):
+        '''
+        Record a response
+
+        Parameters:
+        - key (str): The key of the request
+        - occurrence (int): How many identical requests were sent before in this run
+        - model (str): The model that generated the response
+        - response (str): The response as JSON
+
+        Returns:
+        - None
+        '''
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", (key, occurrence, model, response, now, now)
+            )
+            self.stats["stores"] += 1
+            self.connection.commit()
+        self.evict()
+        self.write_stats()
+
+    def evict(self):
+        '''
+        Drop the responses older than the TTL, then the least recently used ones above the entry limit
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        with self.lock:
+            evicted = 0
+            if self.ttl_seconds > 0:
+                evicted += self.connection.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+            if self.max_entries > 0:
+                evicted += self.connection.execute(
+                    "DELETE FROM responses WHERE rowid IN "
+                    "(SELECT rowid FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                ).rowcount
+            self.connection.commit()
+            self.stats["evictions"] += evicted
+        if evicted:
+            log_update(f"[GPTR] Evicted {evicted} cached responses")
+
+    def write_stats(self):
+        if self.stats_path is None:
+            return
+        with self.lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        with open(self.stats_path, "w") as file:
+            file.write("\t".join(stats.keys()) + "\n")
+            file.write("\t".join(str(value) for value in stats.values()) + "\n")
@@ -55,13 +55,17 @@ def main():
 
     if constants.ENABLE_MCTS and not constants.LOAD_RECORDS:
         # workflow for system with no records
-        options, reasoning = get_initial_options_file()
+        if constants.RESUME:
+            # The root and its benchmark are restored from the checkpoint
+            options, reasoning, benchmark_results = None, None, None
+        else:
+            options, reasoning = get_initial_options_file()
 
 
-        is_error, benchmark_results, average_cpu_usage, average_memory_usage, options = spm.benchmark_mcts(
-            db_path, options, output_folder_dir, reasoning, None, 0, None, options_files, [], constants.OPTIONS_FILE_DIR)
+            is_error, benchmark_results, average_cpu_usage, average_memory_usage, options = spm.benchmark_mcts(
+                db_path, options, output_folder_dir, reasoning, None, 0, None, options_files, [], constants.OPTIONS_FILE_DIR)
         
-        best_node = mcts(options, reasoning, benchmark_results,  system_info(db_path, fio_result), max_iterations=3)
+        best_node = mcts(options, reasoning, benchmark_results,  system_info(db_path, fio_result), max_iterations=3, resume=constants.RESUME)
         # Run benchmark with the best node
         db_path = path_of_db() + "/" + "best_node"
         os.makedirs(db_path, exist_ok=True)
@@ -75,10 +79,14 @@ def main():
 
     else:
         # Reuse insights workflow
-        options, reasoning = get_initial_options_file()
+        if constants.RESUME:
+            # The root and its benchmark are restored from the checkpoint
+            options, reasoning, benchmark_results = None, None, None
+        else:
+            options, reasoning = get_initial_options_file()
 
-        is_error, benchmark_results, average_cpu_usage, average_memory_usage, options = spm.benchmark_mcts(
-                db_path, options, output_folder_dir, reasoning, None, 0, None, options_files, [], constants.OPTIONS_FILE_DIR)
+            is_error, benchmark_results, average_cpu_usage, average_memory_usage, options = spm.benchmark_mcts(
+                    db_path, options, output_folder_dir, reasoning, None, 0, None, options_files, [], constants.OPTIONS_FILE_DIR)
         
         memory = Memory()
 
@@ -88,7 +96,7 @@ def main():
         # workflow for new system
         if constants.ENABLE_UNKNOWN:
 
-            best_node = insights_driven_mcts(options, reasoning, memory, system_info(db_path, fio_result), benchmark_results, max_iterations=1, refine_flag=True, insights_num=5, examples_num=0, refine_num=3)
+            best_node = insights_driven_mcts(options, reasoning, memory, system_info(db_path, fio_result), benchmark_results, max_iterations=1, refine_flag=True, insights_num=5, examples_num=0, refine_num=3, resume=constants.RESUME)
 
             print("Best node benchmark results:")
             print(best_node.score)
@@ -96,7 +104,7 @@ def main():
             exit(1)
         # workflow for known system by loading previous insights
         else:
-            best_node = insights_driven_mcts(options, reasoning, memory, system_info(db_path, fio_result), benchmark_results, max_iterations=3, refine_flag=False, insights_num=5, examples_num=0, refine_num=0)
+            best_node = insights_driven_mcts(options, reasoning, memory, system_info(db_path, fio_result), benchmark_results, max_iterations=3, refine_flag=False, insights_num=5, examples_num=0, refine_num=0, resume=constants.RESUME)
             # Run benchmark with the best node
             
             print("Best node benchmark results:")
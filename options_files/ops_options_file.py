@@ -1,5 +1,7 @@
 import os
 import re
+import json
+import hashlib
 import configparser
 from abstraction.abstraction import convert_options_to_rocksdb
 from utils.constants import ABSTRACTION, DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME, OPTIONS_FILE_DIR
@@ -329,4 +331,86 @@ def parse_option_file_to_dict(option_file):
             section[k] = m[1]
     return parsed
 
+# Size suffixes accepted by RocksDB and produced by the LLM, e.g. 64MB, 64M, 64MiB
+SIZE_PATTERN = re.compile(r"^(-?\d+(?:\.\d+)?)\s*([kmgtp])(?:i?b)?$", re.IGNORECASE)
+SIZE_UNITS = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40, "p": 1 << 50}
+BOOLEAN_VALUES = {"true": "true", "yes": "true", "on": "true", "false": "false", "no": "false", "off": "false"}
 
+def canonical_value(value):
+    '''
+    Normalize the spelling of an option value
+
+    Parameters:
+    - value (str): The option value
+
+    Returns:
+    - str: The value with units expanded, booleans and numbers in a single spelling
+    '''
+    value = str(value).strip().strip('"').strip("'").strip()
+    if value.lower() in BOOLEAN_VALUES:
+        return BOOLEAN_VALUES[value.lower()]
+
+    match = SIZE_PATTERN.match(value)
+    if match is not None:
+        return str(int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()]))
+
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    if number.is_integer():
+        return str(int(number))
+    return repr(number)
+
+def canonical_configuration(options, db_bench_args):
+    '''
+    Build the canonical form of a configuration
+    Options equal to the initial options file are dropped, so a configuration that spells out a default
+    and one that omits it are the same
+
+    Parameters:
+    - options (str): The options file
+    - db_bench_args (list): The db_bench arguments
+
+    Returns:
+    - dict: {section: {option: value}} with normalized values, plus the db_bench arguments under "db_bench"
+    '''
+    initial_options, _ = get_initial_options_file()
+    defaults = parse_option_file_to_dict(initial_options)
+
+    canonical = {}
+    for section, section_options in parse_option_file_to_dict(options).items():
+        section_defaults = defaults.get(section, {})
+        for key, value in section_options.items():
+            value = canonical_value(value)
+            if key in section_defaults and canonical_value(section_defaults[key]) == value:
+                continue
+            canonical.setdefault(section.strip(), {})[key.strip()] = value
+
+    args = {}
+    for key, value in parse_db_bench_args_to_dict(db_bench_args).items():
+        if value is None or str(value) == "None":
+            continue
+        args[key.strip()] = canonical_value(value)
+    if args:
+        canonical["db_bench"] = args
+    return canonical
+
+def configuration_hash(options, db_bench_args, option_schedule=None):
+    '''
+    Compute a stable hash of a configuration, independent of key order and value spelling
+
+    Parameters:
+    - options (str): The options file
+    - db_bench_args (list): The db_bench arguments
+    - option_schedule (list): (offset in seconds, {option: value}) changes applied while the benchmark runs
+
+    Returns:
+    - str: The hash of the canonical configuration
+    '''
+    canonical = canonical_configuration(options, db_bench_args)
+    if option_schedule:
+        canonical["schedule"] = [
+            [offset, {key: canonical_value(value) for key, value in changes.items()}] for offset, changes in option_schedule
+        ]
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()[:16]
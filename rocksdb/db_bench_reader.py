@@ -0,0 +1,112 @@
+import queue
+import threading
+from dataclasses import dataclass
+
+from rocksdb.early_stop import stop_benchmark
+from rocksdb.parse_db_bench_output import IntervalSample
+from utils.utils import log_update
+
+# Interval samples waiting for the decision worker, the oldest are dropped while it is busy
+SAMPLE_QUEUE_SIZE = 256
+
+
+@dataclass
+class RestartRequest:
+    """A restart rule was triggered, the decision worker restarts the benchmark with new options."""
+    sample: IntervalSample
+    reason: str
+
+
+class DBBenchReader:
+    """Drain the output of a running db_bench on its own thread, so a slow consumer never blocks its writes."""
+
+    def __init__(self, proc, output, stop_rules=(), restart_rule=None, queue_size=SAMPLE_QUEUE_SIZE):
+        '''
+        Parameters:
+        - proc (Popen): The running db_bench process, with its stdout piped in text mode
+        - output (DBBenchOutputParser): The parser every line is fed to
+        - stop_rules (list): Rules with update(interval_ops_per_sec) and reason, the benchmark is stopped when one triggers
+        - restart_rule: A rule whose trigger is handed to the decision worker as a RestartRequest
+        - queue_size (int): The number of events kept for the decision worker
+        '''
+        self.proc = proc
+        self.output = output
+        self.stop_rules = [rule for rule in stop_rules if rule is not None]
+        self.restart_rule = restart_rule
+        self.events = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, event):
+        # Never block the reader: a full queue loses its oldest event instead
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.events.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        # Stop and restart rules are cheap, they see every sample even when the worker falls behind
+        forwarding = True
+        try:
+            for line in self.proc.stdout:
+                event = self.output.feed(line)
+                if not isinstance(event, IntervalSample) or not forwarding:
+                    continue
+                triggered = [rule for rule in self.stop_rules if rule.update(event.interval_ops_per_sec)]
+                if triggered:
+                    stop_benchmark(self.proc, self.output, triggered[0].reason)
+                    break
+                if self.restart_rule is not None and self.restart_rule.update(event.interval_ops_per_sec):
+                    # The worker kills the process, the rest of the output is only parsed
+                    self.put(RestartRequest(event, self.restart_rule.reason))
+                    forwarding = False
+                    continue
+                self.put(event)
+        finally:
+            self.put(None)
+
+    def samples(self, timeout=None):
+        '''
+        Iterate over the interval samples and restart requests until db_bench exits
+
+        Parameters:
+        - timeout (float): Seconds without any event after which None is yielded, None to wait forever
+
+        Returns:
+        - generator: IntervalSample, RestartRequest, or None after a timeout
+        '''
+        while True:
+            try:
+                event = self.events.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+                continue
+            if event is None:
+                return
+            yield event
+
+    def join(self):
+        '''
+        Wait for the end of the output
+
+        Parameters:
+        - None
+
+        Returns:
+        - int: The number of events dropped because the decision worker was busy
+        '''
+        if self.thread is not None:
+            self.thread.join()
+        if self.dropped:
+            log_update(f"[SQU] {self.dropped} interval samples were dropped while the decision worker was busy")
+        return self.dropped
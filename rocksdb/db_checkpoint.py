@@ -0,0 +1,174 @@
+import os
+import shutil
+import subprocess
+import threading
+
+from rocksdb.snapshot_cache import restore_snapshot, directory_size
+from utils.constants import DB_CHECKPOINT, DB_CHECKPOINT_BUDGET_GB, LDB_PATH
+from utils.utils import path_of_db, log_update
+
+CHECKPOINT_SUFFIX = "_checkpoint"
+# Workloads whose benchmark writes a fresh database, db_bench skips them with --use_existing_db
+FRESH_DB_TESTS = ("fillrandom", "sinetest", "jsonconfigured")
+
+# Parallel slots save, restore and evict checkpoints from their own threads
+checkpoint_lock = threading.Lock()
+
+
+def db_checkpoint_path(node_id):
+    '''
+    Function to get the checkpoint directory of a node, next to its database directory
+
+    Parameters:
+    - node_id (int): The id of the node
+
+    Returns:
+    - str: The checkpoint directory
+    '''
+    return path_of_db() + f"/{node_id}{CHECKPOINT_SUFFIX}"
+
+
+def has_db_checkpoint(node_id):
+    return os.path.exists(os.path.join(db_checkpoint_path(node_id), "CURRENT"))
+
+
+def create_db_checkpoint(database_path, checkpoint_path):
+    '''
+    Function to take a checkpoint of a closed database
+
+    The checkpoint is taken with "ldb checkpoint", which hardlinks the SST files and copies the MANIFEST.
+    Without ldb the files of the directory are shared the same way as a preloaded snapshot.
+
+    Parameters:
+    - database_path (str): The database directory, db_bench must have exited
+    - checkpoint_path (str): The checkpoint directory to create
+
+    Returns:
+    - bool: True if the checkpoint was taken
+    '''
+    shutil.rmtree(checkpoint_path, ignore_errors=True)
+    if os.path.exists(LDB_PATH):
+        command = [LDB_PATH, f"--db={database_path}", "--try_load_options", "checkpoint", f"--checkpoint_dir={checkpoint_path}"]
+        proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, check=False)
+        if proc.returncode != 0 or not os.path.exists(os.path.join(checkpoint_path, "CURRENT")):
+            log_update(f"[DBC] ldb checkpoint failed: {proc.stdout[-2000:]}")
+            shutil.rmtree(checkpoint_path, ignore_errors=True)
+            return False
+    else:
+        if not os.path.exists(os.path.join(database_path, "CURRENT")):
+            return False
+        # The root database also holds the databases and checkpoints of the nodes
+        restore_snapshot(database_path, checkpoint_path, files_only=True)
+    return True
+
+
+def evict_db_checkpoints(keep=()):
+    '''
+    Function to delete the least recently used checkpoints until they fit in DB_CHECKPOINT_BUDGET_GB
+
+    Parameters:
+    - keep (tuple): The checkpoint directories that must not be deleted
+
+    Returns:
+    - list: The deleted checkpoint directories
+    '''
+    db_root = path_of_db()
+    if not os.path.isdir(db_root):
+        return []
+    checkpoints = []
+    for entry in os.scandir(db_root):
+        if entry.is_dir() and entry.name.endswith(CHECKPOINT_SUFFIX):
+            checkpoints.append((entry.stat().st_mtime, entry.path, directory_size(entry.path)))
+
+    budget = DB_CHECKPOINT_BUDGET_GB * 1024 ** 3
+    total = sum(size for _, _, size in checkpoints)
+    evicted = []
+    # Restoring a checkpoint touches it, the oldest were used the longest time ago
+    for _, path, size in sorted(checkpoints):
+        if total <= budget:
+            break
+        if path in keep:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        evicted.append(path)
+        log_update(f"[DBC] Evicted {path} ({size / 1024 ** 3:.2f}GB), checkpoints use {total / 1024 ** 3:.2f}GB")
+    return evicted
+
+
+def save_node_checkpoint(node_id, database_path):
+    '''
+    Function to keep the end state of the database of a node for its children
+
+    Parameters:
+    - node_id (int): The id of the benchmarked node
+    - database_path (str): The database directory of the node
+
+    Returns:
+    - str: The checkpoint directory, None if DB_CHECKPOINT is off or the checkpoint failed
+    '''
+    if DB_CHECKPOINT == "off":
+        return None
+    checkpoint_path = db_checkpoint_path(node_id)
+    with checkpoint_lock:
+        if not create_db_checkpoint(database_path, checkpoint_path):
+            log_update(f"[DBC] No checkpoint of node {node_id}")
+            return None
+        log_update(f"[DBC] Checkpoint of node {node_id} in {checkpoint_path}")
+        print(f"[DBC] Checkpoint of node {node_id} taken")
+        evict_db_checkpoints(keep=(checkpoint_path,))
+    return checkpoint_path
+
+
+def inherited_from(node, test_name):
+    '''
+    Function to find the node whose database a node is meant to continue from
+
+    Parameters:
+    - node (Node): The node to benchmark
+    - test_name (str): The workload
+
+    Returns:
+    - int: The id of the parent of the node, None if the node starts from a fresh or preloaded database
+    '''
+    if DB_CHECKPOINT != "inherit" or node is None or node.parent is None or test_name in FRESH_DB_TESTS:
+        return None
+    return node.parent.id
+
+
+def inherited_checkpoint(node, test_name):
+    '''
+    Function to find the checkpoint a node continues from
+
+    Parameters:
+    - node (Node): The node to benchmark
+    - test_name (str): The workload
+
+    Returns:
+    - str: The checkpoint of the parent of the node, None if the node starts from a fresh or preloaded database
+    '''
+    parent_id = inherited_from(node, test_name)
+    if parent_id is None or not has_db_checkpoint(parent_id):
+        return None
+    return db_checkpoint_path(parent_id)
+
+
+def restore_node_checkpoint(checkpoint_path, database_path):
+    '''
+    Function to start a database from a checkpoint, the checkpoint itself is left untouched
+
+    Parameters:
+    - checkpoint_path (str): The checkpoint directory
+    - database_path (str): The database directory of the benchmark
+
+    Returns:
+    - bool: True if the database was restored
+    '''
+    with checkpoint_lock:
+        if not os.path.exists(os.path.join(checkpoint_path, "CURRENT")):
+            # Evicted since the node was scheduled
+            return False
+        restore_snapshot(checkpoint_path, database_path)
+        # Mark the checkpoint as recently used for the eviction
+        os.utime(checkpoint_path)
+    return True
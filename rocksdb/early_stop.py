@@ -0,0 +1,109 @@
+import math
+
+from scipy import stats
+
+from utils.constants import EARLY_STOP_CONFIDENCE, EARLY_STOP_MIN_SECONDS, DURATION
+from utils.utils import log_update
+
+# Per-second samples are strongly autocorrelated, the test runs on means of consecutive batches instead
+BATCH_SECONDS = 10
+
+
+def batch_means(series, batch_size=BATCH_SECONDS):
+    '''
+    Average consecutive, non-overlapping batches of a series
+
+    Parameters:
+    - series (list): The samples
+    - batch_size (int): The number of samples per batch
+
+    Returns:
+    - list: The mean of every complete batch
+    '''
+    complete = len(series) - len(series) % batch_size
+    return [sum(series[i:i + batch_size]) / batch_size for i in range(0, complete, batch_size)]
+
+
+def stop_benchmark(proc_out, output, reason):
+    '''
+    Kill a running db_bench and record why its output ends without a summary
+
+    Parameters:
+    - proc_out (Popen): The running db_bench process
+    - output (DBBenchOutputParser): The parser consuming its output
+    - reason (str): Why the run is stopped
+
+    Returns:
+    - None
+    '''
+    print(f"[SQU] Stopping the benchmark, {reason}")
+    log_update(f"[SQU] Stopping the benchmark, {reason}")
+    output.stop(reason)
+    proc_out.kill()
+
+
+def mean_and_variance(values):
+    mean = sum(values) / len(values)
+    variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+    return mean, variance
+
+
+class SequentialEarlyStopper:
+    """Sequential test that flags a candidate once its throughput is dominated by the baseline series."""
+
+    def __init__(self, baseline_series, confidence=EARLY_STOP_CONFIDENCE, min_seconds=EARLY_STOP_MIN_SECONDS, duration=DURATION):
+        self.baseline_series = list(baseline_series)
+        self.min_seconds = max(int(min_seconds), 3 * BATCH_SECONDS)
+        self.samples = []
+        self.reason = None
+
+        # The test is repeated after every batch, split the error budget over all the looks (Bonferroni)
+        looks = max(1, math.ceil(int(duration) / BATCH_SECONDS))
+        self.alpha = (1 - confidence) / looks
+
+    def update(self, ops_per_sec):
+        '''
+        Add a per-interval throughput sample of the candidate
+
+        Parameters:
+        - ops_per_sec (float): The throughput of the last interval
+
+        Returns:
+        - bool: True if the candidate is statistically dominated and should be stopped
+        '''
+        self.samples.append(ops_per_sec)
+        count = len(self.samples)
+        if count < self.min_seconds or count % BATCH_SECONDS != 0:
+            return False
+        # Compare with the same elapsed part of the baseline run, warmup against warmup
+        if len(self.baseline_series) < count:
+            return False
+
+        candidate = batch_means(self.samples)
+        baseline = batch_means(self.baseline_series[:count])
+        candidate_mean, candidate_variance = mean_and_variance(candidate)
+        baseline_mean, baseline_variance = mean_and_variance(baseline)
+
+        # One-sided Welch t-test of H0: candidate mean >= baseline mean
+        candidate_error = candidate_variance / len(candidate)
+        baseline_error = baseline_variance / len(baseline)
+        standard_error = math.sqrt(candidate_error + baseline_error)
+        if standard_error == 0:
+            dominated = candidate_mean < baseline_mean
+        else:
+            if candidate_error > 0 and baseline_error > 0:
+                # Welch-Satterthwaite approximation
+                degrees_of_freedom = (candidate_error + baseline_error) ** 2 / (
+                    candidate_error ** 2 / (len(candidate) - 1) + baseline_error ** 2 / (len(baseline) - 1)
+                )
+            else:
+                degrees_of_freedom = len(candidate) + len(baseline) - 2
+            t_statistic = (baseline_mean - candidate_mean) / standard_error
+            dominated = t_statistic > stats.t.ppf(1 - self.alpha, degrees_of_freedom)
+
+        if dominated:
+            self.reason = (
+                f"dominated after {count}s: {candidate_mean:.0f} ops/sec against "
+                f"{baseline_mean:.0f} ops/sec for the baseline over the same interval"
+            )
+        return dominated
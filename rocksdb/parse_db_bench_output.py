@@ -1,172 +1,348 @@
+import io
 import re
-import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
 from utils.utils import log_update
+from utils.constants import STEADY_STATE
+from rocksdb.steady_state import steady_state_summary
 
-def parse_db_bench_output(output):
-    err_check = re.search("Unable to load options file", output) or re.search("open error", output)
-    if err_check is not None:
-        error = output[err_check.span()[0]:]
-        return {
-            "error": error,
-            "ops_per_sec": None,
-        }
+# Interval report printed every --stats_interval_seconds, e.g.
+# 2024/01/01-00:00:01 ... thread 0: (1000,2000) ops and (1000.0,1000.0) ops/second in (1.000001,2.000002) seconds
+INTERVAL_PATTERN = re.compile(r"thread (\d+): \((\d+),(\d+)\) ops and \(([^,]+),([^)]+)\) ops/second in \(([^,]+),([^)]+)\) seconds")
+# Summary printed when a benchmark finishes, e.g.
+# fillrandom   :       4.123 micros/op 242532 ops/sec 60.001 seconds 14551921 operations;   26.8 MB/s
+SUMMARY_PATTERN = re.compile(r"^(\w+)\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;(.*)$")
+DATA_SPEED_PATTERN = re.compile(r"(\d+\.\d+)\s+(\w+/s)")
+HISTOGRAM_HEADER_PATTERN = re.compile(r"^Microseconds per (\w+):")
+HISTOGRAM_COUNT_PATTERN = re.compile(r"^Count:\s+(\d+)\s+Average:\s+(\S+)\s+StdDev:\s+(\S+)")
+HISTOGRAM_MIN_PATTERN = re.compile(r"^Min:\s+(\S+)\s+Median:\s+(\S+)\s+Max:\s+(\S+)")
+PERCENTILE_PATTERN = re.compile(r"(P[\d.]+):\s+(\S+)")
+ENTRIES_PATTERN = re.compile(r"^Entries:\s+(\d+)")
+ERROR_MARKERS = ("Unable to load options file", "open error")
 
-    # Regular expression to find and extract the number of Entries
-    # Searches for the pattern "Entries:" followed by one or more digits
-    entries_match = re.search(r"Entries:\s+(\d+)", output)
-    # If a match is found, convert the captured digits to an integer
-    entries = int(entries_match.group(1)) if entries_match else None
-
-    # Regular expression to parse the output line
-    # Captures various performance metrics and their units
-    test_name = None
-
-    if "readrandomwriterandom" in output:
-        op_line = output.split("readrandomwriterandom")[1].split("\n")[0]
-        test_name = "readrandomwriterandom"
-        test_pattern = r"readrandomwriterandom\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-    elif "jsonconfigured" in output:
-        op_line = output.split("jsonconfigured")[1].split("\n")[0]
-        test_name = "jsonconfigured"
-        test_pattern = r"jsonconfigured\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-    elif "fillrandom" in output:
-        op_line = output.split("fillrandom")[1].split("\n")[0]
-        test_name = "fillrandom"
-        test_pattern = r"fillrandom\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;\s+(\d+\.\d+)\s+(\w+/s)\nMicroseconds per write:\nCount:\s+(\d+)\s+Average:\s+(\d+\.\d+)\s+StdDev:\s+(\d+\.\d+)\nMin:\s+(\d+)\s+Median:\s+(\d+\.\d+)\s+Max:\s+(\d+)\nPercentiles:\s+P50:\s+(\d+\.\d+)\s+P75:\s+(\d+\.\d+)\s+P99:\s+(\d+\.\d+)\s+P99\.9:\s+(\d+\.\d+)\s+P99\.99:\s+(\d+\.\d+)\n-{50}"
-    elif "readrandom" in output:
-        op_line = output.split("readrandom")[1].split("\n")[0]
-        test_name = "readrandom"
-        test_pattern = r"readrandom\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;\s+(\d+\.\d+)\s+(\w+/s)\s+\((\d+)\s+of\s+(\d+)\s+found\)\n\nMicroseconds per read:\nCount:\s+(\d+)\s+Average:\s+(\d+\.\d+)\s+StdDev:\s+(\d+\.\d+)\nMin:\s+(\d+)\s+Median:\s+(\d+\.\d+)\s+Max:\s+(\d+)\nPercentiles:\s+P50:\s+(\d+\.\d+)\s+P75:\s+(\d+\.\d+)\s+P99:\s+(\d+\.\d+)\s+P99\.9:\s+(\d+\.\d+)\s+P99\.99:\s+(\d+\.\d+)\n-{50}"
-    elif "mixgraph" in output:
-        op_line = output.split("mixgraph     :")[1].split("\n")[0]
-        test_name = "mixgraph"
-        test_pattern = r"mixgraph\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-        # test_pattern = r"mixgraph\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;\s+\(\s+Gets:+(\d+)\s+Puts:+(\d+)\s+Seek:(\d+),\s+reads\s+(\d+)\s+in\s+(\d+)\s+found,\s+avg\s+size:\s+\d+\s+value,\s+-nan\s+scan\)\n\nMicroseconds per read:\nCount:\s+(\d+)\s+Average:\s+(\d+\.\d+)\s+StdDev:\s+(\d+\.\d+)\nMin:\s+(\d+)\s+Median:\s+(\d+\.\d+)\s+Max:\s+(\d+)\nPercentiles:\s+P50:\s+(\d+\.\d+)\s+P75:\s+(\d+\.\d+)\s+P99:\s+(\d+\.\d+)\s+P99\.9:\s+(\d+\.\d+)\s+P99\.99:\s+(\d+\.\d+)\n-{50}"
-    elif "readwhilewriting" in output:
-        op_line = output.split("readwhilewriting")[1].split("\n")[0]
-        test_name = "readwhilewriting"
-        test_pattern = r"readwhilewriting\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-    else:
-        log_update(f"[PDB] Test name not found in output: {output}")
-        op_line = "unknown test"
-        test_name = "unknown"
-        test_pattern = r"(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;(\s+\(.*found:\d+\))?\nMicroseconds per (read|write):\nCount: (\d+) Average: (\d+\.\d+)  StdDev: (\d+\.\d+)\nMin: (\d+)  Median: (\d+\.\d+)  Max: (\d+)\nPercentiles: P50: (\d+\.\d+) P75: (\d+\.\d+) P99: (\d+\.\d+) P99.9: (\d+\.\d+) P99.99: (\d+\.\d+)"
-
-    pattern_matches = re.findall(test_pattern, output)
-    log_update(f"[PDB] Test name: {test_name}")
-    log_update(f"[PDB] Matches: {pattern_matches}")
-    log_update(f"[PDB] Output line: {op_line}")
-    # Set all values to None if the pattern is not found
-    micros_per_op = ops_per_sec = total_seconds = total_operations = data_speed = data_speed_unit = None
-
-    # Extract the performance metrics if the pattern is found
-    for pattern_match in pattern_matches:
-        # Convert each captured group to the appropriate type (float or int)
-        micros_per_op = float(pattern_match[0])
-        ops_per_sec = int(pattern_match[1])
-        total_seconds = float(pattern_match[2])
-        total_operations = int(pattern_match[3])
-         # Check for specific workloads to handle additional data
-        if "readrandomwriterandom" in output:
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
-            reads_found = None
-        elif "jsonconfigured" in output:
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
-        elif "fillrandom" in output:
-            data_speed = float(pattern_match[4])
-            data_speed_unit = pattern_match[5]
-            writes_data = {
-                "count": int(pattern_match[6]),
-                "average": float(pattern_match[7]),
-                "std_dev": float(pattern_match[8]),
-                "min": int(pattern_match[9]),
-                "median": float(pattern_match[10]),
-                "max": int(pattern_match[11]),
-                "percentiles": {
-                    "P50": float(pattern_match[12]),
-                    "P75": float(pattern_match[13]),
-                    "P99": float(pattern_match[14]),
-                    "P99.9": float(pattern_match[15]),
-                    "P99.99": float(pattern_match[16])
-                }
-            }
-        elif "readrandom" in output:
-            data_speed = float(pattern_match[4])
-            data_speed_unit = pattern_match[5]
-            reads_found = {
-                "count": int(pattern_match[6]),
-                "total": int(pattern_match[7])
-            }
-            reads_data = {
-                "count": int(pattern_match[8]),
-                "average": float(pattern_match[9]),
-                "std_dev": float(pattern_match[10]),
-                "min": int(pattern_match[11]),
-                "median": float(pattern_match[12]),
-                "max": int(pattern_match[13]),
-                "percentiles": {
-                    "P50": float(pattern_match[14]),
-                    "P75": float(pattern_match[15]),
-                    "P99": float(pattern_match[16]),
-                    "P99.9": float(pattern_match[17]),
-                    "P99.99": float(pattern_match[18])
-                }
+# Benchmarks whose data speed is reported in ops/sec instead of the MB/s printed by db_bench
+OPS_SPEED_BENCHMARKS = ("readrandomwriterandom", "jsonconfigured", "mixgraph")
+
+# Bounds on the state kept for a single run
+MAX_HEADER_LINES = 100
+MAX_TAIL_LINES = 200
+MAX_ERROR_LINES = 200
+MAX_GRAPH_POINTS = 7200
+
+
+@dataclass
+class IntervalSample:
+    thread: int
+    interval_ops: int
+    total_ops: int
+    interval_ops_per_sec: float
+    average_ops_per_sec: float
+    interval_seconds: float
+    elapsed_seconds: float
+
+
+@dataclass
+class SummaryLine:
+    benchmark: str
+    micros_per_op: float
+    ops_per_sec: int
+    total_seconds: float
+    total_operations: int
+    data_speed: Optional[float]
+    data_speed_unit: Optional[str]
+
+
+@dataclass
+class HistogramBlock:
+    operation: str
+    count: int = 0
+    average: float = 0.0
+    std_dev: float = 0.0
+    min: float = 0.0
+    median: float = 0.0
+    max: float = 0.0
+    percentiles: dict = field(default_factory=dict)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+class DBBenchOutputParser:
+    """Event driven parser that consumes db_bench output line by line with bounded state."""
+
+    def __init__(self):
+        self.entries = None
+        self.error_lines = None
+        self.summary = None
+        self.histograms = {}
+        self.last_sample = None
+        self.thread_samples = {}
+        self.sample_count = 0
+        self.stopped_reason = None
+        self.graph_times = []
+        self.graph_ops = []
+        self.header_lines = []
+        self.tail_lines = deque(maxlen=MAX_TAIL_LINES)
+        self.report_lines = deque(maxlen=MAX_TAIL_LINES)
+        self.trailer_lines = deque(maxlen=MAX_TAIL_LINES)
+        self._histogram = None
+        self._in_histogram_buckets = False
+        self._report_started = False
+
+    def feed(self, line):
+        '''
+        Consume a single line of db_bench output
+
+        Parameters:
+        - line (str): The line read from db_bench stdout
+
+        Returns:
+        - IntervalSample, SummaryLine, HistogramBlock or None: The event completed by this line
+        '''
+        line = line.rstrip("\n")
+
+        if self.error_lines is not None:
+            if len(self.error_lines) < MAX_ERROR_LINES:
+                self.error_lines.append(line)
+            return None
+        if any(marker in line for marker in ERROR_MARKERS):
+            self.error_lines = [line[min(line.find(marker) for marker in ERROR_MARKERS if marker in line):]]
+            return None
+
+        if "ops/second" in line:
+            match = INTERVAL_PATTERN.search(line)
+            if match is not None:
+                return self._add_sample(match)
+
+        match = SUMMARY_PATTERN.match(line)
+        if match is not None:
+            return self._set_summary(match, line)
+
+        if self._report_started:
+            return self._feed_report_line(line)
+
+        if self.entries is None:
+            match = ENTRIES_PATTERN.match(line)
+            if match is not None:
+                self.entries = int(match.group(1))
+
+        if self.sample_count == 0 and len(self.header_lines) < MAX_HEADER_LINES:
+            self.header_lines.append(line)
+        else:
+            self.tail_lines.append(line)
+        return None
+
+    def feed_text(self, text):
+        '''
+        Consume a complete db_bench output
+
+        Parameters:
+        - text (str): The db_bench output
+
+        Returns:
+        - DBBenchOutputParser: self
+        '''
+        for line in io.StringIO(text):
+            self.feed(line)
+        return self
+
+    def _add_sample(self, match):
+        sample = IntervalSample(
+            thread=int(match.group(1)),
+            interval_ops=int(match.group(2)),
+            total_ops=int(match.group(3)),
+            interval_ops_per_sec=to_float(match.group(4)),
+            average_ops_per_sec=to_float(match.group(5)),
+            interval_seconds=to_float(match.group(6)),
+            elapsed_seconds=to_float(match.group(7)),
+        )
+        self.last_sample = sample
+        self.thread_samples[sample.thread] = sample
+        self.sample_count += 1
+        self.graph_times.append(sample.elapsed_seconds)
+        self.graph_ops.append(sample.interval_ops_per_sec)
+        if len(self.graph_times) > MAX_GRAPH_POINTS:
+            self._compact_graph()
+        return sample
+
+    def stop(self, reason):
+        '''
+        Record that the run was stopped before db_bench printed its summary
+
+        Parameters:
+        - reason (str): Why the run was stopped
+
+        Returns:
+        - None
+        '''
+        self.stopped_reason = reason
+
+    def _summary_from_samples(self):
+        # Cumulative counters of the last interval report of every thread
+        ops_per_sec = int(sum(sample.average_ops_per_sec for sample in self.thread_samples.values()))
+        total_operations = sum(sample.total_ops for sample in self.thread_samples.values())
+        total_seconds = max(sample.elapsed_seconds for sample in self.thread_samples.values())
+        return SummaryLine(
+            benchmark="stopped",
+            micros_per_op=len(self.thread_samples) * 1e6 / ops_per_sec if ops_per_sec > 0 else None,
+            ops_per_sec=ops_per_sec,
+            total_seconds=total_seconds,
+            total_operations=total_operations,
+            data_speed=ops_per_sec,
+            data_speed_unit="ops/sec",
+        )
+
+    def _compact_graph(self):
+        # Halve the resolution of the graph: average consecutive pairs of points
+        self.graph_times = self.graph_times[1::2]
+        self.graph_ops = [(a + b) / 2 for a, b in zip(self.graph_ops[0::2], self.graph_ops[1::2])]
+
+    def _set_summary(self, match, line):
+        benchmark = match.group(1)
+        ops_per_sec = int(match.group(3))
+        data_speed, data_speed_unit = ops_per_sec, "ops/sec"
+        speed_match = DATA_SPEED_PATTERN.search(match.group(6))
+        if benchmark not in OPS_SPEED_BENCHMARKS and speed_match is not None:
+            data_speed, data_speed_unit = float(speed_match.group(1)), speed_match.group(2)
+
+        self.summary = SummaryLine(
+            benchmark=benchmark,
+            micros_per_op=float(match.group(2)),
+            ops_per_sec=ops_per_sec,
+            total_seconds=float(match.group(4)),
+            total_operations=int(match.group(5)),
+            data_speed=data_speed,
+            data_speed_unit=data_speed_unit,
+        )
+        self._report_started = True
+        self.report_lines.append(line)
+        return self.summary
+
+    def _feed_report_line(self, line):
+        match = HISTOGRAM_HEADER_PATTERN.match(line)
+        if match is not None:
+            self._histogram = HistogramBlock(operation=match.group(1))
+            self._in_histogram_buckets = False
+            self.report_lines.append(line)
+            return None
+
+        if self._histogram is not None:
+            match = HISTOGRAM_COUNT_PATTERN.match(line)
+            if match is not None:
+                self._histogram.count = int(match.group(1))
+                self._histogram.average = to_float(match.group(2))
+                self._histogram.std_dev = to_float(match.group(3))
+                self.report_lines.append(line)
+                return None
+            match = HISTOGRAM_MIN_PATTERN.match(line)
+            if match is not None:
+                self._histogram.min = to_float(match.group(1))
+                self._histogram.median = to_float(match.group(2))
+                self._histogram.max = to_float(match.group(3))
+                self.report_lines.append(line)
+                return None
+            if line.startswith("Percentiles:"):
+                self._histogram.percentiles = {name: to_float(value) for name, value in PERCENTILE_PATTERN.findall(line)}
+                self.report_lines.append(line)
+                histogram = self._histogram
+                self.histograms[histogram.operation] = histogram
+                self._histogram = None
+                self._in_histogram_buckets = True
+                return histogram
+
+        # Bucket lines of the histogram are not kept
+        if self._in_histogram_buckets and (line.startswith("[") or line.startswith("-") or line == ""):
+            return None
+        self._in_histogram_buckets = False
+        self.trailer_lines.append(line)
+        return None
+
+    def result(self):
+        '''
+        Build the benchmark results dictionary from the consumed output
+
+        Parameters:
+        - None
+
+        Returns:
+        - dict: The parsed benchmark results
+        '''
+        if self.error_lines is not None:
+            return {
+                "error": "\n".join(self.error_lines),
+                "ops_per_sec": None,
             }
-        elif "readwhilewriting" in output:
-            data_speed = float(pattern_match[4])
-            data_speed_unit = pattern_match[5]
-            # reads_found = {
-            #     "count": int(pattern_match[6]),
-            #     "total": int(pattern_match[7])
-            # }
-            # reads_data = {
-            #     "count": int(pattern_match[8]),
-            #     "average": float(pattern_match[9]),
-            #     "std_dev": float(pattern_match[10]),
-            #     "min": int(pattern_match[11]),
-            #     "median": float(pattern_match[12]),
-            #     "max": int(pattern_match[13]),
-            #     "percentiles": {
-            #         "P50": float(pattern_match[14]),
-            #         "P75": float(pattern_match[15]),
-            #         "P99": float(pattern_match[16]),
-            #         "P99.9": float(pattern_match[17]),
-            #         "P99.99": float(pattern_match[18])
-            #     }
-            # }
-        elif "mixgraph" in output:
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
+
+        summary = self.summary
+        if summary is None and self.stopped_reason is not None and self.thread_samples:
+            summary = self._summary_from_samples()
+        log_update(f"[PDB] Test name: {summary.benchmark if summary is not None else 'unknown'}")
+        if summary is None:
+            log_update(f"[PDB] Summary line not found in output: {self}")
         else:
-            log_update(f"[PDB] Test name not found in output: {output}")
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
-   
-        log_update(f"[PDB] Ops per sec: {ops_per_sec} Total seconds: {total_seconds} Total operations: {total_operations} Data speed: {data_speed} {data_speed_unit}")
-
-    ops_per_sec_points = re.findall("and \((.*),.*\) ops\/second in \(.*,(.*)\)", output)
-
-    # Store all extracted values in a dictionary
-    parsed_data = {
-        "entries": entries,
-        "micros_per_op": micros_per_op,
-        "ops_per_sec": ops_per_sec,
-        "total_seconds": total_seconds,
-        "total_operations": total_operations,
-        "data_speed": data_speed,
-        "data_speed_unit": data_speed_unit,
-        "ops_per_second_graph": [
-            [float(a[1]) for a in ops_per_sec_points],
-            [float(a[0]) for a in ops_per_sec_points],
-        ]
-    }
-
-    # Grab the latency and push into the output logs file
-    latency = re.findall("Percentiles:.*", output)
-    for i in latency:
-        log_update("[PDB] " + i)
-
-    # Return the dictionary with the parsed data
-    return parsed_data
+            log_update(f"[PDB] Ops per sec: {summary.ops_per_sec} Total seconds: {summary.total_seconds} Total operations: {summary.total_operations} Data speed: {summary.data_speed} {summary.data_speed_unit}")
+
+        # Push the latency into the output logs file
+        for histogram in self.histograms.values():
+            log_update(f"[PDB] {histogram.operation} Percentiles: {histogram.percentiles}")
+
+        parsed_data = {
+            "entries": self.entries,
+            "micros_per_op": summary.micros_per_op if summary is not None else None,
+            "ops_per_sec": summary.ops_per_sec if summary is not None else None,
+            "total_seconds": summary.total_seconds if summary is not None else None,
+            "total_operations": summary.total_operations if summary is not None else None,
+            "data_speed": summary.data_speed if summary is not None else None,
+            "data_speed_unit": summary.data_speed_unit if summary is not None else None,
+            "ops_per_second_graph": [
+                list(self.graph_times),
+                list(self.graph_ops),
+            ]
+        }
+        # Tail latency of the slowest operation type, when db_bench ran with --histogram
+        p99 = [histogram.percentiles["P99"] for histogram in self.histograms.values() if "P99" in histogram.percentiles]
+        if p99:
+            parsed_data["p99_micros"] = max(p99)
+        # Steady-state throughput reported separately from the warmup
+        steady_state = steady_state_summary(self.graph_ops, self.graph_times)
+        if steady_state is not None:
+            # The samples are per thread, the throughput of the database is their sum
+            threads = max(1, len(self.thread_samples))
+            steady_state["steady_state_ops_per_sec"] = round(steady_state["steady_state_ops_per_sec"] * threads, 1)
+            parsed_data.update(steady_state)
+            if STEADY_STATE and parsed_data["ops_per_sec"] is not None:
+                # Runs stopped after different warmup shares, and full runs, are all scored without their warmup
+                parsed_data["cumulative_ops_per_sec"] = parsed_data["ops_per_sec"]
+                parsed_data["ops_per_sec"] = int(steady_state["steady_state_ops_per_sec"])
+                if parsed_data["data_speed_unit"] == "ops/sec":
+                    parsed_data["data_speed"] = parsed_data["ops_per_sec"]
+        if self.stopped_reason is not None:
+            parsed_data["stopped_early"] = self.stopped_reason
+        return parsed_data
+
+    def __str__(self):
+        # Condensed output: header, the last lines of the run and the final report, without interval samples
+        lines = self.header_lines + list(self.tail_lines) + list(self.report_lines) + list(self.trailer_lines)
+        if self.error_lines is not None:
+            lines += self.error_lines
+        return "\n".join(lines)
+
+
+def parse_db_bench_output(output):
+    '''
+    Parse the db_bench output into the benchmark results dictionary
+
+    Parameters:
+    - output (str or DBBenchOutputParser): The raw output, or the parser that already consumed it while db_bench ran
+
+    Returns:
+    - dict: The parsed benchmark results
+    '''
+    if not isinstance(output, DBBenchOutputParser):
+        output = DBBenchOutputParser().feed_text(output)
+    return output.result()
@@ -0,0 +1,196 @@
+import configparser
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import typing
+
+from data_model.rocksdb_options import SECTION_MODEL_MAP
+from rocksdb.parse_db_bench_output import ERROR_MARKERS
+from utils.constants import PREFLIGHT, DB_BENCH_PATH, DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME
+from utils.utils import log_update
+
+# Integers as parsed by RocksDB ParseInt64/ParseUint64, with an optional k/m/g/t multiplier
+INTEGER_PATTERN = re.compile(r"^[+-]?\d+[kKmMgGtT]?$")
+BOOLEAN_VALUES = ("true", "false", "1", "0")
+# db_bench arguments that need a loaded database, left out of the probe on an empty directory
+PROBE_SKIPPED_ARGS = ("--use_existing_db", "--use_existing_keys")
+PROBE_TIMEOUT_SECONDS = 60
+
+known_keys = None
+
+
+def read_options(options):
+    config = configparser.ConfigParser(strict=False, interpolation=None)
+    config.optionxform = str  # Option names are case sensitive, e.g. WAL_ttl_seconds
+    config.read_string(options)
+    return config
+
+
+def section_known_keys():
+    '''
+    Function to get the keys every model section accepts
+
+    The keys of the models are completed with the keys of the default options file of the RocksDB version,
+    so options added after the models were written are not reported as unknown.
+
+    Parameters:
+    - None
+
+    Returns:
+    - known_keys (dict): The set of keys of every model section, e.g. "CFOptions"
+    '''
+    global known_keys
+    if known_keys is None:
+        known_keys = {prefix: set(model.model_fields) for prefix, model in SECTION_MODEL_MAP.items()}
+        default_path = os.path.join(DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME)
+        if os.path.exists(default_path):
+            with open(default_path, "r") as f:
+                config = read_options(f.read())
+            for section in config.sections():
+                for prefix in SECTION_MODEL_MAP:
+                    if section.startswith(prefix):
+                        known_keys[prefix].update(config.options(section))
+    return known_keys
+
+
+def value_error(value, annotation):
+    '''
+    Function to check an option value against the type of its model field
+
+    Parameters:
+    - value (str): The value in the options file
+    - annotation (type): The type of the field, int, float, bool, str or List[...]
+
+    Returns:
+    - error (str): Why the value is invalid, None if it is valid
+    '''
+    if typing.get_origin(annotation) in (list, typing.List):
+        # Lists are separated by ':' in the options files, e.g. 1:1:1
+        item_type = typing.get_args(annotation)[0]
+        for item in filter(None, value.split(":")):
+            error = value_error(item, item_type)
+            if error is not None:
+                return error
+        return None
+    if annotation is bool and value.lower() not in BOOLEAN_VALUES:
+        return f"'{value}' is not a boolean (true or false)"
+    if annotation is int and not INTEGER_PATTERN.match(value):
+        return f"'{value}' is not an integer"
+    if annotation is float:
+        try:
+            float(value)
+        except ValueError:
+            return f"'{value}' is not a number"
+    return None
+
+
+def validate_options_schema(options, check_unknown=True):
+    '''
+    Function to check the sections, keys and value types of an options file against the data_model.rocksdb_options models
+
+    Parameters:
+    - options (str): The options file
+    - check_unknown (bool): Report the keys the models and the default options file do not have
+
+    Returns:
+    - errors (list): One message per invalid entry, empty if the file is valid
+    '''
+    try:
+        config = read_options(options)
+    except configparser.Error as error:
+        return [f"The options file cannot be parsed: {error}"]
+
+    keys = section_known_keys()
+    errors = []
+    for section in config.sections():
+        prefix = next((prefix for prefix in SECTION_MODEL_MAP if section.startswith(prefix)), None)
+        if prefix is None:
+            continue
+        model = SECTION_MODEL_MAP[prefix]
+        for key, value in config.items(section):
+            if key not in keys[prefix]:
+                if check_unknown:
+                    errors.append(f"Unknown option {key} in [{section}]")
+                continue
+            field = model.model_fields.get(key)
+            error = value_error(value.strip(), field.annotation) if field is not None else None
+            if error is not None:
+                errors.append(f"Invalid value for {key} in [{section}]: {error}")
+    return errors
+
+
+def probe_options(options, db_bench_args=[]):
+    '''
+    Function to load an options file with a db_bench run that does no work, on an empty temporary database
+
+    Parameters:
+    - options (str): The options file
+    - db_bench_args (list): The db_bench arguments of the candidate
+
+    Returns:
+    - error (str): The error printed by db_bench, None if the options were loaded
+    '''
+    if not os.path.exists(DB_BENCH_PATH):
+        return None
+
+    probe_dir = tempfile.mkdtemp(prefix="preflight_")
+    try:
+        options_path = os.path.join(probe_dir, "OPTIONS.ini")
+        with open(options_path, "w") as f:
+            f.write(options)
+        command = [
+            DB_BENCH_PATH,
+            f"--db={os.path.join(probe_dir, 'db')}",
+            f"--options_file={options_path}",
+            # No benchmark: db_bench only loads the options and opens the database
+            "--benchmarks=",
+        ] + [arg for arg in db_bench_args if not arg.startswith(PROBE_SKIPPED_ARGS)]
+        try:
+            proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  universal_newlines=True, timeout=PROBE_TIMEOUT_SECONDS, check=False)
+        except subprocess.TimeoutExpired:
+            log_update(f"[PFL] The options probe did not finish in {PROBE_TIMEOUT_SECONDS} seconds, skipping it")
+            return None
+    finally:
+        shutil.rmtree(probe_dir, ignore_errors=True)
+
+    output = proc.stdout
+    for marker in ERROR_MARKERS:
+        if marker in output:
+            return output[output.find(marker):].strip()
+    if proc.returncode != 0:
+        return output.strip() or f"db_bench exited with code {proc.returncode}"
+    return None
+
+
+def preflight_options(options, db_bench_args=[]):
+    '''
+    Function to validate a candidate before the database is reset and preloaded
+
+    The schema check takes milliseconds, the probe a db_bench start on an empty database.
+    With the probe, keys unknown to the models are left to db_bench, which still accepts some deprecated options.
+
+    Parameters:
+    - options (str): The options file
+    - db_bench_args (list): The db_bench arguments of the candidate
+
+    Returns:
+    - error (str): The reason the candidate is invalid, None if it passed or PREFLIGHT is off
+    '''
+    if PREFLIGHT == "off" or not isinstance(options, str):
+        return None
+
+    errors = validate_options_schema(options, check_unknown=PREFLIGHT == "schema")
+    if errors:
+        error = "Unable to load options file: " + "; ".join(errors)
+    elif PREFLIGHT == "probe":
+        error = probe_options(options, db_bench_args)
+    else:
+        error = None
+
+    if error is not None:
+        log_update(f"[PFL] Pre-flight check failed: {error}")
+        print(f"[PFL] Pre-flight check failed: {error}")
+    return error
@@ -0,0 +1,266 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+
+from utils.utils import log_update
+from utils.constants import SNAPSHOT_CACHE, SNAPSHOT_CACHE_DIR, SNAPSHOT_LOAD_OPTIONS, SNAPSHOT_CACHE_BUDGET_GB, DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME
+from options_files.ops_options_file import canonical_configuration
+
+# SST and blob files are never modified after they are written, so they can be shared between databases
+IMMUTABLE_FILE_SUFFIXES = (".sst", ".blob")
+# Arguments that do not change the content of the loaded database
+IGNORED_LOAD_ARGS = ("--db=", "--options_file=", "--trace_file=", "--dynamic_options_file=", "--stats_interval_seconds=", "--histogram")
+
+
+def snapshot_key(load_command, options_file_path):
+    '''
+    Compute the content address of a preloaded database
+    Every option can change the loaded database: its files, filters and the compaction debt left when the
+    load ends. The key is the load arguments and the canonical options of the load phase, candidates only
+    share a snapshot when they are loaded with the same options, e.g. all of them with SNAPSHOT_LOAD_OPTIONS=initial
+
+    Parameters:
+    - load_command (list): The db_bench command used to load the database
+    - options_file_path (str): The options file used by the load phase
+
+    Returns:
+    - str: The key of the snapshot
+    '''
+    load_args = sorted(arg for arg in load_command[1:] if arg and not arg.startswith(IGNORED_LOAD_ARGS))
+    with open(options_file_path, "r") as f:
+        load_options = f.read()
+
+    payload = json.dumps({"args": load_args, "options": canonical_configuration(load_options, [])}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+def directory_size(path):
+    # Apparent size: SST files hardlinked with the restored databases are counted as well
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def lock_snapshot(snapshot_path):
+    '''
+    Take the lock of a snapshot, shared by the parallel slots that build, restore or evict it
+
+    The eviction deletes the lock file with the snapshot, a lock taken on a deleted lock file is taken again.
+
+    Parameters:
+    - snapshot_path (str): The snapshot directory
+
+    Returns:
+    - file: The locked lock file, closing it releases the lock
+    '''
+    lock_path = snapshot_path + ".lock"
+    while True:
+        lock_file = open(lock_path, "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+def evict_snapshots(keep=()):
+    '''
+    Delete the least recently used snapshots until they fit in SNAPSHOT_CACHE_BUDGET_GB
+
+    A snapshot that another slot holds the lock of, to build or restore it, is skipped.
+
+    Parameters:
+    - keep (tuple): The snapshot directories that must not be deleted
+
+    Returns:
+    - list: The deleted snapshot directories
+    '''
+    if not os.path.isdir(SNAPSHOT_CACHE_DIR):
+        return []
+    snapshots = []
+    for entry in os.scandir(SNAPSHOT_CACHE_DIR):
+        if entry.is_dir() and not entry.name.endswith(".building"):
+            snapshots.append((entry.stat().st_mtime, entry.path, directory_size(entry.path)))
+
+    budget = SNAPSHOT_CACHE_BUDGET_GB * 1024 ** 3
+    total = sum(size for _, _, size in snapshots)
+    evicted = []
+    # Every cache hit touches its snapshot, the oldest were used the longest time ago
+    for _, path, size in sorted(snapshots):
+        if total <= budget:
+            break
+        if path in keep:
+            continue
+        with open(path + ".lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            os.remove(path + ".lock")
+        total -= size
+        evicted.append(path)
+        log_update(f"[SNC] Evicted snapshot {path} ({size / 1024 ** 3:.2f}GB), snapshots use {total / 1024 ** 3:.2f}GB")
+    return evicted
+
+
+def link_or_copy_file(source, destination):
+    '''
+    Share an immutable file with the destination: hardlink, then reflink, then plain copy
+
+    Parameters:
+    - source (str): The file to share
+    - destination (str): The path of the new file
+
+    Returns:
+    - None
+    '''
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+
+    proc = subprocess.run(["cp", "--reflink=auto", source, destination], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+    if proc.returncode != 0:
+        shutil.copy2(source, destination)
+
+
+def restore_snapshot(snapshot_path, database_path, files_only=False):
+    '''
+    Materialize a database from a snapshot
+    Immutable files (SST, blob) are linked, mutable files (MANIFEST, CURRENT, OPTIONS, LOG, WAL) are copied
+
+    Parameters:
+    - snapshot_path (str): The snapshot directory
+    - database_path (str): The database directory to create
+    - files_only (bool): Skip the subdirectories, e.g. the databases of the nodes inside the root database
+
+    Returns:
+    - None
+    '''
+    shutil.rmtree(database_path, ignore_errors=True)
+    os.makedirs(database_path, exist_ok=True)
+
+    linked = copied = 0
+    for entry in os.scandir(snapshot_path):
+        destination = os.path.join(database_path, entry.name)
+        if entry.is_dir():
+            if files_only:
+                continue
+            shutil.copytree(entry.path, destination)
+            copied += 1
+        elif entry.name == "LOCK":
+            continue
+        elif entry.name.endswith(IMMUTABLE_FILE_SUFFIXES):
+            link_or_copy_file(entry.path, destination)
+            linked += 1
+        else:
+            shutil.copy2(entry.path, destination)
+            copied += 1
+
+    log_update(f"[SNC] Restored {snapshot_path} into {database_path} ({linked} shared, {copied} copied)")
+    print(f"[SNC] Restored snapshot into {database_path} ({linked} shared, {copied} copied)")
+
+
+def build_snapshot(load_command, snapshot_path):
+    '''
+    Run the load command into a fresh snapshot directory
+
+    Parameters:
+    - load_command (list): The db_bench command used to load the database
+    - snapshot_path (str): The snapshot directory to create
+
+    Returns:
+    - bool: True if the snapshot was built successfully
+    '''
+    building_path = snapshot_path + ".building"
+    shutil.rmtree(building_path, ignore_errors=True)
+
+    command = [f"--db={building_path}" if arg.startswith("--db=") else arg for arg in load_command]
+    log_update(f"[SNC] Building snapshot with command: {command}")
+    print("[SNC] Building snapshot of the preloaded database")
+    proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+
+    if proc.returncode != 0 or not os.path.exists(os.path.join(building_path, "CURRENT")):
+        log_update(f"[SNC] Snapshot build failed: {proc.stdout.decode(errors='replace')[-2000:]}")
+        print("[SNC] Snapshot build failed")
+        shutil.rmtree(building_path, ignore_errors=True)
+        return False
+
+    os.rename(building_path, snapshot_path)
+    return True
+
+
+def preload_database(load_command, database_path):
+    '''
+    Load the database for a benchmark, reusing a cached snapshot when the load parameters match
+
+    Parameters:
+    - load_command (list): The db_bench command used to load the database
+    - database_path (str): The database directory of the benchmark
+
+    Returns:
+    - None
+    '''
+    if SNAPSHOT_LOAD_OPTIONS == "initial":
+        initial_options_file = os.path.join(DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME)
+        load_command = [f"--options_file={initial_options_file}" if arg.startswith("--options_file=") else arg for arg in load_command]
+
+    if not SNAPSHOT_CACHE:
+        subprocess.run(load_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+        return
+
+    options_file_path = next(arg.split("=", 1)[1] for arg in load_command if arg.startswith("--options_file="))
+    key = snapshot_key(load_command, options_file_path)
+    snapshot_path = os.path.join(SNAPSHOT_CACHE_DIR, key)
+    os.makedirs(SNAPSHOT_CACHE_DIR, exist_ok=True)
+
+    # Parallel slots may ask for the same snapshot, only one of them builds it
+    # The lock is held while restoring, so the snapshot is not evicted under the restore
+    with lock_snapshot(snapshot_path):
+        if os.path.isdir(snapshot_path):
+            log_update(f"[SNC] Snapshot cache hit: {key}")
+            print(f"[SNC] Snapshot cache hit: {key}")
+        else:
+            log_update(f"[SNC] Snapshot cache miss: {key}")
+            print(f"[SNC] Snapshot cache miss: {key}")
+            if not build_snapshot(load_command, snapshot_path):
+                # Fall back to loading the database in place
+                subprocess.run(load_command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+                return
+
+        # Mark the snapshot as recently used for the eviction
+        os.utime(snapshot_path)
+        restore_snapshot(snapshot_path, database_path)
+
+    evict_snapshots(keep=(snapshot_path,))
+
+
+def restore_preloaded_database(preloaded_path, database_path):
+    '''
+    Copy a user provided preloaded database (PRE_LOAD_DB_PATH) to the database path
+
+    Parameters:
+    - preloaded_path (str): The preloaded database directory
+    - database_path (str): The database directory of the benchmark
+
+    Returns:
+    - None
+    '''
+    if SNAPSHOT_CACHE:
+        restore_snapshot(preloaded_path, database_path)
+        return
+
+    subprocess.run(["rm", "-rf", database_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+    subprocess.run(["cp", "-r", preloaded_path, database_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
@@ -0,0 +1,126 @@
+import math
+
+from scipy import stats
+
+from utils.constants import STEADY_STATE_PRECISION, STEADY_STATE_MIN_SECONDS
+
+# MSER-5 works on means of 5 consecutive samples
+MSER_BATCH = 5
+# Number of batches used for the confidence interval of the steady-state mean
+CI_BATCHES = 10
+CONFIDENCE = 0.95
+
+
+def mser5_truncation(series):
+    '''
+    Find the warmup length of a series with the MSER-5 rule
+
+    The truncation point d minimizes the squared standard error of the mean of the remaining batches,
+    sum((Y_i - mean_d)^2) / (k - d)^2, over d in the first half of the batches.
+
+    Parameters:
+    - series (list): The per-interval samples
+
+    Returns:
+    - int: The number of leading samples to discard, None if the series is too short
+    '''
+    k = len(series) // MSER_BATCH
+    if k < 4:
+        return None
+    batches = [sum(series[i * MSER_BATCH:(i + 1) * MSER_BATCH]) / MSER_BATCH for i in range(k)]
+
+    # Suffix sums give the statistic of every truncation point in one pass
+    suffix_sum = suffix_squares = 0.0
+    best_d, best_value = None, math.inf
+    for d in range(k - 1, -1, -1):
+        suffix_sum += batches[d]
+        suffix_squares += batches[d] ** 2
+        remaining = k - d
+        if d > k // 2:
+            continue
+        sum_of_squares = suffix_squares - suffix_sum ** 2 / remaining
+        value = sum_of_squares / remaining ** 2
+        if value <= best_value:
+            best_d, best_value = d, value
+    return best_d * MSER_BATCH
+
+
+def steady_state_summary(series, times=None):
+    '''
+    Summarize the steady-state part of a throughput series
+
+    Parameters:
+    - series (list): The per-interval ops/sec samples
+    - times (list): The elapsed seconds of every sample, the sample index is used when missing
+
+    Returns:
+    - dict: warmup_seconds, steady_state_ops_per_sec and the relative half width of its confidence interval,
+            None if the series is too short
+    '''
+    truncation = mser5_truncation(series)
+    if truncation is None:
+        return None
+    steady = series[truncation:]
+    batch_size = max(1, len(steady) // CI_BATCHES)
+    batches = [sum(steady[i:i + batch_size]) / batch_size for i in range(0, len(steady) - batch_size + 1, batch_size)]
+    if len(batches) < 2:
+        return None
+
+    mean = sum(batches) / len(batches)
+    variance = sum((batch - mean) ** 2 for batch in batches) / (len(batches) - 1)
+    half_width = stats.t.ppf(1 - (1 - CONFIDENCE) / 2, len(batches) - 1) * math.sqrt(variance / len(batches))
+
+    if truncation == 0:
+        warmup_seconds = 0.0
+    elif times is not None:
+        warmup_seconds = times[truncation - 1]
+    else:
+        warmup_seconds = float(truncation)
+    return {
+        "warmup_seconds": warmup_seconds,
+        "steady_state_ops_per_sec": round(mean, 1),
+        "steady_state_relative_ci": round(half_width / mean, 4) if mean > 0 else None,
+    }
+
+
+class SteadyStateDetector:
+    """Decide when the throughput of a run has settled precisely enough to stop it."""
+
+    def __init__(self, precision=STEADY_STATE_PRECISION, min_seconds=STEADY_STATE_MIN_SECONDS, check_every=10):
+        self.precision = precision
+        self.min_seconds = min_seconds
+        self.check_every = check_every
+        self.samples = []
+        self.reason = None
+
+    def update(self, ops_per_sec):
+        '''
+        Add a per-interval throughput sample
+
+        Parameters:
+        - ops_per_sec (float): The throughput of the last interval
+
+        Returns:
+        - bool: True once the steady state is estimated within the requested precision
+        '''
+        self.samples.append(ops_per_sec)
+        count = len(self.samples)
+        if count < self.min_seconds or count % self.check_every != 0:
+            return False
+
+        # A truncation point at the end of the search range means the warmup is still going on
+        truncation = mser5_truncation(self.samples)
+        if truncation is None or truncation >= (count // MSER_BATCH // 2) * MSER_BATCH:
+            return False
+
+        summary = steady_state_summary(self.samples)
+        if summary is None or summary["steady_state_relative_ci"] is None:
+            return False
+        if summary["steady_state_relative_ci"] > self.precision:
+            return False
+
+        self.reason = (
+            f"steady state reached after {count}s: {summary['steady_state_ops_per_sec']:.0f} ops/sec "
+            f"+/- {summary['steady_state_relative_ci']:.1%} after {summary['warmup_seconds']:.0f}s of warmup"
+        )
+        return True
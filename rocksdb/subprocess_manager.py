@@ -4,10 +4,15 @@ import time
 
 from gpt.content_generator import error_correction_options_file_generation
 from utils.utils import log_update, path_of_db
-from utils.constants import ERROR_CORRECTION_COUNT, FINETUNE_ITERATION, TEST_NAME, DB_BENCH_PATH, OPTIONS_FILE_DIR, NUM_ENTRIES, DURATION, SIDE_CHECKER, FIO_RESULT_PATH, DYNAMIC_OPTION_TUNING
+from utils.constants import ERROR_CORRECTION_COUNT, FINETUNE_ITERATION, TEST_NAME, DB_BENCH_PATH, OPTIONS_FILE_DIR, NUM_ENTRIES, DURATION, SIDE_CHECKER, FIO_RESULT_PATH, DYNAMIC_OPTION_TUNING, EARLY_STOP, STEADY_STATE
 from utils.constants import SINE_WRITE_RATE_INTERVAL_MILLISECONDS, SINE_A, SINE_B, SINE_C, SINE_D, OUTPUT_PATH, PRE_LOAD_CMD, NUM_THREADS, PRE_LOAD_DB_PATH
-from rocksdb.parse_db_bench_output import parse_db_bench_output
+from rocksdb.parse_db_bench_output import parse_db_bench_output, DBBenchOutputParser, IntervalSample
+from rocksdb.early_stop import SequentialEarlyStopper, stop_benchmark
+from rocksdb.steady_state import SteadyStateDetector
+from rocksdb.db_bench_reader import DBBenchReader, RestartRequest
+from rocksdb.snapshot_cache import preload_database, restore_preloaded_database
 from rocksdb.fine_tune import fine_tuning
+from rocksdb.preflight import preflight_options
 from utils.utils import store_db_bench_output
 from utils.graph import plot_2axis
 from utils.mmap_utils import add_mmap_file_to_option, create_mmap_file, write_to_mmap_file
@@ -90,10 +95,7 @@ def generate_db_bench_command(db_bench_path, database_path, options, run_count,
         if PRE_LOAD_DB_PATH != "":
             log_update("[SPM] Running Pre-load command")
             print("[SPM] Running Pre-load command")
-            tmp_runner_rm = ["rm", "-rf", database_path]
-            tmp_proc_rm = subprocess.run(tmp_runner_rm, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
-            tmp_runner = ["cp", "-r", PRE_LOAD_DB_PATH, database_path]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+            restore_preloaded_database(PRE_LOAD_DB_PATH, database_path)
 
     if test_name == "fillrandom":
         db_bench_command.append("--benchmarks=fillrandom")
@@ -108,7 +110,7 @@ def generate_db_bench_command(db_bench_path, database_path, options, run_count,
             log_update("[SPM] Running fillrandom to load the database")
             print("[SPM] Running fillrandom to load the database")
             tmp_runner = db_bench_command[:-3] + ["--num=5000000", "--benchmarks=fillrandom", "--max_background_jobs=8"]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+            preload_database(tmp_runner, database_path)
         new_db_bench = db_bench_command + ["--benchmarks=readrandom", "--use_existing_db", "--reads=5000000"]
         db_bench_command = new_db_bench
     elif test_name == "mixgraph":
@@ -116,7 +118,7 @@ def generate_db_bench_command(db_bench_path, database_path, options, run_count,
             log_update("[SPM] Running fillrandom to load the database")
             print("[SPM] Running fillrandom to load the database")
             tmp_runner = db_bench_command[:-3] + ["--num=5000000", "--benchmarks=fillrandom", "--key_size=48", "--value_size=43"]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+            preload_database(tmp_runner, database_path)
         new_db_bench = db_bench_command[:-1] + ["--benchmarks=mixgraph", "--use_existing_db", f"--duration={DURATION}", 
                                                 "--mix_get_ratio=0.83", "--mix_put_ratio=0.14", "--mix_seek_ratio=0.03", "--key_size=48",
                                                 f"--sine_write_rate_interval_milliseconds={SINE_WRITE_RATE_INTERVAL_MILLISECONDS}", "--sine_mix_rate", 
@@ -186,16 +188,13 @@ def generate_db_bench_command_node(db_bench_path, database_path, options, run_co
         if PRE_LOAD_DB_PATH != "":
             log_update("[SPM] Running Pre-load command")
             print("[SPM] Running Pre-load command")
-            tmp_runner_rm = ["rm", "-rf", database_path]
-            tmp_proc_rm = subprocess.run(tmp_runner_rm, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
-            tmp_runner = ["cp", "-r", PRE_LOAD_DB_PATH, database_path]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+            restore_preloaded_database(PRE_LOAD_DB_PATH, database_path)
 
     if test_name == "fillrandom":
         db_bench_command.append("--benchmarks=fillrandom")
     elif test_name == "ycsbworkloadzipfian":
         tmp_runner = db_bench_command[:-3] + ["--num=5000000", "--benchmarks=fillrandom", "--max_background_jobs=8", "--value_size=1000"]
-        tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+        preload_database(tmp_runner, database_path)
         db_bench_command.append("--benchmarks=ycsbworkloadzipfian")
         db_bench_command.append("--value_size=1000")
         db_bench_command.append("--use_existing_db")
@@ -208,7 +207,7 @@ def generate_db_bench_command_node(db_bench_path, database_path, options, run_co
             log_update("[SPM] Running fillrandom to load the database")
             print("[SPM] Running fillrandom to load the database")
             tmp_runner = db_bench_command[:-3] + ["--num=5000000", "--benchmarks=fillrandom", "--max_background_jobs=8"]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+            preload_database(tmp_runner, database_path)
         new_db_bench = db_bench_command + ["--benchmarks=readrandom", "--use_existing_db", "--reads=5000000"]
         db_bench_command = new_db_bench
     elif test_name == "mixgraph":
@@ -216,7 +215,7 @@ def generate_db_bench_command_node(db_bench_path, database_path, options, run_co
             log_update("[SPM] Running fillrandom to load the database")
             print("[SPM] Running fillrandom to load the database")
             tmp_runner = db_bench_command[:-3] + ["--num=5000000", "--benchmarks=fillrandom", "--key_size=48", "--value_size=43"]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+            preload_database(tmp_runner, database_path)
         new_db_bench = db_bench_command[:-1] + ["--benchmarks=mixgraph", "--use_existing_db", f"--duration={DURATION}", 
                                                 "--mix_get_ratio=0.83", "--mix_put_ratio=0.14", "--mix_seek_ratio=0.03", "--key_size=48",
                                                 f"--sine_write_rate_interval_milliseconds={SINE_WRITE_RATE_INTERVAL_MILLISECONDS}", "--sine_mix_rate", 
@@ -253,146 +252,196 @@ def generate_db_bench_command_node(db_bench_path, database_path, options, run_co
     return db_bench_command
 
 
-def db_bench(db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args=[], bm_iter=0):
+def restart_with_midway_options(proc_out, cgroup_monitor, current_avg_throughput, db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter):
     '''
-    Store the options in a file
-    Do the benchmark
+    Kill a benchmark whose throughput dropped, generate midway options and rerun the benchmark with them
 
     Parameters:
-    - db_bench_path (str): The path to the db_bench executable
-    - database_path (str): The path to the database
-    - option_file (dict): The options file to be used
-    - run_count (str): The current iteration of the benchmark
+    - proc_out (Popen): The running db_bench process
+    - cgroup_monitor (CGroupMonitor): The monitor of the running benchmark
+    - current_avg_throughput (float): The throughput measured so far
+    - the remaining parameters are the ones of db_bench()
 
     Returns:
-    - None
+    - the return values of db_bench() for the new options
     '''
-    global proc_out
-    with open(f"{OPTIONS_FILE_DIR}", "w") as f:
-        f.write(options)
+    op = cgroup_monitor.stop_monitoring()
+    avg_cpu_used = op["average_cpu_usage_percent"]
+    avg_mem_used = op["average_memory_usage_percent"]
 
-    # Perform pre-tasks to reset the environment
-    pre_tasks(database_path, run_count)
-    command = generate_db_bench_command(db_bench_path, database_path, options, run_count, test_name, db_bench_args)
+    proc_out.kill()
 
-    # Create dynamic option file
-    if DYNAMIC_OPTION_TUNING:
-        create_mmap_file()
+    db_path = path_of_db()
+    fio_result = get_fio_result(FIO_RESULT_PATH)
+    device_info = system_info(db_path, fio_result)
+    trace_result = analyze_tracefile(db_path + "/tracefile")
 
-    log_update(f"[SPM] Executing db_bench with command: {command}")
-    print("[SPM] Executing db_bench")
+    new_options, db_bench_args, _, _ = midway_options_file_generation(options, db_bench_args, avg_cpu_used, avg_mem_used, current_avg_throughput, device_info, trace_result, options_files)
+    output, avg_cpu_used, avg_mem_used, options = db_bench(db_bench_path, database_path, new_options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter+1)
 
+    log_update("[SPM] Finished running db_bench")
+    return output, avg_cpu_used, avg_mem_used, options
 
-    if SIDE_CHECKER and previous_throughput != None:
-        cgm = CGroupManager("llm_cgroup")
-        cgroup_monitor = CGroupMonitor("llm_cgroup")
-        
-        if DYNAMIC_OPTION_TUNING:
-            saved_optionfile = options_files[-1][0]
-            cur_options_file = []
+def side_checked_db_bench(command, db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter):
+    '''
+    Run db_bench with the side checker, restarting it with midway options or tuning its options while it runs
 
-        start_time = time.time()
-        cgroup_monitor.start_monitoring()
+    A reader thread drains the output of db_bench, so the LLM calls of the side checker and of the
+    dynamic option tuning never leave the pipe full and db_bench never blocks on its writes.
+    This function is the decision worker: it consumes the interval samples the reader queues
+    and pushes the tuned options to db_bench through the mmap channel.
+
+    Parameters:
+    - command (list): The db_bench command
+    - the remaining parameters are the ones of db_bench()
+
+    Returns:
+    - the return values of db_bench()
+    '''
+    cgm = CGroupManager("llm_cgroup")
+    cgroup_monitor = CGroupMonitor("llm_cgroup")
 
-        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True) as proc_out:
-            cgm.add_process(proc_out.pid)
+    if DYNAMIC_OPTION_TUNING:
+        saved_optionfile = options_files[-1][0]
+        cur_options_file = []
 
-            output = ""
-            first_check_interval = 100
-            first_check_flag = False
+    start_time = time.time()
+    cgroup_monitor.start_monitoring()
 
-            # db.h: L1412
-            # dynamic options update is a heavy process that is (weirdly) foreground. 
-            # So, we need to make this an infrequent call.
-            check_interval = 90
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True) as proc_out:
+        cgm.add_process(proc_out.pid)
 
-            for line in proc_out.stdout:
-                output += line
-                elapsed_time = time.time() - start_time
+        output = DBBenchOutputParser()
+        first_check_interval = 100
+        first_check_flag = False
 
-                # Read based workloads need additional time to build the cache
-                # This will effectively provide a small window for the throughput to stabilize
-                if first_check_flag == False:
-                    if (elapsed_time <= first_check_interval):
-                        continue
-                    else:
-                        first_check_flag = True
+        # db.h: L1412
+        # dynamic options update is a heavy process that is (weirdly) foreground. 
+        # So, we need to make this an infrequent call.
+        check_interval = 90
 
-                if elapsed_time <= check_interval:
+        # Sequential test against the interval throughput of the previous options file
+        baseline_series = options_files[-1][1].get("ops_per_second_graph", [[], []])[1] if options_files else []
+        early_stopper = SequentialEarlyStopper(baseline_series) if EARLY_STOP and baseline_series and bm_iter < 3 else None
+        steady_state = SteadyStateDetector() if STEADY_STATE else None
+
+        reader = DBBenchReader(proc_out, output, [steady_state], early_stopper)
+        reader.start()
+
+        for event in reader.samples(timeout=check_interval):
+            elapsed_time = time.time() - start_time
+
+            if isinstance(event, RestartRequest):
+                current_avg_throughput = event.sample.average_ops_per_sec*NUM_THREADS
+                print("[SQU] Throughput is statistically lower than the previous run, resetting the benchmark")
+                log_update(f"[SQU] Candidate {event.reason}, resetting the benchmark")
+                return restart_with_midway_options(proc_out, cgroup_monitor, current_avg_throughput, db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter)
+
+            # Read based workloads need additional time to build the cache
+            # This will effectively provide a small window for the throughput to stabilize
+            if first_check_flag == False:
+                if (elapsed_time <= first_check_interval):
                     continue
+                else:
+                    first_check_flag = True
 
-                if "ops/second" in line:
-                    current_avg_throughput = (float(line.split("(")[2].split(",")[1].split(")")[0]))*NUM_THREADS
+            if elapsed_time <= check_interval:
+                continue
 
-                    # Active flagger monitoring throughput
-                    if (current_avg_throughput < .9 * float(previous_throughput)) and (bm_iter < 3):
-                        print("[SQU] Throughput decreased, resetting the benchmark")
-                        log_update(f"[SQU] Throughput decreased {previous_throughput}->{current_avg_throughput}, resetting the benchmark")
+            if isinstance(event, IntervalSample):
+                current_avg_throughput = event.average_ops_per_sec*NUM_THREADS
 
-                        op = cgroup_monitor.stop_monitoring()
-                        avg_cpu_used = op["average_cpu_usage_percent"]
-                        avg_mem_used = op["average_memory_usage_percent"]
+                # Active flagger monitoring throughput
+                if early_stopper is None and (current_avg_throughput < .9 * float(previous_throughput)) and (bm_iter < 3):
+                    print("[SQU] Throughput decreased, resetting the benchmark")
+                    log_update(f"[SQU] Throughput decreased {previous_throughput}->{current_avg_throughput}, resetting the benchmark")
+                    return restart_with_midway_options(proc_out, cgroup_monitor, current_avg_throughput, db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter)
 
-                        proc_out.kill()
+                # Dynamic Option Tuning
+                # To Do: Additional condition to check workload shift
+                if DYNAMIC_OPTION_TUNING and current_avg_throughput < 0.6 * float(previous_throughput):
+                    print("[SQU] Dynamic option tuning is enabled and now running")
+                    log_update("[SQU] Dynamic option tuning is enabled and now running")
 
-                        db_path = path_of_db()
-                        fio_result = get_fio_result(FIO_RESULT_PATH)
-                        device_info = system_info(db_path, fio_result)
-                        trace_result = analyze_tracefile(db_path + "/tracefile")
+                    db_path = path_of_db()
+                    fio_result = get_fio_result(FIO_RESULT_PATH)
+                    device_info = system_info(db_path, fio_result)
 
-                        new_options, db_bench_args, _, _ = midway_options_file_generation(options, db_bench_args, avg_cpu_used, avg_mem_used, current_avg_throughput, device_info, trace_result, options_files)
-                        output, avg_cpu_used, avg_mem_used, options = db_bench(db_bench_path, database_path, new_options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter+1)
+                    # Information from the last 20 seconds
+                    op = cgroup_monitor.get_last_n_stats(check_interval)
+                    avg_cpu_used = op["average_cpu_usage_percent"]
+                    avg_mem_used = op["average_memory_usage_percent"]
+                    log_update(f"[SQU] Avg IO pressure of the last {check_interval} seconds: {op['average_io_pressure_percent']}%")
 
-                        log_update("[SPM] Finished running db_bench")
-                        return output, avg_cpu_used, avg_mem_used, options
+                    # Integrate current trace details into dynamic option tuning
+                    trace_result = analyze_last_n_tracefile_windows(db_path + "/tracefile", check_interval//10)
 
-                    # Dynamic Option Tuning
-                    # To Do: Additional condition to check workload shift
-                    if DYNAMIC_OPTION_TUNING and current_avg_throughput < 0.6 * float(previous_throughput):
-                        print("[SQU] Dynamic option tuning is enabled and now running")
-                        log_update("[SQU] Dynamic option tuning is enabled and now running")
+                    cur_options_file.append([
+                        saved_optionfile,
+                        {"ops_per_sec": current_avg_throughput}
+                    ])
 
-                        db_path = path_of_db()
-                        fio_result = get_fio_result(FIO_RESULT_PATH)
-                        device_info = system_info(db_path, fio_result)
+                    new_options, _, _, _ = dynamic_options_file_generation(None, db_bench_args, avg_cpu_used, avg_mem_used, None, device_info, trace_result, cur_options_file)
 
-                        # Information from the last 20 seconds
-                        op = cgroup_monitor.get_last_n_stats(check_interval)
-                        avg_cpu_used = op["average_cpu_usage_percent"]
-                        avg_mem_used = op["average_memory_usage_percent"]
+                    saved_optionfile = new_options
 
-                        # Integrate current trace details into dynamic option tuning
-                        trace_result = analyze_last_n_tracefile_windows(db_path + "/tracefile", check_interval//10)
+                    write_to_mmap_file(new_options)
+            else:
+                print("[SQU] No throughput found in the output")
+                log_update("[SQU] No throughput found in the output")
 
-                        cur_options_file.append([
-                            saved_optionfile,
-                            {"ops_per_sec": current_avg_throughput}
-                        ])
+            start_time = time.time()
 
-                        new_options, _, _, _ = dynamic_options_file_generation(None, db_bench_args, avg_cpu_used, avg_mem_used, None, device_info, trace_result, cur_options_file)
+        reader.join()
 
-                        saved_optionfile = new_options
+    print("[SPM] Finished running db_bench")
+    print("----------------------------------------------------------------------------")
+    print("[SPM] Output: ", output)
 
-                        write_to_mmap_file(new_options)
-                else:
-                    print("[SQU] No throughput found in the output")
-                    log_update("[SQU] No throughput found in the output")
+    op = cgroup_monitor.stop_monitoring()
+    avg_cpu_used = op["average_cpu_usage_percent"]
+    avg_mem_used = op["average_memory_usage_percent"]
 
-                start_time = time.time()
+    if DYNAMIC_OPTION_TUNING:
+        options = add_mmap_file_to_option(options, saved_optionfile)
 
-        print("[SPM] Finished running db_bench")
-        print("----------------------------------------------------------------------------")
-        print("[SPM] Output: ", output)
+    return output, avg_cpu_used, avg_mem_used, options
 
-        op = cgroup_monitor.stop_monitoring()
-        avg_cpu_used = op["average_cpu_usage_percent"]
-        avg_mem_used = op["average_memory_usage_percent"]
+def db_bench(db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args=[], bm_iter=0):
+    '''
+    Store the options in a file
+    Do the benchmark
 
-        if DYNAMIC_OPTION_TUNING:
-            options = add_mmap_file_to_option(options, saved_optionfile)
+    Parameters:
+    - db_bench_path (str): The path to the db_bench executable
+    - database_path (str): The path to the database
+    - option_file (dict): The options file to be used
+    - run_count (str): The current iteration of the benchmark
 
-        return output, avg_cpu_used, avg_mem_used, options
-    
+    Returns:
+    - output (DBBenchOutputParser): The parsed output stream, str() gives the condensed output text
+    - avg_cpu_used (float): The average CPU usage
+    - avg_mem_used (float): The average memory usage
+    - options (str): The options file that was benchmarked
+    '''
+    global proc_out
+    with open(f"{OPTIONS_FILE_DIR}", "w") as f:
+        f.write(options)
+
+    # Perform pre-tasks to reset the environment
+    pre_tasks(database_path, run_count)
+    command = generate_db_bench_command(db_bench_path, database_path, options, run_count, test_name, db_bench_args)
+
+    # Create dynamic option file
+    if DYNAMIC_OPTION_TUNING:
+        create_mmap_file()
+
+    log_update(f"[SPM] Executing db_bench with command: {command}")
+    print("[SPM] Executing db_bench")
+
+
+    if SIDE_CHECKER and previous_throughput != None:
+        return side_checked_db_bench(command, db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter)
     else:
 
         cgm = CGroupManager("llm_cgroup")
@@ -411,7 +460,14 @@ def db_bench(db_bench_path, database_path, options, run_count, test_name, previo
             universal_newlines=True
         )
         cgm.add_process(proc_out.pid)
-        stdout, stderr = proc_out.communicate()
+        output = DBBenchOutputParser()
+        steady_state = SteadyStateDetector() if STEADY_STATE else None
+        for line in proc_out.stdout:
+            event = output.feed(line)
+            if steady_state is not None and isinstance(event, IntervalSample) and steady_state.update(event.interval_ops_per_sec):
+                stop_benchmark(proc_out, output, steady_state.reason)
+                break
+        proc_out.wait()
 
         op = cgroup_monitor.stop_monitoring()
         avg_cpu_used = op["average_cpu_usage_percent"]
@@ -420,7 +476,7 @@ def db_bench(db_bench_path, database_path, options, run_count, test_name, previo
         print("[SPM] Finished running db_bench")
         print("---------------------------------------------------------------------------")
         
-        return stdout, avg_cpu_used, avg_mem_used, options
+        return output, avg_cpu_used, avg_mem_used, options
 
 def db_bench_node(db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, file_path, db_bench_args=[], bm_iter=0):
     '''
@@ -434,7 +490,10 @@ def db_bench_node(db_bench_path, database_path, options, run_count, test_name, p
     - run_count (str): The current iteration of the benchmark
 
     Returns:
-    - None
+    - output (DBBenchOutputParser): The parsed output stream, str() gives the condensed output text
+    - avg_cpu_used (float): The average CPU usage
+    - avg_mem_used (float): The average memory usage
+    - options (str): The options file that was benchmarked
     '''
     global proc_out
 
@@ -454,115 +513,7 @@ def db_bench_node(db_bench_path, database_path, options, run_count, test_name, p
 
 
     if SIDE_CHECKER and previous_throughput != None:
-        cgm = CGroupManager("llm_cgroup")
-        cgroup_monitor = CGroupMonitor("llm_cgroup")
-        
-        if DYNAMIC_OPTION_TUNING:
-            saved_optionfile = options_files[-1][0]
-            cur_options_file = []
-
-        start_time = time.time()
-        cgroup_monitor.start_monitoring()
-
-        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True) as proc_out:
-            cgm.add_process(proc_out.pid)
-
-            output = ""
-            first_check_interval = 100
-            first_check_flag = False
-
-            # db.h: L1412
-            # dynamic options update is a heavy process that is (weirdly) foreground. 
-            # So, we need to make this an infrequent call.
-            check_interval = 90
-
-            for line in proc_out.stdout:
-                output += line
-                elapsed_time = time.time() - start_time
-
-                # Read based workloads need additional time to build the cache
-                # This will effectively provide a small window for the throughput to stabilize
-                if first_check_flag == False:
-                    if (elapsed_time <= first_check_interval):
-                        continue
-                    else:
-                        first_check_flag = True
-
-                if elapsed_time <= check_interval:
-                    continue
-
-                if "ops/second" in line:
-                    current_avg_throughput = (float(line.split("(")[2].split(",")[1].split(")")[0]))*NUM_THREADS
-
-                    # Active flagger monitoring throughput
-                    if (current_avg_throughput < .9 * float(previous_throughput)) and (bm_iter < 3):
-                        print("[SQU] Throughput decreased, resetting the benchmark")
-                        log_update(f"[SQU] Throughput decreased {previous_throughput}->{current_avg_throughput}, resetting the benchmark")
-
-                        op = cgroup_monitor.stop_monitoring()
-                        avg_cpu_used = op["average_cpu_usage_percent"]
-                        avg_mem_used = op["average_memory_usage_percent"]
-
-                        proc_out.kill()
-
-                        db_path = path_of_db()
-                        fio_result = get_fio_result(FIO_RESULT_PATH)
-                        device_info = system_info(db_path, fio_result)
-                        trace_result = analyze_tracefile(db_path + "/tracefile")
-
-                        new_options, db_bench_args, _, _ = midway_options_file_generation(options, db_bench_args, avg_cpu_used, avg_mem_used, current_avg_throughput, device_info, trace_result, options_files)
-                        output, avg_cpu_used, avg_mem_used, options = db_bench(db_bench_path, database_path, new_options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter+1)
-
-                        log_update("[SPM] Finished running db_bench")
-                        return output, avg_cpu_used, avg_mem_used, options
-
-                    # Dynamic Option Tuning
-                    # To Do: Additional condition to check workload shift
-                    if DYNAMIC_OPTION_TUNING and current_avg_throughput < 0.6 * float(previous_throughput):
-                        print("[SQU] Dynamic option tuning is enabled and now running")
-                        log_update("[SQU] Dynamic option tuning is enabled and now running")
-
-                        db_path = path_of_db()
-                        fio_result = get_fio_result(FIO_RESULT_PATH)
-                        device_info = system_info(db_path, fio_result)
-
-                        # Information from the last 20 seconds
-                        op = cgroup_monitor.get_last_n_stats(check_interval)
-                        avg_cpu_used = op["average_cpu_usage_percent"]
-                        avg_mem_used = op["average_memory_usage_percent"]
-
-                        # Integrate current trace details into dynamic option tuning
-                        trace_result = analyze_last_n_tracefile_windows(db_path + "/tracefile", check_interval//10)
-
-                        cur_options_file.append([
-                            saved_optionfile,
-                            {"ops_per_sec": current_avg_throughput}
-                        ])
-
-                        new_options, _, _, _ = dynamic_options_file_generation(None, db_bench_args, avg_cpu_used, avg_mem_used, None, device_info, trace_result, cur_options_file)
-
-                        saved_optionfile = new_options
-
-                        write_to_mmap_file(new_options)
-                else:
-                    print("[SQU] No throughput found in the output")
-                    log_update("[SQU] No throughput found in the output")
-
-                start_time = time.time()
-
-        print("[SPM] Finished running db_bench")
-        print("----------------------------------------------------------------------------")
-        print("[SPM] Output: ", output)
-
-        op = cgroup_monitor.stop_monitoring()
-        avg_cpu_used = op["average_cpu_usage_percent"]
-        avg_mem_used = op["average_memory_usage_percent"]
-
-        if DYNAMIC_OPTION_TUNING:
-            options = add_mmap_file_to_option(options, saved_optionfile)
-
-        return output, avg_cpu_used, avg_mem_used, options
-    
+        return side_checked_db_bench(command, db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, db_bench_args, bm_iter)
     else:
 
         cgm = CGroupManager("llm_cgroup")
@@ -581,7 +532,14 @@ def db_bench_node(db_bench_path, database_path, options, run_count, test_name, p
             universal_newlines=True
         )
         cgm.add_process(proc_out.pid)
-        stdout, stderr = proc_out.communicate()
+        output = DBBenchOutputParser()
+        steady_state = SteadyStateDetector() if STEADY_STATE else None
+        for line in proc_out.stdout:
+            event = output.feed(line)
+            if steady_state is not None and isinstance(event, IntervalSample) and steady_state.update(event.interval_ops_per_sec):
+                stop_benchmark(proc_out, output, steady_state.reason)
+                break
+        proc_out.wait()
 
         op = cgroup_monitor.stop_monitoring()
         avg_cpu_used = op["average_cpu_usage_percent"]
@@ -590,7 +548,7 @@ def db_bench_node(db_bench_path, database_path, options, run_count, test_name, p
         print("[SPM] Finished running db_bench")
         print("---------------------------------------------------------------------------")
         
-        return stdout, avg_cpu_used, avg_mem_used, options
+        return output, avg_cpu_used, avg_mem_used, options
 
 
 def benchmark(db_path, options, output_file_dir, reasoning, changed_value_dict, iteration_count, previous_results, options_files, db_bench_args, bm_iter=0):
@@ -607,19 +565,24 @@ def benchmark(db_path, options, output_file_dir, reasoning, changed_value_dict,
     - is_error (bool): 
     - benchmark_results (dict):
     '''
-    if previous_results is None:
-        output, average_cpu_usage, average_memory_usage, options = db_bench(
-            DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, None, options_files, db_bench_args)
+    preflight_error = preflight_options(options, db_bench_args)
+    if preflight_error is not None:
+        # Invalid options are corrected before the database is reset and preloaded
+        benchmark_results, average_cpu_usage, average_memory_usage = {"error": preflight_error}, 0, 0
     else:
-        if FINETUNE_ITERATION <= 0:
+        if previous_results is None:
             output, average_cpu_usage, average_memory_usage, options = db_bench(
-                DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, previous_results['ops_per_sec'], options_files, db_bench_args)
+                DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, None, options_files, db_bench_args)
         else:
-            output, average_cpu_usage, average_memory_usage, options, changed_value_dict = fine_tuning(
-                db_path, options, reasoning, changed_value_dict, previous_results['ops_per_sec'], options_files, db_bench_args)
+            if FINETUNE_ITERATION <= 0:
+                output, average_cpu_usage, average_memory_usage, options = db_bench(
+                    DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, previous_results['ops_per_sec'], options_files, db_bench_args)
+            else:
+                output, average_cpu_usage, average_memory_usage, options, changed_value_dict = fine_tuning(
+                    db_path, options, reasoning, changed_value_dict, previous_results['ops_per_sec'], options_files, db_bench_args)
 
-    # log_update(f"[SPM] Output: {output}")
-    benchmark_results = parse_db_bench_output(output)
+        # log_update(f"[SPM] Output: {output}")
+        benchmark_results = parse_db_bench_output(output)
 
     contents = os.listdir(output_file_dir)
     ini_file_count = len([f for f in contents if f.endswith(".ini")])
@@ -699,12 +662,17 @@ def benchmark_mcts(db_path, options, output_file_dir, reasoning, changed_value_d
     - benchmark_results (dict):
     '''
 
-    output, average_cpu_usage, average_memory_usage, options = db_bench_node(
-        DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, None, options_files, file_path, db_bench_args)
+    preflight_error = preflight_options(options, db_bench_args)
+    if preflight_error is not None:
+        # Invalid options are corrected before the database is reset and preloaded
+        benchmark_results, average_cpu_usage, average_memory_usage = {"error": preflight_error}, 0, 0
+    else:
+        output, average_cpu_usage, average_memory_usage, options = db_bench_node(
+            DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, None, options_files, file_path, db_bench_args)
 
 
-    # log_update(f"[SPM] Output: {output}")
-    benchmark_results = parse_db_bench_output(output)
+        # log_update(f"[SPM] Output: {output}")
+        benchmark_results = parse_db_bench_output(output)
 
     contents = os.listdir(output_file_dir)
     ini_file_count = len([f for f in contents if f.endswith(".ini")])
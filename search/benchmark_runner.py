@@ -2,17 +2,33 @@ from search.search_utils import Node, get_node_by_id, bfs_collect_digests
 from utils.utils import path_of_db, log_update
 import utils.constants as constants
 import os
+import queue
+import shutil
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 from utils.constants import *
 from utils.cgroup_manager import CGroupManager
 from utils.cgroup_monitor import CGroupMonitor
-import re
+from rocksdb.snapshot_cache import preload_database, restore_preloaded_database
+from rocksdb.parse_db_bench_output import parse_db_bench_output, DBBenchOutputParser, IntervalSample
+from rocksdb.early_stop import SequentialEarlyStopper, stop_benchmark
+from rocksdb.steady_state import SteadyStateDetector
+from utils.results_store import results_store
+from options_files.ops_options_file import configuration_hash
+from search.surrogate import parse_score
+from rocksdb.preflight import preflight_options
+from rocksdb.db_checkpoint import inherited_checkpoint, save_node_checkpoint, restore_node_checkpoint
+from utils.mmap_utils import mmap_file_path, create_mmap_file, OptionScheduleReplayer, mutable_changes
 from gpt.content_generator import error_correction_options_file_generation
 from search.summary_agent import summary_benchmark
 import json
 
+# Highest fidelity of a hot swap segment, it is a screening result however long it runs
+HOT_SWAP_MAX_FIDELITY = 0.9
+
 
 def pre_tasks(database_path, run_count):
     """
@@ -54,190 +70,92 @@ def pre_tasks(database_path, run_count):
     time.sleep(10)
 
 
+def pre_tasks_batch(database_paths):
+    """
 
-def parse_db_bench_output(output):
-    err_check = re.search("Unable to load options file", output) or re.search(
-        "open error", output
-    )
-    if err_check is not None:
-        error = output[err_check.span()[0] :]
-
-        return {
-            "error": error,
-            "ops_per_sec": None,
-        }
-
-    # Regular expression to find and extract the number of Entries
-    # Searches for the pattern "Entries:" followed by one or more digits
-    entries_match = re.search(r"Entries:\s+(\d+)", output)
-    # If a match is found, convert the captured digits to an integer
-    entries = int(entries_match.group(1)) if entries_match else None
-
-    # Regular expression to parse the output line
-    # Captures various performance metrics and their units
-    test_name = None
-
-    if "readrandomwriterandom" in output:
-        op_line = output.split("readrandomwriterandom")[1].split("\n")[0]
-        test_name = "readrandomwriterandom"
-        test_pattern = r"readrandomwriterandom\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-    elif "jsonconfigured" in output:
-        op_line = output.split("jsonconfigured")[1].split("\n")[0]
-        test_name = "jsonconfigured"
-        test_pattern = r"jsonconfigured\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-    elif "fillrandom" in output:
-        op_line = output.split("fillrandom")[1].split("\n")[0]
-        test_name = "fillrandom"
-        test_pattern = r"fillrandom\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;\s+(\d+\.\d+)\s+(\w+/s)\nMicroseconds per write:\nCount:\s+(\d+)\s+Average:\s+(\d+\.\d+)\s+StdDev:\s+(\d+\.\d+)\nMin:\s+(\d+)\s+Median:\s+(\d+\.\d+)\s+Max:\s+(\d+)\nPercentiles:\s+P50:\s+(\d+\.\d+)\s+P75:\s+(\d+\.\d+)\s+P99:\s+(\d+\.\d+)\s+P99\.9:\s+(\d+\.\d+)\s+P99\.99:\s+(\d+\.\d+)\n-{50}"
-    elif "readrandom" in output:
-        op_line = output.split("readrandom")[1].split("\n")[0]
-        test_name = "readrandom"
-        test_pattern = r"readrandom\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;\s+(\d+\.\d+)\s+(\w+/s)\s+\((\d+)\s+of\s+(\d+)\s+found\)\n\nMicroseconds per read:\nCount:\s+(\d+)\s+Average:\s+(\d+\.\d+)\s+StdDev:\s+(\d+\.\d+)\nMin:\s+(\d+)\s+Median:\s+(\d+\.\d+)\s+Max:\s+(\d+)\nPercentiles:\s+P50:\s+(\d+\.\d+)\s+P75:\s+(\d+\.\d+)\s+P99:\s+(\d+\.\d+)\s+P99\.9:\s+(\d+\.\d+)\s+P99\.99:\s+(\d+\.\d+)\n-{50}"
-    elif "mixgraph" in output:
-        op_line = output.split("mixgraph     :")[1].split("\n")[0]
-        test_name = "mixgraph"
-        test_pattern = r"mixgraph\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-        # test_pattern = r"mixgraph\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;\s+\(\s+Gets:+(\d+)\s+Puts:+(\d+)\s+Seek:(\d+),\s+reads\s+(\d+)\s+in\s+(\d+)\s+found,\s+avg\s+size:\s+\d+\s+value,\s+-nan\s+scan\)\n\nMicroseconds per read:\nCount:\s+(\d+)\s+Average:\s+(\d+\.\d+)\s+StdDev:\s+(\d+\.\d+)\nMin:\s+(\d+)\s+Median:\s+(\d+\.\d+)\s+Max:\s+(\d+)\nPercentiles:\s+P50:\s+(\d+\.\d+)\s+P75:\s+(\d+\.\d+)\s+P99:\s+(\d+\.\d+)\s+P99\.9:\s+(\d+\.\d+)\s+P99\.99:\s+(\d+\.\d+)\n-{50}"
-    elif "readwhilewriting" in output:
-        op_line = output.split("readwhilewriting")[1].split("\n")[0]
-        test_name = "readwhilewriting"
-        test_pattern = r"readwhilewriting\s+:\s+(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;"
-    else:
-        log_update(f"[PDB] Test name not found in output: {output}")
-        op_line = "unknown test"
-        test_name = "unknown"
-        test_pattern = r"(\d+\.\d+)\s+micros/op\s+(\d+)\s+ops/sec\s+(\d+\.\d+)\s+seconds\s+(\d+)\s+operations;(\s+\(.*found:\d+\))?\nMicroseconds per (read|write):\nCount: (\d+) Average: (\d+\.\d+)  StdDev: (\d+\.\d+)\nMin: (\d+)  Median: (\d+\.\d+)  Max: (\d+)\nPercentiles: P50: (\d+\.\d+) P75: (\d+\.\d+) P99: (\d+\.\d+) P99.9: (\d+\.\d+) P99.99: (\d+\.\d+)"
-
-    pattern_matches = re.findall(test_pattern, output)
-    log_update(f"[PDB] Test name: {test_name}")
-    log_update(f"[PDB] Matches: {pattern_matches}")
-    log_update(f"[PDB] Output line: {op_line}")
-    # Set all values to None if the pattern is not found
-
-    micros_per_op = ops_per_sec = total_seconds = total_operations = data_speed = (
-        data_speed_unit
-    ) = None
-
-
-    # Extract the performance metrics if the pattern is found
-    for pattern_match in pattern_matches:
-        # Convert each captured group to the appropriate type (float or int)
-        micros_per_op = float(pattern_match[0])
-        ops_per_sec = int(pattern_match[1])
-        total_seconds = float(pattern_match[2])
-        total_operations = int(pattern_match[3])
-        # Check for specific workloads to handle additional data
-
-        if "readrandomwriterandom" in output:
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
-            reads_found = None
-        elif "jsonconfigured" in output:
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
-        elif "fillrandom" in output:
-            data_speed = float(pattern_match[4])
-            data_speed_unit = pattern_match[5]
-            writes_data = {
-                "count": int(pattern_match[6]),
-                "average": float(pattern_match[7]),
-                "std_dev": float(pattern_match[8]),
-                "min": int(pattern_match[9]),
-                "median": float(pattern_match[10]),
-                "max": int(pattern_match[11]),
-                "percentiles": {
-                    "P50": float(pattern_match[12]),
-                    "P75": float(pattern_match[13]),
-                    "P99": float(pattern_match[14]),
-                    "P99.9": float(pattern_match[15]),
-                    "P99.99": float(pattern_match[16])
-                }
-            }
-        elif "readrandom" in output:
-            data_speed = float(pattern_match[4])
-            data_speed_unit = pattern_match[5]
-            reads_found = {
-                "count": int(pattern_match[6]),
-                "total": int(pattern_match[7])
-            }
-            reads_data = {
-                "count": int(pattern_match[8]),
-                "average": float(pattern_match[9]),
-                "std_dev": float(pattern_match[10]),
-                "min": int(pattern_match[11]),
-                "median": float(pattern_match[12]),
-                "max": int(pattern_match[13]),
-                "percentiles": {
-                    "P50": float(pattern_match[14]),
-                    "P75": float(pattern_match[15]),
-                    "P99": float(pattern_match[16]),
-                    "P99.9": float(pattern_match[17]),
-                    "P99.99": float(pattern_match[18]),
-                },
+    Function to perform the pre-tasks once for a batch of nodes that will run in parallel
+    Dropping the page cache while another slot is running would disturb its measurement,
+    so the cache is flushed a single time before the whole batch starts
+    Parameters:
+    - database_paths (list): The paths to the databases of the batch
 
-            }
-        elif "readwhilewriting" in output:
-            data_speed = float(pattern_match[4])
-            data_speed_unit = pattern_match[5]
-            # reads_found = {
-            #     "count": int(pattern_match[6]),
-            #     "total": int(pattern_match[7])
-            # }
-            # reads_data = {
-            #     "count": int(pattern_match[8]),
-            #     "average": float(pattern_match[9]),
-            #     "std_dev": float(pattern_match[10]),
-            #     "min": int(pattern_match[11]),
-            #     "median": float(pattern_match[12]),
-            #     "max": int(pattern_match[13]),
-            #     "percentiles": {
-            #         "P50": float(pattern_match[14]),
-            #         "P75": float(pattern_match[15]),
-            #         "P99": float(pattern_match[16]),
-            #         "P99.9": float(pattern_match[17]),
-            #         "P99.99": float(pattern_match[18])
-            #     }
-            # }
-        elif "mixgraph" in output:
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
-        else:
-            log_update(f"[PDB] Test name not found in output: {output}")
-            data_speed = ops_per_sec
-            data_speed_unit = "ops/sec"
-            log_update(
-            f"[PDB] Ops per sec: {ops_per_sec} Total seconds: {total_seconds} Total operations: {total_operations} Data speed: {data_speed} {data_speed_unit}"
+    Returns:
+    - None
+    """
+
+    for database_path in database_paths:
+        subprocess.run(
+            f"rm -rf {database_path}",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            shell=True,
+            check=False,
         )
 
-    ops_per_sec_points = re.findall(
-        "and \((.*),.*\) ops\/second in \(.*,(.*)\)", output
+    log_update("[SPM] Flushing the cache before the parallel batch")
+    print("[SPM] Flushing the cache before the parallel batch")
+    subprocess.run(
+        f"sync; echo 3 > /proc/sys/vm/drop_caches",
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        shell=True,
+        check=False,
     )
 
+    print("[SPM] Waiting for 10 seconds to free up memory, IO and other resources")
+    time.sleep(10)
+
 
-    # Store all extracted values in a dictionary
-    parsed_data = {
-        "entries": entries,
-        "micros_per_op": micros_per_op,
-        "ops_per_sec": ops_per_sec,
-        "total_seconds": total_seconds,
-        "total_operations": total_operations,
-        "data_speed": data_speed,
-        "data_speed_unit": data_speed_unit,
-        "ops_per_second_graph": [
-            [float(a[1]) for a in ops_per_sec_points],
-            [float(a[0]) for a in ops_per_sec_points],
-        ],
+@dataclass
+class BenchmarkSlot:
+    """An isolated execution slot: its own cgroup pinned to a disjoint CPU range."""
+    index: int
+    cgroup_name: str
+    cpuset: str
 
-    }
 
-    # Grab the latency and push into the output logs file
-    latency = re.findall("Percentiles:.*", output)
-    for i in latency:
-        log_update("[PDB] " + i)
+def make_benchmark_slots(slot_count):
+    '''
+    Build the execution slots used to benchmark sibling nodes in parallel
 
-    # Return the dictionary with the parsed data
-    return parsed_data
+    Parameters:
+    - slot_count (int): The number of slots wanted
 
+    Returns:
+    - list: BenchmarkSlot objects with disjoint CPU ranges
+    '''
+    available_cpus = os.cpu_count() or SLOT_CPUS
+    max_slots = max(1, available_cpus // SLOT_CPUS)
+    if slot_count > max_slots:
+        log_update(f"[SPM] Only {max_slots} slots of {SLOT_CPUS} CPUs fit on this machine, reducing from {slot_count}")
+        print(f"[SPM] Only {max_slots} slots of {SLOT_CPUS} CPUs fit on this machine, reducing from {slot_count}")
+        slot_count = max_slots
+
+    slots = []
+    for index in range(slot_count):
+        first_cpu = index * SLOT_CPUS
+        slots.append(BenchmarkSlot(
+            index=index,
+            cgroup_name=f"llm_cgroup_slot{index}",
+            cpuset=f"{first_cpu}-{first_cpu + SLOT_CPUS - 1}",
+        ))
+    return slots
+
+
+def scale_to_fidelity(value, fidelity):
+    '''
+    Scale a run length or size to a fidelity level
+
+    Parameters:
+    - value (int): The full-size value, 0 is kept as it is (unlimited)
+    - fidelity (float): The fraction of the full-size run
+
+    Returns:
+    - int: The scaled value, at least 1
+    '''
+    if not value or fidelity >= 1:
+        return value
+    return max(1, int(value * fidelity))
 
 
 def generate_db_bench_command_node(
@@ -248,6 +166,9 @@ def generate_db_bench_command_node(
     test_name,
     file_path,
     db_bench_extra_args=[],
+    dynamic_options_file=None,
+    fidelity=1.0,
+    existing_db=False,
 ):
     """
 
@@ -260,11 +181,15 @@ def generate_db_bench_command_node(
     - run_count (str): The current iteration of the benchmark
     - test_name (str): The name of the test
     - db_bench_extra_args (list): Extra arguments to be passed to db_bench
+    - dynamic_options_file (str): The dynamic options file db_bench polls, the shared one when dynamic option tuning is enabled
+    - fidelity (float): The fraction of the duration, number of entries, reads and preload size to run
+    - existing_db (bool): The database was restored from the checkpoint of the parent node, it is used without a preload
 
     Returns:
     - list: The db_bench command
     """
-
+    if dynamic_options_file is None and DYNAMIC_OPTION_TUNING:
+        dynamic_options_file = mmap_file_path
 
     db_bench_command = [
         db_bench_path,
@@ -273,25 +198,24 @@ def generate_db_bench_command_node(
         "--use_direct_io_for_flush_and_compaction",
         "--use_direct_reads",
         "--compression_type=none",
+        # The interval reports feed the early stopper, the steady-state detector and Node.interval_series
+        "--stats_interval_seconds=1",
         "--histogram",
-        f"--dynamic_options_file=/tmp/mmap_file.mmap" if DYNAMIC_OPTION_TUNING else "",
+        f"--dynamic_options_file={dynamic_options_file}" if dynamic_options_file else "",
         f"--threads={NUM_THREADS}",
         f"--trace_file={database_path}/tracefile",
-        f"--num={NUM_ENTRIES}",
-        f"--duration={DURATION}",
+        f"--num={scale_to_fidelity(NUM_ENTRIES, fidelity)}",
+        f"--duration={scale_to_fidelity(DURATION, fidelity)}",
 
     ]
 
     # Preload phase - Only needed for some tests - Theoritically, mentioning test name should not be needed
     # However, I trust I will forget this in the future and this will act as a secondary measure
-    if test_name == "readrandom" or test_name == "mixgraph" or test_name == "tracefile":
+    if (test_name == "readrandom" or test_name == "mixgraph" or test_name == "tracefile") and not existing_db:
         if PRE_LOAD_DB_PATH != "":
             log_update("[SPM] Running Pre-load command")
             print("[SPM] Running Pre-load command")
-            tmp_runner_rm = ["rm", "-rf", database_path]
-            tmp_proc_rm = subprocess.run(tmp_runner_rm, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
-            tmp_runner = ["cp", "-r", PRE_LOAD_DB_PATH, database_path]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
+            restore_preloaded_database(PRE_LOAD_DB_PATH, database_path)
 
 
     if test_name == "fillrandom":
@@ -306,21 +230,21 @@ def generate_db_bench_command_node(
         db_bench_command.append("--value_size=1000")
         db_bench_command.append("--use_existing_db")
     elif test_name == "readrandom":
-        if PRE_LOAD_DB_PATH == "":
+        if PRE_LOAD_DB_PATH == "" and not existing_db:
             log_update("[SPM] Running fillrandom to load the database")
             print("[SPM] Running fillrandom to load the database")
 
-            tmp_runner = db_bench_command[:-3] + ["--num=50000000", "--benchmarks=fillrandom", "--max_background_jobs=8"]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
-        new_db_bench = db_bench_command + ["--benchmarks=readrandom", "--use_existing_db", "--reads=5000000"]
+            tmp_runner = db_bench_command[:-3] + [f"--num={scale_to_fidelity(50000000, fidelity)}", "--benchmarks=fillrandom", "--max_background_jobs=8"]
+            preload_database(tmp_runner, database_path)
+        new_db_bench = db_bench_command + ["--benchmarks=readrandom", "--use_existing_db", f"--reads={scale_to_fidelity(5000000, fidelity)}"]
         db_bench_command = new_db_bench
     elif test_name == "mixgraph":
-        if PRE_LOAD_DB_PATH == "":
+        if PRE_LOAD_DB_PATH == "" and not existing_db:
             log_update("[SPM] Running fillrandom to load the database")
             print("[SPM] Running fillrandom to load the database")
-            tmp_runner = db_bench_command[:-3] + ["--num=500000", "--benchmarks=fillrandom", "--key_size=48", "--value_size=43"]
-            tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
-        new_db_bench = db_bench_command[:-1] + ["--benchmarks=mixgraph", "--use_existing_db", f"--duration={DURATION}", 
+            tmp_runner = db_bench_command[:-3] + [f"--num={scale_to_fidelity(500000, fidelity)}", "--benchmarks=fillrandom", "--key_size=48", "--value_size=43"]
+            preload_database(tmp_runner, database_path)
+        new_db_bench = db_bench_command[:-1] + ["--benchmarks=mixgraph", "--use_existing_db", f"--duration={scale_to_fidelity(DURATION, fidelity)}", 
                                                 "--mix_get_ratio=0.83", "--mix_put_ratio=0.14", "--mix_seek_ratio=0.03", "--key_size=48",
                                                 f"--sine_write_rate_interval_milliseconds={SINE_WRITE_RATE_INTERVAL_MILLISECONDS}", "--sine_mix_rate", 
                                                 f"--sine_a={SINE_A}", f"--sine_b={SINE_B}", f"--sine_c={SINE_C}", f"--sine_d={SINE_D}"]
@@ -342,7 +266,7 @@ def generate_db_bench_command_node(
 
         ]
     elif test_name == "tracefile":
-        if PRE_LOAD_CMD != "" and PRE_LOAD_DB_PATH == "":
+        if PRE_LOAD_CMD != "" and PRE_LOAD_DB_PATH == "" and not existing_db:
             tmp_runner = PRE_LOAD_CMD.split(" ")
 
             tmp_proc = subprocess.run(tmp_runner, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False)
@@ -354,6 +278,10 @@ def generate_db_bench_command_node(
         print(f"[SPM] Test name {test_name} not recognized")
         exit(1)
 
+    if existing_db and "--use_existing_db" not in db_bench_command:
+        # Without it db_bench destroys the database it opens
+        db_bench_command.append("--use_existing_db")
+
     db_bench_command += db_bench_extra_args
 
     log_update(f"[SPM] Command: {db_bench_command}")
@@ -397,7 +325,7 @@ def store_db_bench_output(output_folder_name, output_file_name,
 
 
 
-def db_bench_node(db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, file_path, db_bench_args=[], bm_iter=0):
+def db_bench_node(db_bench_path, database_path, options, run_count, test_name, previous_throughput, options_files, file_path, db_bench_args=[], bm_iter=0, slot=None, baseline_series=None, option_schedule=None, fidelity=1.0, parent_checkpoint=None):
     '''
 
     Store the options in a file
@@ -408,20 +336,39 @@ def db_bench_node(db_bench_path, database_path, options, run_count, test_name, p
     - database_path (str): The path to the database
     - option_file (dict): The options file to be used
     - run_count (str): The current iteration of the benchmark
+    - slot (BenchmarkSlot): The parallel slot to run in, None for the shared sequential cgroup
+    - baseline_series (list): Interval throughput of the parent node, used to stop dominated candidates early
+    - option_schedule (list): (offset in seconds, {option: value}) changes pushed to db_bench while it runs
+    - fidelity (float): The fraction of the full-size run, see generate_db_bench_command_node
+    - parent_checkpoint (str): The database checkpoint of the parent node to continue from, None to start from a fresh or preloaded database
 
     Returns:
-    - None
+    - output (DBBenchOutputParser): The parsed db_bench output
+    - avg_cpu_used (float): The average CPU usage
+    - avg_mem_used (float): The average memory usage
+    - options (str): The options file that was benchmarked
+    - telemetry (dict): The cgroup statistics of the run
 
     '''
-    global proc_out
-
     if not os.path.exists(file_path):
         with open(file_path, "w") as f:
             f.write(options)
     # Perform pre-tasks to reset the environment
-    pre_tasks(database_path, run_count)
-
-    command = generate_db_bench_command_node(db_bench_path, database_path, options, run_count, test_name, file_path, db_bench_args)
+    # Parallel batches already did them once for every slot
+    if slot is None:
+        pre_tasks(database_path, run_count)
+    existing_db = parent_checkpoint is not None and restore_node_checkpoint(parent_checkpoint, database_path)
+    if existing_db:
+        log_update(f"[SPM] Continuing from the database checkpoint {parent_checkpoint}")
+        print("[SPM] Continuing from the database checkpoint of the parent node")
+
+    cgroup_name = "llm_cgroup" if slot is None else slot.cgroup_name
+    dynamic_options_file = None
+    if option_schedule:
+        # Every slot has its own channel so parallel siblings do not read each other's schedule
+        dynamic_options_file = f"/tmp/mmap_file_{cgroup_name}.mmap"
+        create_mmap_file(dynamic_options_file)
+    command = generate_db_bench_command_node(db_bench_path, database_path, options, run_count, test_name, file_path, db_bench_args, dynamic_options_file, fidelity, existing_db)
 
 
     log_update(f"[SPM] Executing db_bench with command: {command}")
@@ -429,14 +376,16 @@ def db_bench_node(db_bench_path, database_path, options, run_count, test_name, p
 
 
 
-    cgm = CGroupManager("llm_cgroup")
+    cgm = CGroupManager(cgroup_name)
     cgm.create_cgroup()
-    cgm.set_cpu_limit(2)
+    if slot is not None:
+        cgm.set_cpuset(slot.cpuset)
+    cgm.set_cpu_limit(SLOT_CPUS)
     cgm.set_memory_limit(4*1024*1024*1024)
     cgm.set_memory_swap_limit(4*1024*1024*1024)
 
 
-    cgroup_monitor = CGroupMonitor("llm_cgroup")
+    cgroup_monitor = CGroupMonitor(cgroup_name)
     cgroup_monitor.start_monitoring()
 
     proc_out = subprocess.Popen(
@@ -446,26 +395,73 @@ def db_bench_node(db_bench_path, database_path, options, run_count, test_name, p
         universal_newlines=True
     )
     cgm.add_process(proc_out.pid)
-    stdout, stderr = proc_out.communicate()
+    replayer = None
+    if option_schedule:
+        # A shorter run replays the schedule at the same relative offsets
+        replayer = OptionScheduleReplayer([(offset * fidelity, changes) for offset, changes in option_schedule], dynamic_options_file)
+        replayer.start()
+    output = DBBenchOutputParser()
+    stop_rules = []
+    if EARLY_STOP and baseline_series:
+        stop_rules.append(SequentialEarlyStopper(baseline_series, duration=scale_to_fidelity(DURATION, fidelity)))
+    if STEADY_STATE and not option_schedule:
+        # A run stopped at steady state would skip the scheduled changes that are still due
+        stop_rules.append(SteadyStateDetector())
+    for line in proc_out.stdout:
+        event = output.feed(line)
+        if isinstance(event, IntervalSample):
+            triggered = [rule for rule in stop_rules if rule.update(event.interval_ops_per_sec)]
+            if triggered:
+                stop_benchmark(proc_out, output, triggered[0].reason)
+                break
+    proc_out.wait()
+    if replayer is not None:
+        replayer.stop()
 
     op = cgroup_monitor.stop_monitoring()
     avg_cpu_used = op["average_cpu_usage_percent"]
     avg_mem_used = op["average_memory_usage_percent"]
+    log_update(f"[SPM] Avg IO pressure: {op['average_io_pressure_percent']}% (max {op['max_io_pressure_percent']}%), IO read/write: {op['average_io_read_mib_per_sec']}/{op['average_io_write_mib_per_sec']} MiB/s")
+    log_update(f"[SPM] Resource usage: {op}")
 
     print("[SPM] Finished running db_bench")
     print("---------------------------------------------------------------------------")
 
     
-    return stdout, avg_cpu_used, avg_mem_used, options
+    return output, avg_cpu_used, avg_mem_used, options, op
 
-def benchmark_runner(db_path, options, output_file_dir, reasoning, changed_value_dict, iteration_count, previous_results, options_files, db_bench_args, file_path):
+def benchmark_runner(db_path, options, output_file_dir, reasoning, changed_value_dict, iteration_count, previous_results, options_files, db_bench_args, file_path, slot=None, baseline_series=None, option_schedule=None, node=None, fidelity=1.0):
 
-    output, average_cpu_usage, average_memory_usage, options = db_bench_node(
-        DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, None, options_files, file_path, db_bench_args)
-
-
-    # log_update(f"[SPM] Output: {output}")
-    benchmark_results = parse_db_bench_output(output)
+    preflight_error = preflight_options(options, db_bench_args)
+    parent_checkpoint = inherited_checkpoint(node, TEST_NAME)
+    if preflight_error is not None:
+        # An invalid candidate fails before its database is reset and preloaded
+        output, average_cpu_usage, average_memory_usage, telemetry = None, 0, 0, {}
+        benchmark_results = {"error": preflight_error}
+    else:
+        output, average_cpu_usage, average_memory_usage, options, telemetry = db_bench_node(
+            DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, None, options_files, file_path, db_bench_args, slot=slot, baseline_series=baseline_series,
+            option_schedule=option_schedule, fidelity=fidelity, parent_checkpoint=parent_checkpoint)
+
+
+        # log_update(f"[SPM] Output: {output}")
+        benchmark_results = parse_db_bench_output(output)
+        if benchmark_results.get("error") is not None and parent_checkpoint is not None:
+            # The options may not open the database of the parent, e.g. with another compaction style
+            log_update(f"[SPM] Benchmark from the checkpoint of the parent failed, running from a fresh database: {benchmark_results.get('error')}")
+            print("[SPM] Benchmark from the checkpoint of the parent failed, running from a fresh database")
+            shutil.rmtree(db_path, ignore_errors=True)
+            parent_checkpoint = None
+            output, average_cpu_usage, average_memory_usage, options, telemetry = db_bench_node(
+                DB_BENCH_PATH, db_path, options, iteration_count, TEST_NAME, None, options_files, file_path, db_bench_args, slot=slot, baseline_series=baseline_series,
+                option_schedule=option_schedule, fidelity=fidelity)
+            benchmark_results = parse_db_bench_output(output)
+        if parent_checkpoint is not None:
+            benchmark_results["inherited_from"] = node.parent.id
+    if SUCCESSIVE_HALVING:
+        # Scores of short runs are not comparable with full-size ones
+        benchmark_results["fidelity"] = fidelity
+    text_output_for_visualization = None
 
     # ERROR: Unable to load options file*
     if benchmark_results.get("error") is not None:
@@ -486,6 +482,9 @@ def benchmark_runner(db_path, options, output_file_dir, reasoning, changed_value
 
     else:
         is_error = False
+        if node is not None and fidelity >= 1:
+            # Short runs do not reach the state of a full-size run
+            save_node_checkpoint(node.id, db_path)
 
 
         log_update(f"[SPM] Latest result: {benchmark_results['data_speed']}"
@@ -501,7 +500,13 @@ def benchmark_runner(db_path, options, output_file_dir, reasoning, changed_value
             f"{benchmark_results['data_speed_unit']} and {benchmark_results['ops_per_sec']} ops/sec.",
             f"\n[SPM] Avg CPU and Memory usage: {average_cpu_usage}% and {average_memory_usage}%",
         )
-    output+= "\n"
+    store = results_store()
+    if store is not None and node is not None:
+        if node.config_hash is None:
+            node.config_hash = configuration_hash(node.full_option, node.db_bench_option, node.option_schedule)
+        store.record_benchmark(node, benchmark_results, is_error, output.histograms if output is not None else None, telemetry)
+
+    output = str(output if output is not None else preflight_error) + "\n"
     output += f"Avg CPU usage: {average_cpu_usage}%\n"
     output += f"Avg Memory usage: {average_memory_usage}%\n"
     return is_error, benchmark_results, average_cpu_usage, average_memory_usage, options, output, text_output_for_visualization
@@ -518,8 +523,9 @@ def get_executed_path(node):
 def summary_results(outputs):
     return summary_benchmark(outputs)
 
-def benchmark(node_id, root):
+def benchmark(node_id, root, slot=None, fidelity=1.0):
     target_node = get_node_by_id(root, node_id)
+    target_node.fidelity = fidelity
     options = target_node.db_option
 
     reasoning = target_node.reasoning
@@ -532,10 +538,12 @@ def benchmark(node_id, root):
     os.makedirs(db_path, exist_ok=True)
 
     is_error, benchmark_results, average_cpu_usage, average_memory_usage, options, outputs, text_output_for_visualization = benchmark_runner(
-            db_path, options, output_folder_dir, reasoning, None, 0, None, [], target_node.db_bench_option, target_node.file_path)
+            db_path, options, output_folder_dir, reasoning, None, 0, None, [], target_node.db_bench_option, target_node.file_path, slot,
+            target_node.parent.interval_series if target_node.parent is not None else None, target_node.option_schedule, target_node, fidelity)
     if is_error:
         results = str(benchmark_results)
     else:
+        target_node.interval_series = benchmark_results["ops_per_second_graph"][1]
         # results = outputs
         results = str(benchmark_results) + "\n" + f"Avg CPU usage: {average_cpu_usage}%\n" + f"Avg Memory usage: {average_memory_usage}%\n"
         # results = summary_results(outputs)
@@ -543,6 +551,261 @@ def benchmark(node_id, root):
     return results, text_output_for_visualization 
 
 
+def benchmark_nodes(node_ids, root, on_result=None, fidelity=1.0):
+    '''
+    Benchmark several nodes of the tree, in parallel when PARALLEL_SLOTS > 1
+
+    Each node runs in its own slot: a dedicated cgroup pinned to a disjoint CPU range
+    with its own database directory. Nodes wait for a free slot when there are more nodes than slots.
+
+    Parameters:
+    - node_ids (list): The ids of the nodes to benchmark
+    - root (Node): The root of the tree
+    - on_result (callable): Called with (node_id, results) as soon as each node finishes
+    - fidelity (float): The fraction of the full-size run, see generate_db_bench_command_node
+
+    Returns:
+    - list: (results, text_output_for_visualization) for every node, in the order of node_ids
+    '''
+    def run(node_id, slot=None):
+        result = benchmark(node_id, root, slot, fidelity)
+        if on_result is not None:
+            on_result(node_id, result)
+        return result
+
+    if PARALLEL_SLOTS <= 1 or len(node_ids) <= 1:
+        return [run(node_id) for node_id in node_ids]
+
+    slots = make_benchmark_slots(min(PARALLEL_SLOTS, len(node_ids)))
+    free_slots = queue.Queue()
+    for slot in slots:
+        free_slots.put(slot)
+
+    log_update(f"[SPM] Benchmarking {len(node_ids)} nodes across {len(slots)} slots")
+    print(f"[SPM] Benchmarking {len(node_ids)} nodes across {len(slots)} slots")
+    pre_tasks_batch([path_of_db() + f"/{node_id}" for node_id in node_ids])
+
+    def run_in_slot(node_id):
+        slot = free_slots.get()
+        try:
+            return run(node_id, slot)
+        finally:
+            free_slots.put(slot)
+
+    with ThreadPoolExecutor(max_workers=len(slots)) as executor:
+        return list(executor.map(run_in_slot, node_ids))
+
+
+def halving_fidelities():
+    '''
+    Fidelity of every successive halving rung, growing by HALVING_ETA up to the full-size run
+
+    Parameters:
+    - None
+
+    Returns:
+    - list: The fidelities, the last one is 1.0
+    '''
+    fidelities = []
+    fidelity = HALVING_MIN_FIDELITY
+    # A rung within 10% of the full-size run is replaced by the full-size run
+    while 0 < fidelity < 0.9:
+        fidelities.append(fidelity)
+        fidelity *= max(2, HALVING_ETA)
+    return fidelities + [1.0]
+
+
+def results_throughput(result):
+    results = parse_score(result[0])
+    if results is None or not results.get("ops_per_sec"):
+        return 0.0
+    return results["ops_per_sec"]
+
+
+def successive_halving(node_ids, root, on_result=None):
+    '''
+    Benchmark several nodes with successive halving
+
+    All nodes first run at the lowest fidelity: a shorter duration, fewer entries and a smaller preload.
+    After each rung only the best 1/HALVING_ETA by throughput are promoted to the next, longer rung,
+    and the last nodes standing run at full size. A node dropped at a rung keeps its low-fidelity results,
+    the fidelity is recorded in the results and in node.fidelity.
+
+    Parameters:
+    - node_ids (list): The ids of the nodes to benchmark
+    - root (Node): The root of the tree
+    - on_result (callable): Called with (node_id, results) once the final results of each node are known
+
+    Returns:
+    - list: (results, text_output_for_visualization) of the last rung of every node, in the order of node_ids
+    '''
+    fidelities = halving_fidelities()
+    final_results = {}
+    candidates = list(node_ids)
+    rung = 0
+    while candidates:
+        # A single candidate has nothing left to be compared with, it goes straight to the full-size run
+        fidelity = fidelities[-1] if len(candidates) == 1 else fidelities[rung]
+        last_rung = fidelity >= 1
+        log_update(f"[SPM] Successive halving: {len(candidates)} nodes at fidelity {fidelity}")
+        print(f"[SPM] Successive halving: {len(candidates)} nodes at fidelity {fidelity}")
+        results = benchmark_nodes(candidates, root, on_result if last_rung else None, fidelity)
+        final_results.update(zip(candidates, results))
+        if last_rung:
+            break
+
+        ranked = sorted(zip(candidates, results), key=lambda item: results_throughput(item[1]), reverse=True)
+        promoted = max(1, len(candidates) // max(2, HALVING_ETA))
+        for node_id, result in ranked[promoted:]:
+            if on_result is not None:
+                on_result(node_id, result)
+        candidates = [node_id for node_id, _ in ranked[:promoted]]
+        rung += 1
+    return [final_results[node_id] for node_id in node_ids]
+
+
+def hot_swap_changes(node):
+    '''
+    Find the options a node changes with respect to its parent, if they can be applied to the running parent
+
+    Parameters:
+    - node (Node): The node
+
+    Returns:
+    - dict: {option: (parent value, node value)}, None if the node needs its own run
+    '''
+    parent = node.parent
+    if parent is None or node.option_schedule or not isinstance(parent.db_option, str) or not isinstance(node.db_option, str):
+        return None
+    return mutable_changes(parent.db_option, parent.db_bench_option, node.db_option, node.db_bench_option)
+
+
+def segment_throughput(output, start, end):
+    '''
+    Throughput of the db_bench run between two elapsed times
+
+    Parameters:
+    - output (DBBenchOutputParser): The parsed db_bench output
+    - start (float): The start of the segment in seconds
+    - end (float): The end of the segment in seconds
+
+    Returns:
+    - tuple: (ops per second of all threads, times, ops per second of every sample), None if the segment has no sample
+    '''
+    samples = [(elapsed, ops) for elapsed, ops in zip(output.graph_times, output.graph_ops) if start <= elapsed < end]
+    if not samples:
+        return None
+    # Every thread reports its own samples, the throughput of the database is their sum
+    threads = max(1, len(output.thread_samples))
+    throughput = sum(ops for _, ops in samples) / len(samples) * threads
+    return throughput, [elapsed for elapsed, _ in samples], [ops for _, ops in samples]
+
+
+def hot_swap_fidelity(segment, settle):
+    '''
+    Fidelity of a hot swap segment, the share of a full run that it measures
+
+    A segment starts on the compactions and memtables of the previous ones, so it stays below 1 even when
+    it is as long as a full run.
+
+    Parameters:
+    - segment (int): The duration of the segment in seconds
+    - settle (int): The seconds at the start of the segment left out of its throughput
+
+    Returns:
+    - float: The fidelity of the results of the segment
+    '''
+    if not DURATION:
+        return HOT_SWAP_MAX_FIDELITY
+    return min(HOT_SWAP_MAX_FIDELITY, (segment - settle) / DURATION)
+
+
+def benchmark_hot_swap(node_ids, root, on_result=None):
+    '''
+    Benchmark siblings that only change mutable options in segments of a single run of their parent
+
+    The first segment runs the parent options as the baseline of the run. At the start of every following
+    segment the changes of the previous sibling are reverted and the changes of the next one are pushed
+    through the dynamic options file, which db_bench applies with SetOptions. The first
+    HOT_SWAP_SETTLE_SECONDS of every segment are left out of its throughput. Compactions and memtables
+    carry over from one segment to the next, so the results are screening results, not full restarts.
+    They are recorded with a fidelity below 1, like the screening runs of successive halving.
+
+    Parameters:
+    - node_ids (list): The ids of the siblings, hot_swap_changes must not be None for any of them
+    - root (Node): The root of the tree
+    - on_result (callable): Called with (node_id, results) once the run is over
+
+    Returns:
+    - list: (results, text_output_for_visualization) for every node, in the order of node_ids
+    '''
+    nodes = [get_node_by_id(root, node_id) for node_id in node_ids]
+    parent = nodes[0].parent
+    segment = HOT_SWAP_SEGMENT_SECONDS
+    settle = min(HOT_SWAP_SETTLE_SECONDS, segment - 1)
+
+    schedule = []
+    reverted = {}
+    for index, node in enumerate(nodes):
+        changes = hot_swap_changes(node)
+        options = dict(reverted)
+        options.update({key: value for key, (_, value) in changes.items()})
+        schedule.append((segment * (index + 1), options))
+        reverted = {key: parent_value for key, (parent_value, _) in changes.items()}
+
+    file_path = parent.file_path or os.path.join(os.path.dirname(OPTIONS_FILE_DIR), f"{parent.id}.ini")
+    db_path = path_of_db() + f"/hot_swap_{parent.id}"
+    os.makedirs(db_path, exist_ok=True)
+    db_bench_args = list(parent.db_bench_option or []) + [f"--duration={segment * (len(nodes) + 1)}"]
+
+    log_update(f"[SPM] Hot swap: {len(nodes)} children of node {parent.id} in {len(nodes) + 1} segments of {segment}s")
+    print(f"[SPM] Hot swap: {len(nodes)} children of node {parent.id} in {len(nodes) + 1} segments of {segment}s")
+    output, average_cpu_usage, average_memory_usage, _, telemetry = db_bench_node(
+        DB_BENCH_PATH, db_path, parent.db_option, 0, TEST_NAME, None, [], file_path, db_bench_args, option_schedule=schedule)
+
+    baseline = segment_throughput(output, settle, segment)
+    fidelity = hot_swap_fidelity(segment, settle)
+    store = results_store()
+    results = []
+    for index, node in enumerate(nodes):
+        start = segment * (index + 1)
+        measured = segment_throughput(output, start + settle, start + segment)
+        if measured is None:
+            is_error = True
+            benchmark_results = {"error": f"No throughput samples in hot swap segment {index + 1}", "ops_per_sec": None, "fidelity": fidelity}
+            score = str(benchmark_results)
+            text_output_for_visualization = None
+        else:
+            is_error = False
+            throughput, times, ops = measured
+            benchmark_results = {
+                "ops_per_sec": int(throughput),
+                "data_speed": int(throughput),
+                "data_speed_unit": "ops/sec",
+                "ops_per_second_graph": [times, ops],
+                "hot_swap_segment": index + 1,
+                "hot_swap_baseline_ops_per_sec": int(baseline[0]) if baseline is not None else None,
+                "fidelity": fidelity,
+            }
+            node.interval_series = ops
+            score = str(benchmark_results) + "\n" + f"Avg CPU usage: {average_cpu_usage}%\n" + f"Avg Memory usage: {average_memory_usage}%\n"
+            text_output_for_visualization = (
+                f"[SPM] Hot swap segment {index + 1}: {benchmark_results['ops_per_sec']} ops/sec",
+                f"(parent segment {benchmark_results['hot_swap_baseline_ops_per_sec']} ops/sec).",
+            )
+            log_update(f"[SPM] Hot swap node {node.id}: {benchmark_results['ops_per_sec']} ops/sec, changes {hot_swap_changes(node)}")
+        node.fidelity = fidelity
+        if store is not None:
+            if node.config_hash is None:
+                node.config_hash = configuration_hash(node.full_option, node.db_bench_option, node.option_schedule)
+            store.record_benchmark(node, benchmark_results, is_error, None, telemetry)
+        result = (score, text_output_for_visualization)
+        if on_result is not None:
+            on_result(node.id, result)
+        results.append(result)
+    return results
+
+
 def benchmark_single_node(node):
     options = node.clean_options
     reasoning = node.reasoning
@@ -552,8 +815,8 @@ def benchmark_single_node(node):
     db_path = path_of_db() + f"/{node.id}"
     os.makedirs(db_path, exist_ok=True)
 
-    is_error, benchmark_results, average_cpu_usage, average_memory_usage, options, outputs = benchmark_runner(
-            db_path, options, output_folder_dir, reasoning, None, 0, None, [], [], node.file_path)
+    is_error, benchmark_results, average_cpu_usage, average_memory_usage, options, outputs, _ = benchmark_runner(
+            db_path, options, output_folder_dir, reasoning, None, 0, None, [], [], node.file_path, node=node)
 
     if is_error:
         results = benchmark_results
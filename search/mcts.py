@@ -5,20 +5,43 @@ from utils.utils import path_of_db, log_gpt_response
 import os
 
 import json
-from search.benchmark_runner import benchmark
-from options_files.ops_options_file import cleanup_options_file_node, cleanup_options_file_node_with_structured_change
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from search.benchmark_runner import benchmark_nodes, successive_halving, benchmark_hot_swap, hot_swap_changes
+from options_files.ops_options_file import cleanup_options_file_node, cleanup_options_file_node_with_structured_change, configuration_hash
 
 from gpt.gpt_request import request_gpt_with_structured_output
 from pydantic import BaseModel
 from data_model.config import INIConfig, Action, ActionList, Insights, InsightsDecision, InsightsList
 from data_model.decision import Decision
-from search.search_utils import Node, Insight, bfs_collect_digests, get_node_by_id, collect_records_from_tree, bfs_collect_json_digests
+from search.search_utils import Node, Insight, bfs_collect_digests, get_node_by_id, collect_records_from_tree, bfs_collect_json_digests, transposition_key
 from search.memory import Memory
+from search.surrogate import screen_candidates
+from search.tree_policy import backpropagate, select_node, best_measured_node
+from search.tree_checkpoint import TreeCheckpoint, load_tree_checkpoint
+from rocksdb.db_checkpoint import save_node_checkpoint
+from utils.mmap_utils import MUTABLE_DB_OPTIONS, MUTABLE_CF_OPTIONS, parse_option_schedule
 from utils.color_logger import logger
 from data_model.db_bench_options import DBBenchOptions
 from data_model.utils import make_field_optional
 import pickle
 
+# Number of children benchmarked per expansion
+CHILDREN_COUNT = 3
+
+def children_count():
+    """
+    Number of children benchmarked per expansion. Successive halving screens HALVING_ETA times
+    more children, with the default settings its three rungs cost about CHILDREN_COUNT full-size runs.
+    """
+    return CHILDREN_COUNT * max(2, constants.HALVING_ETA) if constants.SUCCESSIVE_HALVING else CHILDREN_COUNT
+
+def candidate_count():
+    """
+    Number of children asked from the LLM, the surrogate screens the extra ones before benchmarking.
+    """
+    return max(constants.SURROGATE_CANDIDATES, children_count()) if constants.SURROGATE else children_count()
+
 def invoke_llm_to_generate_children(current_option, current_db_bench_option, device_information, results, current_node):
     system_content = (
         "You are a RocksDB Expert. "
@@ -69,7 +92,7 @@ def invoke_llm_to_generate_children(current_option, current_db_bench_option, dev
     user_contents = [
         (
             f"The benchmark results for the parent file are: {results}. "
-            "Based on these information, first generate 3 potential promsing children of the given parent option file. "
+            f"Based on these information, first generate {candidate_count()} potential promsing children of the given parent option file. "
             # "Each child should be a small change (smaller then 10 options) from the parent option file to improve my database performance. "
             "Each child file should in the same format as the options_file (but only give the changed value) to improve my database performance."
             "Each changed key should be placed in the correct section. "
@@ -81,6 +104,14 @@ def invoke_llm_to_generate_children(current_option, current_db_bench_option, dev
     ]
 
     user_contents[-1] += one_shot_example
+    if constants.SELECTION_POLICY == "puct":
+        user_contents[-1] += "For each child, also give a prior: the probability between 0 and 1 that it performs better than the parent. "
+    if constants.OPTION_SCHEDULE:
+        user_contents[-1] += (
+            "A child can also give an option_schedule to change options while the benchmark runs, e.g. different settings for the fill and the read phases: "
+            f"a list of changes, each with offset_seconds from the start of the {constants.DURATION} second benchmark and the options to set then as key=value. "
+            f"Only these options can be changed while running: {', '.join(MUTABLE_DB_OPTIONS + MUTABLE_CF_OPTIONS)}. "
+        )
 
     # "First generate 3 potential promsing childs of the given parent option file. Each child should be a small change (smaller then 10 options) from the parent option file. "
     # "Then show the changed options in 3 child options in the same format as the parent option file, explaining the reason for each child. ")
@@ -94,7 +125,7 @@ def invoke_llm_to_generate_children(current_option, current_db_bench_option, dev
     #     assistant_reply = file.read()
     # pattern = re.compile(r"```([\s\S]*?)```")
     # matches = pattern.findall(assistant_reply)
-    assert len(actions.actions) == 3, "Expected exactly 3 child options."
+    assert len(actions.actions) == candidate_count(), f"Expected exactly {candidate_count()} child options."
     # Extract the child options and their reasoning
     nodes = []
     for action in actions.actions:
@@ -129,6 +160,9 @@ def invoke_llm_to_generate_children(current_option, current_db_bench_option, dev
             db_option_changes=option_changes,
             db_bench_changes=db_bench_option_changes,
         )
+        node.prior = action.prior
+        if constants.OPTION_SCHEDULE:
+            node.option_schedule = parse_option_schedule(action.option_schedule)
         child_opt_file = f"{node.id}.ini"
         clean_options_file, changed_value_dict, db_bench_args = (
             cleanup_options_file_node_with_structured_change(
@@ -144,6 +178,8 @@ def invoke_llm_to_generate_children(current_option, current_db_bench_option, dev
         node.file_path = os.path.join(base_dir, child_opt_file)
         nodes.append(node)
 
+    if constants.SURROGATE:
+        nodes = screen_candidates(nodes, current_node, children_count())
     return nodes  # Example options
 
 def invoke_llm_to_generate_children_with_insights(current_option, current_db_bench_option, device_information, results, current_node, insights):
@@ -197,7 +233,7 @@ def invoke_llm_to_generate_children_with_insights(current_option, current_db_ben
     user_contents = [
         (
             f"The benchmark results for the parent file are: {results}. "
-            "Based on these information, first generate 3 potential promsing children of the given parent option file. "
+            f"Based on these information, first generate {candidate_count()} potential promsing children of the given parent option file. "
             # "Each child should be a small change (smaller then 10 options) from the parent option file to improve my database performance. "
             "Each child file should in the same format as the options_file (but only give the changed value) to improve my database performance."
             "Each changed key should be placed in the correct section. "
@@ -209,6 +245,14 @@ def invoke_llm_to_generate_children_with_insights(current_option, current_db_ben
     ]
 
     user_contents[-1] += one_shot_example
+    if constants.SELECTION_POLICY == "puct":
+        user_contents[-1] += "For each child, also give a prior: the probability between 0 and 1 that it performs better than the parent. "
+    if constants.OPTION_SCHEDULE:
+        user_contents[-1] += (
+            "A child can also give an option_schedule to change options while the benchmark runs, e.g. different settings for the fill and the read phases: "
+            f"a list of changes, each with offset_seconds from the start of the {constants.DURATION} second benchmark and the options to set then as key=value. "
+            f"Only these options can be changed while running: {', '.join(MUTABLE_DB_OPTIONS + MUTABLE_CF_OPTIONS)}. "
+        )
 
     # "First generate 3 potential promsing childs of the given parent option file. Each child should be a small change (smaller then 10 options) from the parent option file. "
     # "Then show the changed options in 3 child options in the same format as the parent option file, explaining the reason for each child. ")
@@ -222,7 +266,7 @@ def invoke_llm_to_generate_children_with_insights(current_option, current_db_ben
     #     assistant_reply = file.read()
     # pattern = re.compile(r"```([\s\S]*?)```")
     # matches = pattern.findall(assistant_reply)
-    assert len(actions.actions) == 3, "Expected exactly 3 child options."
+    assert len(actions.actions) == candidate_count(), f"Expected exactly {candidate_count()} child options."
     # Extract the child options and their reasoning
     nodes = []
     for action in actions.actions:
@@ -257,6 +301,9 @@ def invoke_llm_to_generate_children_with_insights(current_option, current_db_ben
             db_option_changes=option_changes,
             db_bench_changes=db_bench_option_changes,
         )
+        node.prior = action.prior
+        if constants.OPTION_SCHEDULE:
+            node.option_schedule = parse_option_schedule(action.option_schedule)
         child_opt_file = f"{node.id}.ini"
         clean_options_file, changed_value_dict, db_bench_args = (
             cleanup_options_file_node_with_structured_change(
@@ -272,6 +319,8 @@ def invoke_llm_to_generate_children_with_insights(current_option, current_db_ben
         node.file_path = os.path.join(base_dir, child_opt_file)
         nodes.append(node)
 
+    if constants.SURROGATE:
+        nodes = screen_candidates(nodes, current_node, children_count())
     return nodes  # Example options
 
 
@@ -582,17 +631,133 @@ def invoke_llm_with_insights_and_examples(option, insights, examples, device_inf
 
     return nodes
 
-def run_benchmark(node_id, root):
-    return benchmark(node_id, root)
-    # options = node.clean_options
-    # reasoning = node.reasoning
-    # output_folder_dir = constants.OUTPUT_PATH
-    # os.makedirs(output_folder_dir, exist_ok=True)
-    # db_path = path_of_db() + f"/{node.id}"
-    # os.makedirs(db_path, exist_ok=True)
-    # is_error, benchmark_results, average_cpu_usage, average_memory_usage, options = spm.benchmark_mcts(
-    #         db_path, options, output_folder_dir, reasoning, None, 0, None, [], [], node.file_path)
-    # return benchmark_results  # Example score string
+def reuse_transposition(child, original):
+    """
+    Give a child the results of the node that already measured the same configuration.
+    """
+    logger.info(f"Child node {child.id} has the same configuration as node {original.id}, reusing its benchmark")
+    child.score = original.score
+    child.text_output = getattr(original, "text_output", None)
+    child.interval_series = original.interval_series
+    child.fidelity = original.fidelity
+    original.visits += 1
+
+def evaluate_children(children, root, checkpoint=None, state=None):
+    """
+    Benchmark the unvisited children and count a visit for every child.
+    Unvisited siblings are independent, so they are handed to the benchmark
+    runner together and run in parallel when PARALLEL_SLOTS > 1.
+    A configuration already measured in the tree, or duplicated among the
+    siblings, is benchmarked only once. Only full-size results are reused by
+    later children, screening results of successive halving and hot swap are not, and with
+    inherited database checkpoints only by children continuing from the same node. A child that has a score but no visit
+    was benchmarked before the search was resumed and is not run again.
+    With SUCCESSIVE_HALVING, the children are screened with short runs and only the best run at full size.
+    With HOT_SWAP, siblings that only change mutable options run as segments of one run of their parent.
+    With a checkpoint, the tree is saved as soon as each child finishes, and
+    the visits are saved together with the `state` of the search loop.
+    """
+    transpositions = root.transpositions
+    if root.config_hash is None:
+        root.config_hash = configuration_hash(root.full_option, root.db_bench_option)
+        transpositions.setdefault(transposition_key(root), root)
+
+    pending = []
+    duplicates = []
+    # Siblings share the benchmark of their first duplicate, whatever its fidelity
+    siblings = {}
+    for child in children:
+        if child.visits != 0 or child.score is not None:
+            continue
+        child.config_hash = configuration_hash(child.full_option, child.db_bench_option, child.option_schedule)
+        key = transposition_key(child)
+        original = transpositions.get(key) or siblings.get(key)
+        if original is None:
+            siblings[key] = child
+            pending.append(child)
+        else:
+            duplicates.append((child, original))
+
+    for child in pending:
+        logger.info(f"Processing child node: {child.id}")
+    pending_by_id = {child.id: child for child in pending}
+    result_lock = threading.Lock()
+
+    def record_result(node_id, result):
+        child = pending_by_id[node_id]
+        with result_lock:
+            child.score, child.text_output = result
+            backpropagate(child, root)
+            if child.fidelity is None or child.fidelity >= 1:
+                transpositions.setdefault(transposition_key(child), child)
+            if checkpoint is not None:
+                checkpoint.save(root)
+
+    if constants.HOT_SWAP:
+        hot_swap = [child for child in pending if hot_swap_changes(child) is not None]
+        # A single child gains nothing over its own run
+        if len(hot_swap) >= 2:
+            benchmark_hot_swap([child.id for child in hot_swap], root, record_result)
+            pending = [child for child in pending if hot_swap_changes(child) is None]
+
+    if constants.SUCCESSIVE_HALVING:
+        successive_halving([child.id for child in pending], root, record_result)
+    else:
+        benchmark_nodes([child.id for child in pending], root, record_result)
+    for child, original in duplicates:
+        reuse_transposition(child, original)
+        backpropagate(child, root)
+    for child in children:
+        child.visits += 1
+    if checkpoint is not None:
+        checkpoint.save(root, **(state or {}))
+
+def decide_next_node(root, insights=None):
+    """
+    Choose the node to explore next, with the tree policy or by asking the LLM.
+    """
+    if constants.SELECTION_POLICY != "llm":
+        return select_node(root)
+    if insights is None:
+        return ask_llm_to_evaluate_and_decide(root)
+    return ask_llm_to_evaluate_and_decide_with_insights(root, insights)
+
+def root_evaluated(checkpoint, step):
+    """
+    Whether the children of the root were evaluated in this iteration before the search was interrupted.
+    """
+    phase = checkpoint.state.get("phase") or {}
+    return phase.get("step") == step
+
+def visit_next_node(root, checkpoint, step, insights=None):
+    """
+    Decide the node to explore next and count its visit, once per iteration.
+    The decision is saved with the visit, so a resumed iteration goes on with it instead of deciding again.
+    """
+    phase = checkpoint.state.get("phase") or {}
+    if phase.get("step") == step and phase.get("name") == "decided":
+        next_node = get_node_by_id(root, phase["node"])
+        logger.info(f"Resuming with the next node: {next_node.id}")
+        return next_node
+    logger.info("Asking LLM to evaluate scores and decide the next node.")
+    next_node, explore_reason = decide_next_node(root, insights)
+    logger.info(f"Next node to explore: {next_node.id}")
+    logger.info(f"Reason for exploring: {explore_reason}")
+    # Simulate visiting the chosen node
+    next_node.visits += 1
+    next_node.add_branch_reason(explore_reason)
+    checkpoint.save(root, phase={"step": step, "name": "decided", "node": next_node.id})
+    return next_node
+
+def decide_best_node(root, insights=None):
+    """
+    Choose the best node of the search, the measured best with a tree policy or by asking the LLM.
+    """
+    if constants.SELECTION_POLICY != "llm":
+        return best_measured_node(root), "Highest measured throughput"
+    if insights is None:
+        return ask_llm_to_evaluate_and_decide(root)
+    return ask_llm_to_evaluate_and_decide_with_insights(root, insights)
 
 def ask_llm_to_evaluate_and_decide(root):
     """
@@ -850,53 +1015,62 @@ def invoke_llm_for_insights_reflection_and_refine(memory, examples, records_file
             raise ValueError(f"Unknown operation: {insight_decision.operation}")
 
 
-def mcts(root_option, reasoning, benchmark_results, device_information, max_iterations=3):
-    root = Node(
-        full_option=root_option,
-        reasoning=reasoning,
-        parent=None,
-        children=[],
-        visits=0,
-        score=benchmark_results,
-    )
+def start_search(search, resume, root_option, reasoning, benchmark_results):
+    """
+    Create the root of a new search and checkpoint its database, or rebuild the tree of an interrupted one from its checkpoint.
+    Returns the root and the checkpoint the search keeps up to date.
+    """
+    checkpoint = TreeCheckpoint(constants.TREE_CHECKPOINT_FILE_DIR, search)
+    if resume:
+        root, state = load_tree_checkpoint(resume, search)
+        checkpoint.state.update(state)
+    else:
+        root = Node(
+            full_option=root_option,
+            reasoning=reasoning,
+            parent=None,
+            children=[],
+            visits=0,
+            score=benchmark_results,
+        )
+        # The root is the reference of the rewards
+        backpropagate(root, root)
+        # main benchmarked the root in path_of_db(), the children of the root continue from its database
+        save_node_checkpoint(root.id, path_of_db())
+    checkpoint.save(root)
+    return root, checkpoint
 
-    for it in range(max_iterations):
-      
-        # 1. Expand root by asking LLM to generate child nodes
-        logger.info(f"Current iteration: {it}")
-        if root.is_leaf():
-            childs = invoke_llm_to_generate_children(
-                root.full_option,
-                root.db_bench_option,
-                device_information,
-                root.score,
-                root,
-            )
-            for child in childs:
-                child.parent = root
-                root.add_child(child)
+def mcts(root_option, reasoning, benchmark_results, device_information, max_iterations=3, resume=None):
+    root, checkpoint = start_search("mcts", resume, root_option, reasoning, benchmark_results)
 
-        # 2. Run benchmarks for all child nodes to generate score strings
-        for child in root.children:
-            logger.info(f"Processing child node: {child.id}")
-            if child.visits == 0:  # Only process unvisited nodes
+    # An interrupted iteration is run again from its last saved phase, skipping the children already benchmarked
+    for it in range(checkpoint.state.get("iteration", 0), max_iterations):
+        step = str(it)
 
-                child.score, child.text_output = run_benchmark(child.id, root)
+        # 1. Expand root by asking LLM to generate child nodes
+        logger.info(f"Current iteration: {it}")
+        if not root_evaluated(checkpoint, step):
+            if root.is_leaf():
+                childs = invoke_llm_to_generate_children(
+                    root.full_option,
+                    root.db_bench_option,
+                    device_information,
+                    root.score,
+                    root,
+                )
+                for child in childs:
+                    child.parent = root
+                    root.add_child(child)
+                checkpoint.save(root)
 
-                child.visits += 1
-            else:
-                child.visits += 1
+            # 2. Run benchmarks for all child nodes to generate score strings
+            evaluate_children(root.children, root, checkpoint, state={"phase": {"step": step, "name": "evaluated"}})
 
         # for debugging
         # exit(1)
         # 3. Ask LLM to evaluate scores and decide the next node
-        logger.info("Asking LLM to evaluate scores and decide the next node.")
-        next_node, explore_reason = ask_llm_to_evaluate_and_decide(root)
-        logger.info(f"Next node to explore: {next_node.id}")
-        logger.info(f"Reason for exploring: {explore_reason}")
         # 4. Simulate visiting the chosen node
-        next_node.visits += 1
-        next_node.add_branch_reason(explore_reason)
+        next_node = visit_next_node(root, checkpoint, step)
 
         # Optionally, expand the chosen node by generating its children
         if next_node.is_leaf():
@@ -912,55 +1086,50 @@ def mcts(root_option, reasoning, benchmark_results, device_information, max_iter
                 next_node.add_child(child)
         else:
             # If the chosen node is not a leaf, we can also benchmark its children
-            for child in next_node.children:
-                if child.visits == 0:  # Only process unvisited nodes
-                    child.score, child.text_output = run_benchmark(child.id, root)
-                    child.visits += 1
-                else:
-                    child.visits += 1
+            evaluate_children(next_node.children, root, checkpoint, state={"iteration": it + 1, "phase": None})
+        checkpoint.save(root, iteration=it + 1, phase=None)
 
 
     
     # After all iterations, ask LLM to determine the best option overall
-    best_node, explore_reason = ask_llm_to_evaluate_and_decide(root)
+    # while the insights are collected from the records, both requests only read the tree
     collect_records_from_tree(root, constants.RECORDS_FILE_DIR)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        decision = executor.submit(decide_best_node, root)
+        insights = executor.submit(invoke_llm_to_collect_insights_from_records, constants.RECORDS_FILE_DIR)
+        best_node, explore_reason = decision.result()
+        insights.result()
     # Dump the tree
     base_dir = os.path.dirname(constants.OPTIONS_FILE_DIR)
     with open(os.path.join(base_dir, "treedump.pkl"), "wb") as f:
         pickle.dump(root, f)
-        
-
-    invoke_llm_to_collect_insights_from_records(constants.RECORDS_FILE_DIR)
 
     return best_node
 
-def insights_driven_mcts(option, reasoning, memory, device_information, results, max_iterations, refine_flag, insights_num, examples_num, refine_num):
-    root = Node(full_option=option, reasoning=reasoning, parent=None, children=[], visits=0, score=results)
+def insights_driven_mcts(option, reasoning, memory, device_information, results, max_iterations, refine_flag, insights_num, examples_num, refine_num, resume=None):
+    root, checkpoint = start_search("insights_driven_mcts", resume, option, reasoning, results)
+    # An interrupted iteration is run again from its last saved phase, skipping the children already benchmarked
+    start_round = checkpoint.state.get("round", 0)
+    start_iteration = checkpoint.state.get("iteration", 0)
     best_node = None
     if refine_flag:
-        for i in range(refine_num):
+        for i in range(start_round, refine_num):
             insights, examples = memory.search(insights_num, examples_num)
-            for _ in range(max_iterations):
-                # 1. Expand root by asking LLM to generate child nodes
-                if root.is_leaf():
-                    childs = invoke_llm_to_generate_children_with_insights(root.full_option, root.db_bench_option, device_information, root.score, root, insights)
-                    for child in childs:
-                        child.parent = root
-                        root.add_child(child)
-                # 2. Run benchmarks for all child nodes to generate score strings
-                for child in root.children:
-                    logger.info(f"Processing child node: {child.id}")
-                    if child.visits == 0:
-                        child.score, child.text_output = run_benchmark(child.id, root)
-                        child.visits += 1
-                    else:
-                        child.visits += 1
+            for it in range(start_iteration if i == start_round else 0, max_iterations):
+                step = f"{i}.{it}"
+                if not root_evaluated(checkpoint, step):
+                    # 1. Expand root by asking LLM to generate child nodes
+                    if root.is_leaf():
+                        childs = invoke_llm_to_generate_children_with_insights(root.full_option, root.db_bench_option, device_information, root.score, root, insights)
+                        for child in childs:
+                            child.parent = root
+                            root.add_child(child)
+                        checkpoint.save(root)
+                    # 2. Run benchmarks for all child nodes to generate score strings
+                    evaluate_children(root.children, root, checkpoint, state={"phase": {"step": step, "name": "evaluated"}})
                 # 3. Ask LLM to evaluate scores and decide the next node
-                logger.info("Asking LLM to evaluate scores and decide the next node with insights.")
-                next_node, explore_reason = ask_llm_to_evaluate_and_decide_with_insights(root, insights)
                 # 4. Simulate visiting the chosen node
-                next_node.visits += 1
-                next_node.add_branch_reason(explore_reason)
+                next_node = visit_next_node(root, checkpoint, step, insights)
                 # Optionally, expand the chosen node by generating its children
                 if next_node.is_leaf():
                     childs = invoke_llm_to_generate_children_with_insights(root.full_option, root.db_bench_option, device_information, root.score, root, insights)
@@ -969,44 +1138,37 @@ def insights_driven_mcts(option, reasoning, memory, device_information, results,
                         next_node.add_child(child)
                 else:
                     # If the chosen node is not a leaf, we can also benchmark its children
-                    for child in next_node.children:
-                        logger.info(f"Processing child node: {child.id}")
-                        if child.visits == 0:
-                            child.score, child.text_output = run_benchmark(child.id, root)
-                            child.visits += 1
-                        else:
-                            child.visits += 1
-            # After all iterations, ask LLM to determine the best option overall
-            best_node, _ = ask_llm_to_evaluate_and_decide_with_insights(root, insights)
+                    evaluate_children(next_node.children, root, checkpoint, state={"round": i, "iteration": it + 1, "phase": None})
+                checkpoint.save(root, round=i, iteration=it + 1, phase=None)
+            # After all iterations, ask LLM to determine the best option overall while reflecting on the insights
             collect_records_from_tree(root, constants.RECORDS_FILE_DIR)
             base_dir = os.path.dirname(constants.OPTIONS_FILE_DIR)
             with open(os.path.join(base_dir, "treedump.pkl"), "wb") as f:
                 pickle.dump(root, f)
-            invoke_llm_for_insights_reflection_and_refine(memory, examples, constants.RECORDS_FILE_DIR)
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                decision = executor.submit(decide_best_node, root, insights)
+                reflection = executor.submit(invoke_llm_for_insights_reflection_and_refine, memory, examples, constants.RECORDS_FILE_DIR)
+                best_node, _ = decision.result()
+                reflection.result()
+            checkpoint.save(root, round=i + 1, iteration=0)
 
     else:
         insights, examples = memory.search(insights_num, examples_num)
-        for _ in range(max_iterations):
-            # 1. Expand root by asking LLM to generate child nodes
-            if root.is_leaf():
-                childs = invoke_llm_to_generate_children_with_insights(root.full_option, root.db_bench_option, device_information, root.score, root, insights)
-                for child in childs:
-                    child.parent = root
-                    root.add_child(child)
-            # 2. Run benchmarks for all child nodes to generate score strings
-            for child in root.children:
-                logger.info(f"Processing child node: {child.id}")
-                if child.visits == 0:
-                    child.score, child.text_output = run_benchmark(child.id, root)
-                    child.visits += 1
-                else:
-                    child.visits += 1
+        for it in range(start_iteration, max_iterations):
+            step = str(it)
+            if not root_evaluated(checkpoint, step):
+                # 1. Expand root by asking LLM to generate child nodes
+                if root.is_leaf():
+                    childs = invoke_llm_to_generate_children_with_insights(root.full_option, root.db_bench_option, device_information, root.score, root, insights)
+                    for child in childs:
+                        child.parent = root
+                        root.add_child(child)
+                    checkpoint.save(root)
+                # 2. Run benchmarks for all child nodes to generate score strings
+                evaluate_children(root.children, root, checkpoint, state={"phase": {"step": step, "name": "evaluated"}})
             # 3. Ask LLM to evaluate scores and decide the next node
-            logger.info("Asking LLM to evaluate scores and decide the next node with insights.")
-            next_node, explore_reason = ask_llm_to_evaluate_and_decide_with_insights(root, insights)
             # 4. Simulate visiting the chosen node
-            next_node.visits += 1
-            next_node.add_branch_reason(explore_reason)
+            next_node = visit_next_node(root, checkpoint, step, insights)
             # Optionally, expand the chosen node by generating its children
             if next_node.is_leaf():
                 childs = invoke_llm_to_generate_children_with_insights(root.full_option, root.db_bench_option, device_information, root.score, root, insights)
@@ -1015,20 +1177,18 @@ def insights_driven_mcts(option, reasoning, memory, device_information, results,
                     next_node.add_child(child)
             else:
                 # If the chosen node is not a leaf, we can also benchmark its children
-                for child in next_node.children:
-                    logger.info(f"Processing child node: {child.id}")
-                    if child.visits == 0:
-                        child.score, child.text_output = run_benchmark(child.id, root)
-                        child.visits += 1
-                    else:
-                        child.visits += 1
-        # After all iterations, ask LLM to determine the best option overall
-        best_node, _ = ask_llm_to_evaluate_and_decide_with_insights(root, insights)
+                evaluate_children(next_node.children, root, checkpoint, state={"iteration": it + 1, "phase": None})
+            checkpoint.save(root, iteration=it + 1, phase=None)
+        # After all iterations, ask LLM to determine the best option overall while collecting the insights
         collect_records_from_tree(root, constants.RECORDS_FILE_DIR)
         base_dir = os.path.dirname(constants.OPTIONS_FILE_DIR)
         with open(os.path.join(base_dir, "treedump.pkl"), "wb") as f:
             pickle.dump(root, f)
-        invoke_llm_to_collect_insights_from_records(constants.RECORDS_FILE_DIR)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            decision = executor.submit(decide_best_node, root, insights)
+            collection = executor.submit(invoke_llm_to_collect_insights_from_records, constants.RECORDS_FILE_DIR)
+            best_node, _ = decision.result()
+            collection.result()
 
     return best_node
 
@@ -1,4 +1,5 @@
 import json
+from collections import deque
 from utils import constants
 import os
 from data_model.config import INIConfig
@@ -6,6 +7,7 @@ from data_model.config import INIConfig
 from data_model.db_bench_options import DBBenchOptions
 from typing import Optional, List
 from num2words import num2words
+from rocksdb.db_checkpoint import inherited_from
 
 class Insight:
     def __init__(self, content, property, confidence):
@@ -61,6 +63,19 @@ class Node:
         self.id = id(self)  # Unique identifier for this node
         self.file_path = None  # Path to associated file, if any
         self.branch_reasons = []
+        self.config_hash = None  # Hash of the canonical options and db_bench arguments
+        self.transpositions = {}  # Kept on the root: transposition_key -> first node benchmarked at full size
+        self.nodes = {}  # Kept on the root: node id -> descendant node, see get_node_by_id
+        self.option_schedule = None  # [(offset seconds, {option: value})] pushed to db_bench while the node runs
+        self.fidelity = None  # Fraction of the full-size run of the last benchmark, below 1 for successive halving screening runs and hot swap segments
+        # Tree policy statistics, see search/tree_policy.py
+        self.prior = None  # LLM prior probability that this child improves on its parent
+        self.reward = None  # Throughput relative to the root
+        self.value_sum = 0.0  # Sum of the rewards of the benchmarked nodes of this subtree
+        self.value_count = 0  # Number of benchmarked nodes of this subtree
+        self.max_reward = 0.0  # Best reward of this subtree
+        # Per-interval ops/sec of the last benchmark, the baseline for early stopping the children
+        self.interval_series = score["ops_per_second_graph"][1] if isinstance(score, dict) and "ops_per_second_graph" in score else None
         # self.clean_options = None  # Cleaned/processed version of options
 
     def add_branch_reason(self, branch_reason):
@@ -75,14 +90,29 @@ class Node:
         """
         return len(self.children) == 0
 
+    def tree_root(self):
+        """
+        Find the root of the tree this node belongs to.
+
+        Returns:
+            Node: The ancestor without a parent
+        """
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node
+
     def add_child(self, child):
         """
-        Add a child node to this node.
+        Add a child node to this node and index it, with its subtree, on the root.
 
         Args:
             child: Node object to add as a child
         """
         self.children.append(child)
+        index = self.tree_root().nodes
+        for node in iter_bfs(child):
+            index[node.id] = node
 
     def digest(self):
         """
@@ -161,12 +191,46 @@ class Node:
             "children_count": len(self.children),
         }    
 
+def iter_bfs(root):
+    """
+    Iterate over the nodes of a tree in BFS order.
+
+    Args:
+        root (Node): The root node to start the traversal.
+
+    Yields:
+        Node: The nodes, level by level.
+    """
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        yield node
+        queue.extend(node.children)
+
+
+def iter_dfs(root):
+    """
+    Iterate over the nodes of a tree in DFS pre-order, without recursion.
+
+    Args:
+        root (Node): The root node to start the traversal.
+
+    Yields:
+        Node: Every node before its children, the children in insertion order.
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+
 def get_node_by_id(root, target_id):
     """
-    Find a node with the exact `target_id` by checking all nodes in the tree.
+    Find a node with the exact `target_id` in the id index kept on the root.
 
     Args:
-        root (Node): The root node to start the search.
+        root (Node): The root node of the tree.
         target_id (int): The unique ID of the node to search for.
 
     Returns:
@@ -174,11 +238,22 @@ def get_node_by_id(root, target_id):
     """
     if root.id == target_id:
         return root
-    for child in root.children:
-        result = get_node_by_id(child, target_id)
-        if result:
-            return result
-    return None
+    return root.nodes.get(target_id)
+
+
+def transposition_key(node):
+    """
+    Key of a node in the transposition table kept on the root.
+    A node that continues from the database checkpoint of its parent only shares
+    the result of the same configuration continuing from the same node.
+
+    Args:
+        node (Node): A node with its config_hash.
+
+    Returns:
+        tuple: The configuration hash and the id of the node the database is inherited from, or None.
+    """
+    return node.config_hash, inherited_from(node, constants.TEST_NAME)
 
 
 def bfs_collect_digests(root):
@@ -191,13 +266,7 @@ def bfs_collect_digests(root):
     Returns:
         list: A list of digests from all nodes in BFS order.
     """
-    queue = [root]
-    digests = []
-    while queue:
-        current_node = queue.pop(0)
-        digests.append(current_node.digest())
-        queue.extend(current_node.children)
-    return digests
+    return [node.digest() for node in iter_bfs(root)]
 
 
 def bfs_collect_json_digests(root):
@@ -210,32 +279,21 @@ def bfs_collect_json_digests(root):
     Returns:
         list: A list of digests from all nodes in BFS order.
     """
-    queue = [root]
-    digests = []
-    while queue:
-        current_node = queue.pop(0)
-        digests.append(current_node.digest_json())
-        queue.extend(current_node.children)
-    return digests
+    return [node.digest_json() for node in iter_bfs(root)]
 
 
 
 def collect_records_from_tree(node, records_file_path):
     """
     Perform a DFS traversal to collect the records of all nodes in the tree.
+    The records are appended through one buffered file handle.
 
     Args:
         node (Node): The root node to start the traversal.
         records_file_path (str): The file path to store the records.
 
     Returns:
-        list: A list of records from all nodes in DFS order.
+        None
     """
-    if not os.path.exists(records_file_path):
-        with open(records_file_path, "w") as f:  # Creates an empty file
-            pass  # No need to write anything, just ensures file is created
     with open(records_file_path, "a") as f:
-        json_record = json.dumps(node.digest_json())
-        f.write(json_record + "\n")
-        for child in node.children:
-            collect_records_from_tree(child, records_file_path)
+        f.writelines(json.dumps(current_node.digest_json()) + "\n" for current_node in iter_dfs(node))
@@ -0,0 +1,314 @@
+import ast
+import glob
+import json
+import math
+import os
+
+import numpy as np
+
+from options_files.ops_options_file import parse_option_file_to_dict, parse_db_bench_args_to_dict
+from utils.constants import TEST_NAME, RECORDS_FILE_DIR, SURROGATE_RECORDS, SURROGATE_MIN_SAMPLES, SURROGATE_KAPPA
+from utils.utils import log_update
+from utils.results_store import results_store
+
+# Predicted metrics, both modelled in log space
+TARGETS = ("ops_per_sec", "p99_micros")
+
+
+def parse_score(score):
+    '''
+    Recover the benchmark results dictionary from a node score
+
+    Parameters:
+    - score (str or dict): The score of a node, str(benchmark_results) followed by the resource usage lines
+
+    Returns:
+    - dict: The benchmark results, None if the score cannot be parsed
+    '''
+    if isinstance(score, dict):
+        return score
+    if not isinstance(score, str):
+        return None
+    try:
+        results = ast.literal_eval(score.split("\n", 1)[0])
+    except (ValueError, SyntaxError):
+        return None
+    return results if isinstance(results, dict) else None
+
+
+def encode_value(value):
+    value = str(value).strip().lower()
+    if value in ("true", "false"):
+        return float(value == "true")
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    # Sizes and counts span many orders of magnitude
+    return math.copysign(math.log1p(abs(number)), number)
+
+
+def config_features(full_option, db_bench_option):
+    '''
+    Encode a configuration as a sparse feature dictionary
+
+    Numeric and boolean values become one feature each, other values a one-hot "key=value" feature.
+
+    Parameters:
+    - full_option (str): The options file
+    - db_bench_option (list): The db_bench arguments
+
+    Returns:
+    - dict: The features of the configuration
+    '''
+    values = {}
+    if full_option:
+        for section, options in parse_option_file_to_dict(full_option).items():
+            for key, value in options.items():
+                values[f"{section}.{key}"] = value
+    for key, value in parse_db_bench_args_to_dict(db_bench_option or []).items():
+        values[f"db_bench.{key}"] = value
+
+    features = {}
+    for name, value in values.items():
+        encoded = encode_value(value)
+        if encoded is None:
+            features[f"{name}={str(value).strip()}"] = 1.0
+        else:
+            features[name] = encoded
+    return features
+
+
+def missing_value(name):
+    # An absent one-hot feature is 0, an absent option is unknown
+    return 0.0 if "=" in name else np.nan
+
+
+def sample_targets(results):
+    # Successive halving screening runs are not comparable with full-size ones
+    if results is None or not results.get("ops_per_sec") or results.get("fidelity", 1) < 1:
+        return None
+    targets = {"ops_per_sec": math.log(results["ops_per_sec"])}
+    if results.get("p99_micros"):
+        targets["p99_micros"] = math.log(results["p99_micros"])
+    return targets
+
+
+def load_store_records(test_name=TEST_NAME):
+    '''
+    Load training samples of the previous runs from the results store
+
+    Parameters:
+    - test_name (str): Only benchmarks of this workload are used
+
+    Returns:
+    - dict: (features, targets) of every benchmarked node, by (run id, node id)
+    '''
+    store = results_store()
+    if store is None:
+        return {}
+    samples = {}
+    for row in store.benchmarked_configurations(test_name):
+        targets = sample_targets({"ops_per_sec": row["ops_per_sec"], "p99_micros": row["p99_micros"]})
+        features = config_features(row["options"], json.loads(row["db_bench_args"]))
+        samples[(row["run_id"], row["node_id"])] = (features, targets)
+    return samples
+
+
+def load_records(pattern=SURROGATE_RECORDS, test_name=TEST_NAME):
+    '''
+    Load training samples of the previous runs, from the results store if it has any,
+    otherwise from the records written by collect_records_from_tree
+    The records of the current run are skipped, its tree is used instead
+
+    Parameters:
+    - pattern (str): Glob of the records files
+    - test_name (str): Only records of this workload are used
+
+    Returns:
+    - dict: (features, targets) of every benchmarked node, by node id
+    '''
+    samples = load_store_records(test_name)
+    if samples:
+        return samples
+    for records_file_path in glob.glob(pattern):
+        if os.path.abspath(records_file_path) == os.path.abspath(RECORDS_FILE_DIR):
+            continue
+        with open(records_file_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record["benchmark_content"]["task_name"] != test_name:
+                    continue
+                targets = sample_targets(parse_score(record["benchmark_content"]["benchmark_result"]))
+                if targets is None or not isinstance(record["database_option"], str):
+                    continue
+                features = config_features(record["database_option"], record["database_benchmark_option"])
+                samples[(records_file_path, record["unique_id"])] = (features, targets)
+    return samples
+
+
+def samples_from_tree(root):
+    '''
+    Collect training samples from the benchmarked nodes of the current tree
+
+    Parameters:
+    - root (Node): The root of the tree
+
+    Returns:
+    - dict: (features, targets) of every benchmarked node, by node id
+    '''
+    samples = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children)
+        if node.fidelity is not None and node.fidelity < 1:
+            continue
+        targets = sample_targets(parse_score(node.score))
+        if targets is None or not isinstance(node.full_option, str):
+            continue
+        samples[node.id] = (config_features(node.full_option, node.db_bench_option), targets)
+    return samples
+
+
+class GaussianProcess:
+    """Gaussian-process regression with a squared exponential kernel on standardized inputs."""
+
+    def __init__(self, noise=0.05):
+        self.noise = noise
+
+    def kernel(self, a, b):
+        distances = np.sum(a ** 2, 1)[:, None] + np.sum(b ** 2, 1)[None, :] - 2 * a @ b.T
+        return np.exp(-0.5 * np.maximum(distances, 0) / self.length_scale ** 2)
+
+    def fit(self, x, y):
+        self.x = x
+        self.y_mean, self.y_std = y.mean(), y.std() or 1.0
+        # Median heuristic for the length scale
+        distances = np.sqrt(np.maximum(np.sum((x[:, None, :] - x[None, :, :]) ** 2, -1), 0))
+        self.length_scale = np.median(distances[distances > 0]) if np.any(distances > 0) else 1.0
+        k = self.kernel(x, x) + self.noise * np.eye(len(x))
+        self.cholesky = np.linalg.cholesky(k)
+        self.alpha = np.linalg.solve(self.cholesky.T, np.linalg.solve(self.cholesky, (y - self.y_mean) / self.y_std))
+        return self
+
+    def predict(self, x):
+        k = self.kernel(x, self.x)
+        mean = k @ self.alpha
+        v = np.linalg.solve(self.cholesky, k.T)
+        variance = np.maximum(1.0 + self.noise - np.sum(v ** 2, 0), 1e-12)
+        return mean * self.y_std + self.y_mean, np.sqrt(variance) * self.y_std
+
+
+class Surrogate:
+    """Predict the throughput and p99 latency of a configuration from the benchmarked ones."""
+
+    def __init__(self, min_samples=SURROGATE_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self.feature_names = []
+        self.models = {}
+
+    def matrix(self, feature_dicts):
+        x = np.array([[features.get(name, missing_value(name)) for name in self.feature_names] for features in feature_dicts], dtype=float)
+        # Options missing from a configuration take the training mean, i.e. 0 once standardized
+        x = (x - self.feature_mean) / self.feature_std
+        return np.nan_to_num(x, nan=0.0)
+
+    def fit(self, samples):
+        '''
+        Train one model per target
+
+        Parameters:
+        - samples (list): (features, targets) pairs
+
+        Returns:
+        - bool: True if there were enough samples to train the throughput model
+        '''
+        samples = list(samples)
+        if len(samples) < self.min_samples:
+            return False
+
+        names = sorted({name for features, _ in samples for name in features})
+        raw = np.array([[features.get(name, missing_value(name)) for name in names] for features, _ in samples], dtype=float)
+        # Constant features carry no information
+        with np.errstate(all="ignore"):
+            mean, std = np.nanmean(raw, 0), np.nanstd(raw, 0)
+        keep = np.nan_to_num(std) > 0
+        if not np.any(keep):
+            return False
+        self.feature_names = [name for name, kept in zip(names, keep) if kept]
+        self.feature_mean, self.feature_std = mean[keep], std[keep]
+
+        for target in TARGETS:
+            rows = [(features, targets[target]) for features, targets in samples if target in targets]
+            if len(rows) < self.min_samples:
+                continue
+            x = self.matrix([features for features, _ in rows])
+            y = np.array([value for _, value in rows])
+            self.models[target] = GaussianProcess().fit(x, y)
+        return "ops_per_sec" in self.models
+
+    def predict(self, features):
+        '''
+        Predict the metrics of a configuration
+
+        Parameters:
+        - features (dict): The features of the configuration
+
+        Returns:
+        - dict: (mean, standard deviation) of the log of every modelled target
+        '''
+        x = self.matrix([features])
+        predictions = {}
+        for target, model in self.models.items():
+            mean, std = model.predict(x)
+            predictions[target] = (float(mean[0]), float(std[0]))
+        return predictions
+
+
+def screen_candidates(candidates, current_node, keep):
+    '''
+    Keep the candidates with the highest predicted throughput before they are benchmarked
+
+    Candidates are ranked by the upper confidence bound of the log throughput, so configurations
+    far from everything measured so far are not discarded only because the model knows little about them.
+
+    Parameters:
+    - candidates (list): The candidate nodes, with their options file and db_bench arguments set
+    - current_node (Node): The node the candidates were generated from
+    - keep (int): The number of candidates to benchmark
+
+    Returns:
+    - list: The candidates to benchmark
+    '''
+    if len(candidates) <= keep:
+        return candidates
+
+    root = current_node
+    while root.parent is not None:
+        root = root.parent
+    samples = load_records()
+    samples.update(samples_from_tree(root))
+
+    surrogate = Surrogate()
+    if not surrogate.fit(samples.values()):
+        log_update(f"[SUR] {len(samples)} benchmarked configurations are not enough to train the surrogate, keeping the first {keep} candidates")
+        print(f"[SUR] Not enough benchmarked configurations to train the surrogate, keeping the first {keep} candidates")
+        return candidates[:keep]
+
+    ranked = []
+    for node in candidates:
+        predictions = surrogate.predict(config_features(node.full_option, node.db_bench_option))
+        mean, std = predictions["ops_per_sec"]
+        ranked.append((mean + SURROGATE_KAPPA * std, node))
+        p99 = f", p99 {math.exp(predictions['p99_micros'][0]):.1f} us" if "p99_micros" in predictions else ""
+        log_update(f"[SUR] Node {node.id}: predicted {math.exp(mean):.0f} ops/sec (x/÷ {math.exp(std):.2f}){p99}")
+
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    selected = [node for _, node in ranked[:keep]]
+    log_update(f"[SUR] Trained on {len(samples)} configurations, benchmarking {[node.id for node in selected]} and skipping {[node.id for _, node in ranked[keep:]]}")
+    print(f"[SUR] Benchmarking the {keep} most promising of {len(candidates)} candidates")
+    return selected
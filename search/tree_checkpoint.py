@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+
+from data_model.config import INIConfig
+from data_model.db_bench_options import DBBenchOptions
+from search.search_utils import Node, iter_bfs, transposition_key
+from utils.utils import log_update
+
+# Bumped whenever the layout of the checkpoint changes
+CHECKPOINT_VERSION = 1
+# Node attributes stored as they are, the relationships and the pydantic changes are stored separately
+NODE_FIELDS = [
+    "full_option", "db_option", "db_bench_option", "visits", "score", "reasoning", "file_path", "branch_reasons",
+    "config_hash", "option_schedule", "prior", "reward", "value_sum", "value_count", "max_reward", "interval_series",
+    "text_output", "fidelity",
+]
+
+
+def json_default(value):
+    # numpy arrays and scalars of the benchmark results
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+def node_record(node):
+    '''
+    Serialize the fields of a node, without its children
+
+    Parameters:
+    - node (Node): The node
+
+    Returns:
+    - dict: The fields of the node, with the id of its parent
+    '''
+    record = {field: getattr(node, field, None) for field in NODE_FIELDS}
+    record["id"] = node.id
+    record["parent_id"] = node.parent.id if node.parent is not None else None
+    record["db_option_changes"] = node.db_option_changes.model_dump() if node.db_option_changes is not None else None
+    record["db_bench_changes"] = node.db_bench_changes.model_dump() if node.db_bench_changes is not None else None
+    return record
+
+
+def tree_records(root):
+    # Parents come before their children, so the tree can be rebuilt in one pass
+    return [node_record(node) for node in iter_bfs(root)]
+
+
+def restore_node(record, parent):
+    node = Node(full_option=record["full_option"], reasoning=record["reasoning"], parent=parent)
+    for field in NODE_FIELDS:
+        setattr(node, field, record.get(field))
+    # The benchmark directories and options files are named after the original ids
+    node.id = record["id"]
+    if record.get("option_schedule"):
+        node.option_schedule = [(offset, changes) for offset, changes in record["option_schedule"]]
+    if isinstance(node.text_output, list):
+        node.text_output = tuple(node.text_output)
+    if record.get("db_option_changes") is not None:
+        node.db_option_changes = INIConfig.model_validate(record["db_option_changes"])
+    if record.get("db_bench_changes") is not None:
+        node.db_bench_changes = DBBenchOptions.model_validate(record["db_bench_changes"])
+    return node
+
+
+def rebuild_tree(records):
+    '''
+    Rebuild the Node graph of the records of a checkpoint
+
+    Parameters:
+    - records (list): The node records, parents before their children
+
+    Returns:
+    - Node: The root of the tree
+    '''
+    nodes = {}
+    root = None
+    for record in records:
+        parent = nodes.get(record["parent_id"])
+        node = restore_node(record, parent)
+        nodes[node.id] = node
+        if parent is None:
+            root = node
+        else:
+            parent.add_child(node)
+
+    # Configurations measured at full size before the checkpoint are not benchmarked again
+    for node in nodes.values():
+        if node.config_hash is not None and node.score is not None and (node.fidelity is None or node.fidelity >= 1):
+            root.transpositions.setdefault(transposition_key(node), node)
+    return root
+
+
+class TreeCheckpoint:
+    """Write the search tree and the position of the search loop to a JSON file after every change."""
+
+    def __init__(self, path, search, state=None):
+        self.path = path
+        self.search = search
+        # Position of the search loop, e.g. the number of finished iterations
+        self.state = dict(state or {})
+        self.lock = threading.Lock()
+
+    def save(self, root, **state):
+        '''
+        Write the checkpoint, replacing the previous one atomically
+
+        Parameters:
+        - root (Node): The root of the tree
+        - state: Updates of the position of the search loop
+
+        Returns:
+        - None
+        '''
+        with self.lock:
+            self.state.update(state)
+            checkpoint = {
+                "version": CHECKPOINT_VERSION,
+                "search": self.search,
+                "state": self.state,
+                "nodes": tree_records(root),
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w") as file:
+                json.dump(checkpoint, file, default=json_default, separators=(",", ":"))
+            os.replace(temporary_path, self.path)
+
+
+def load_tree_checkpoint(path, search):
+    '''
+    Load a checkpoint written by TreeCheckpoint
+
+    Parameters:
+    - path (str): The checkpoint file
+    - search (str): The search the checkpoint is expected to come from, mcts or insights_driven_mcts
+
+    Returns:
+    - tuple: (root, state) the root of the rebuilt tree and the position of the search loop
+    '''
+    with open(path, "r") as file:
+        checkpoint = json.load(file)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint {path} has version {checkpoint.get('version')}, version {CHECKPOINT_VERSION} is required")
+    if checkpoint["search"] != search:
+        raise ValueError(f"Checkpoint {path} was written by {checkpoint['search']}, it cannot resume {search}")
+
+    root = rebuild_tree(checkpoint["nodes"])
+    evaluated = sum(1 for record in checkpoint["nodes"] if record["score"] is not None)
+    log_update(f"[CKP] Resuming {search} from {path}: {len(checkpoint['nodes'])} nodes, {evaluated} evaluated, state {checkpoint['state']}")
+    print(f"[CKP] Resuming {search} from {path}: {len(checkpoint['nodes'])} nodes, {evaluated} evaluated")
+    return root, checkpoint["state"]
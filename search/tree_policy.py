@@ -0,0 +1,111 @@
+import math
+
+from search.surrogate import parse_score
+from utils.constants import SELECTION_POLICY, EXPLORATION_CONSTANT
+from utils.utils import log_update
+
+
+def node_throughput(node):
+    results = parse_score(node.score)
+    if results is None or not results.get("ops_per_sec"):
+        return None
+    return results["ops_per_sec"]
+
+
+def backpropagate(node, root):
+    '''
+    Record the reward of a benchmarked node in the node and all of its ancestors
+
+    The reward is the throughput relative to the root, 0 when the benchmark failed.
+    Nodes dropped by successive halving only have a short run on a smaller, more cache-resident database,
+    their throughput is not comparable with the full-size root and is left out of the statistics.
+
+    Parameters:
+    - node (Node): The benchmarked node
+    - root (Node): The root of the tree
+
+    Returns:
+    - float: The reward of the node, None for a node without a full-size run
+    '''
+    if node.fidelity is not None and node.fidelity < 1:
+        node.reward = None
+        return None
+
+    root_throughput = node_throughput(root)
+    throughput = node_throughput(node)
+    reward = throughput / root_throughput if throughput and root_throughput else 0.0
+    node.reward = reward
+
+    current = node
+    while current is not None:
+        current.value_sum += reward
+        current.value_count += 1
+        current.max_reward = max(current.max_reward, reward)
+        current = current.parent
+    return reward
+
+
+def selection_score(child, parent, scale):
+    # Mean reward normalized by the best reward in the tree, in [0, 1]
+    q = child.value_sum / child.value_count / scale
+    if SELECTION_POLICY == "puct":
+        siblings = [sibling for sibling in parent.children if sibling.value_count > 0]
+        priors = [sibling.prior for sibling in siblings if sibling.prior is not None]
+        # Children without an LLM prior share the mass evenly
+        prior = child.prior if child.prior is not None else (sum(priors) / len(priors) if priors else 1.0)
+        total = sum(sibling.prior if sibling.prior is not None else prior for sibling in siblings) or 1.0
+        return q + EXPLORATION_CONSTANT * (prior / total) * math.sqrt(parent.value_count) / (1 + child.value_count)
+    return q + EXPLORATION_CONSTANT * math.sqrt(math.log(parent.value_count) / child.value_count)
+
+
+def select_node(root):
+    '''
+    Descend the tree with the UCT or PUCT rule until a node without benchmarked children
+
+    Parameters:
+    - root (Node): The root of the tree
+
+    Returns:
+    - Node: The node to expand next
+    - str: Why the node was selected
+    '''
+    # The best reward of the tree is kept in the root by backpropagation
+    scale = root.max_reward if root.max_reward > 0 else 1.0
+    node = root
+    path = []
+    while True:
+        candidates = [child for child in node.children if child.value_count > 0]
+        if not candidates:
+            break
+        scores = [(selection_score(child, node, scale), child) for child in candidates]
+        score, child = max(scores, key=lambda item: item[0])
+        path.append(f"{child.id} ({SELECTION_POLICY} {score:.3f}, mean reward {child.value_sum / child.value_count:.3f}, {child.value_count} benchmarks)")
+        node = child
+
+    reason = f"Selected by the {SELECTION_POLICY} tree policy along " + " -> ".join([str(root.id)] + path)
+    log_update(f"[MCT] {reason}")
+    return node, reason
+
+
+def best_measured_node(root):
+    '''
+    Find the node with the highest measured throughput in a full-size run
+
+    Parameters:
+    - root (Node): The root of the tree
+
+    Returns:
+    - Node: The best node
+    '''
+    best_node, best_throughput = root, node_throughput(root) or 0
+    stack = list(root.children)
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children)
+        throughput = node_throughput(node)
+        # Short successive halving runs are not comparable with full-size ones
+        if node.fidelity is not None and node.fidelity < 1:
+            continue
+        if throughput is not None and throughput > best_throughput:
+            best_node, best_throughput = node, throughput
+    return best_node
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# utils.constants parses the command line and creates the output folders when it is imported,
+# the tests run with the default arguments and write to a temporary directory
+sys.argv = sys.argv[:1]
+TEST_DIR = tempfile.mkdtemp(prefix="infinituner_tests_")
+for name in ("OUTPUT_PATH", "RECORDS_PATH", "EXAMPLES_PATH", "INSIGHTS_PATH"):
+    os.environ.setdefault(name, os.path.join(TEST_DIR, name.lower()))
+    os.makedirs(os.environ[name], exist_ok=True)
+os.environ.setdefault("DB_PATH", os.path.join(TEST_DIR, "db"))
+os.environ.setdefault("RESULTS_STORE", "false")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(TEST_DIR, "llm_cache", "responses.sqlite"))
+# The OpenAI client is created when gpt.gpt_request is imported, the tests never send a request
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
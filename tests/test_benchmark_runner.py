@@ -0,0 +1,144 @@
+import os
+import stat
+import sys
+
+import pytest
+
+import rocksdb.parse_db_bench_output as parse_db_bench_output
+import search.benchmark_runner as benchmark_runner
+from search.search_utils import Node
+from utils.constants import DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME
+
+INTERVAL_SECONDS = 120
+
+# Prints the interval reports only when db_bench is asked for them, like db_bench does
+FAKE_DB_BENCH = f"""#!{sys.executable}
+import random
+import sys
+
+random.seed(0)
+if any(arg.startswith("--stats_interval_seconds=") and arg != "--stats_interval_seconds=0" for arg in sys.argv):
+    total = 0
+    for second in range(1, {INTERVAL_SECONDS} + 1):
+        ops = int(min(second, 20) * 5000 + random.uniform(-2000, 2000))
+        total += ops
+        print(f"2024/01/01-00:00:{{second:02d}} ... thread 0: ({{ops}},{{total}}) ops and ({{ops}}.0,{{total / second:.1f}}) ops/second in (1.000000,{{second}}.000000) seconds")
+print("fillrandom   :      10.000 micros/op 100000 ops/sec {INTERVAL_SECONDS}.000 seconds 12000000 operations;   11.1 MB/s")
+"""
+
+
+class StaticMonitor:
+    def __init__(self, cgroup_name):
+        self.cgroup_name = cgroup_name
+
+    def start_monitoring(self):
+        pass
+
+    def stop_monitoring(self):
+        return {
+            "average_cpu_usage_percent": 50.0,
+            "average_memory_usage_percent": 10.0,
+            "average_io_pressure_percent": 0.0,
+            "max_io_pressure_percent": 0.0,
+            "average_io_read_mib_per_sec": 0.0,
+            "average_io_write_mib_per_sec": 0.0,
+        }
+
+
+class NoCGroup:
+    def __init__(self, cgroup_name):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+@pytest.fixture
+def fake_db_bench(tmp_path, monkeypatch):
+    path = tmp_path / "db_bench"
+    path.write_text(FAKE_DB_BENCH)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(benchmark_runner, "DB_BENCH_PATH", str(path))
+    # No cgroups, cache flush or 10 second pause outside of the benchmark machine
+    monkeypatch.setattr(benchmark_runner, "CGroupManager", NoCGroup)
+    monkeypatch.setattr(benchmark_runner, "CGroupMonitor", StaticMonitor)
+    monkeypatch.setattr(benchmark_runner, "pre_tasks", lambda database_path, run_count: None)
+    return str(path)
+
+
+@pytest.fixture
+def tree(tmp_path):
+    with open(os.path.join(DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME)) as f:
+        options = f.read()
+    root = Node(full_option=options, reasoning="root", parent=None)
+    root.db_option = options
+    child = Node(full_option=options.replace("max_background_jobs=2", "max_background_jobs=4"), reasoning="child", parent=root)
+    child.db_option = child.full_option
+    child.db_bench_option = []
+    child.file_path = str(tmp_path / f"{child.id}.ini")
+    root.add_child(child)
+    return root, child
+
+
+def test_child_command_reports_intervals(tmp_path, monkeypatch):
+    loads = []
+    monkeypatch.setattr(benchmark_runner, "preload_database", lambda command, database_path: loads.append(command))
+    monkeypatch.setattr(benchmark_runner, "PRE_LOAD_DB_PATH", "")
+
+    command = benchmark_runner.generate_db_bench_command_node(
+        "db_bench", str(tmp_path / "db"), "", 0, "readrandom", str(tmp_path / "options.ini"))
+
+    assert "--stats_interval_seconds=1" in command
+    # The preload drops the trace file, the number of entries and the duration of the measured run
+    load = loads[0]
+    assert not any(arg.startswith(("--trace_file=", "--duration=")) for arg in load)
+    assert "--num=50000000" in load
+    assert f"--threads={benchmark_runner.NUM_THREADS}" in load
+
+
+def test_child_benchmark_records_interval_series(fake_db_bench, tree):
+    root, child = tree
+
+    results, _ = benchmark_runner.benchmark(child.id, root)
+
+    assert "error" not in benchmark_runner.parse_score(results)
+    assert len(child.interval_series) == INTERVAL_SECONDS
+
+
+def test_child_results_have_steady_state_fields(fake_db_bench, tree):
+    root, child = tree
+
+    results, _ = benchmark_runner.benchmark(child.id, root)
+
+    results = benchmark_runner.parse_score(results)
+    assert results["steady_state_ops_per_sec"] > 0
+    assert results["warmup_seconds"] > 0
+    assert results["steady_state_relative_ci"] is not None
+
+
+def test_steady_state_stops_child_run(fake_db_bench, tree, monkeypatch):
+    root, child = tree
+    monkeypatch.setattr(benchmark_runner, "STEADY_STATE", True)
+    monkeypatch.setattr(parse_db_bench_output, "STEADY_STATE", True)
+
+    results, _ = benchmark_runner.benchmark(child.id, root)
+
+    results = benchmark_runner.parse_score(results)
+    assert "steady state" in results["stopped_early"]
+    assert len(child.interval_series) < INTERVAL_SECONDS
+    # The score leaves the warmup out, like the score of a full run
+    assert results["ops_per_sec"] == int(results["steady_state_ops_per_sec"])
+    assert results["cumulative_ops_per_sec"] < results["ops_per_sec"]
+
+
+def test_full_run_is_scored_on_steady_state(fake_db_bench, tree, monkeypatch):
+    root, child = tree
+    monkeypatch.setattr(parse_db_bench_output, "STEADY_STATE", True)
+
+    results, _ = benchmark_runner.benchmark(child.id, root)
+
+    results = benchmark_runner.parse_score(results)
+    assert "stopped_early" not in results
+    assert results["cumulative_ops_per_sec"] == 100000
+    assert results["ops_per_sec"] == int(results["steady_state_ops_per_sec"])
+    assert abs(results["ops_per_sec"] - 100000) < 2000
@@ -0,0 +1,229 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import rocksdb.db_checkpoint as db_checkpoint
+import search.benchmark_runner as benchmark_runner
+import search.mcts as mcts
+import utils.constants as constants
+from search.search_utils import Node
+from search.surrogate import samples_from_tree
+from search.tree_checkpoint import load_tree_checkpoint
+from search.tree_policy import backpropagate
+
+
+def make_root():
+    root = Node(full_option="[DBOptions]\n  max_background_jobs=2\n", reasoning="", parent=None, score={"ops_per_sec": 1000})
+    root.db_bench_option = []
+    backpropagate(root, root)
+    return root
+
+
+def add_child(parent, options):
+    child = Node(full_option=options, reasoning="", parent=parent)
+    child.db_bench_option = []
+    parent.add_child(child)
+    return child
+
+
+def fake_runner(fidelity, benchmarked):
+    # Benchmark every node at the given fidelity, like successive_halving reports a node dropped at that rung
+    def run(node_ids, root, on_result=None):
+        results = []
+        for node_id in node_ids:
+            benchmarked.append(node_id)
+            node = root.nodes[node_id]
+            node.fidelity = fidelity
+            result = (str({"ops_per_sec": 2000, "fidelity": fidelity}), None)
+            on_result(node_id, result)
+            results.append(result)
+        return results
+    return run
+
+
+def test_screening_result_is_not_reused_by_later_children(monkeypatch):
+    benchmarked = []
+    monkeypatch.setattr(constants, "SUCCESSIVE_HALVING", True)
+    monkeypatch.setattr(mcts, "successive_halving", fake_runner(0.11, benchmarked))
+    root = make_root()
+    options = "[DBOptions]\n  max_background_jobs=4\n"
+    first, sibling = add_child(root, options), add_child(root, options)
+
+    mcts.evaluate_children(root.children, root)
+
+    # The duplicate sibling shares the screening run and is marked as such
+    assert benchmarked == [first.id]
+    assert sibling.score == first.score and sibling.fidelity == 0.11
+    assert sibling.value_count == 0
+
+    later = add_child(first, options)
+    mcts.evaluate_children(first.children, root)
+
+    assert benchmarked == [first.id, later.id]
+
+
+def test_full_size_result_is_reused(monkeypatch):
+    benchmarked = []
+    monkeypatch.setattr(constants, "SUCCESSIVE_HALVING", False)
+    monkeypatch.setattr(mcts, "benchmark_nodes", fake_runner(1.0, benchmarked))
+    root = make_root()
+    options = "[DBOptions]\n  max_background_jobs=4\n"
+    first = add_child(root, options)
+    mcts.evaluate_children(root.children, root)
+
+    later = add_child(first, options)
+    mcts.evaluate_children(first.children, root)
+
+    assert benchmarked == [first.id]
+    assert later.score == first.score
+
+
+class Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def search(tmp_path, monkeypatch):
+    monkeypatch.setattr(constants, "TREE_CHECKPOINT_FILE_DIR", str(tmp_path / "tree_checkpoint.json"))
+    monkeypatch.setattr(constants, "SELECTION_POLICY", "uct")
+    monkeypatch.setattr(constants, "SUCCESSIVE_HALVING", False)
+    monkeypatch.setattr(constants, "HOT_SWAP", False)
+    monkeypatch.setattr(mcts, "benchmark_nodes", fake_runner(1.0, []))
+    monkeypatch.setattr(mcts, "invoke_llm_to_collect_insights_from_records", lambda path: None)
+    generated = []
+
+    def generate_children(options, db_bench_options, device_information, results, node):
+        generated.append(node.id)
+        children = []
+        for jobs in (4, 8):
+            child = Node(full_option=f"[DBOptions]\n  max_background_jobs={jobs}\n  id={len(generated)}\n", reasoning="", parent=node)
+            child.db_bench_option = []
+            children.append(child)
+        return children
+
+    monkeypatch.setattr(mcts, "invoke_llm_to_generate_children", generate_children)
+
+    def run(resume=None):
+        return mcts.mcts("[DBOptions]\n  max_background_jobs=2\n", "", {"ops_per_sec": 1000}, "", max_iterations=1, resume=resume)
+
+    run.checkpoint = constants.TREE_CHECKPOINT_FILE_DIR
+    run.generated = generated
+    return run
+
+
+def resumed_tree(search):
+    root, _ = load_tree_checkpoint(search.checkpoint, "mcts")
+    return root
+
+
+def test_resume_after_evaluation_does_not_count_the_visits_again(search, monkeypatch):
+    decide_next_node = mcts.decide_next_node
+
+    def crash(root, insights=None):
+        raise Crash()
+
+    # Interrupted after the children of the root were benchmarked and saved
+    monkeypatch.setattr(mcts, "decide_next_node", crash)
+    with pytest.raises(Crash):
+        search()
+    assert [child.visits for child in resumed_tree(search).children] == [1, 1]
+
+    monkeypatch.setattr(mcts, "decide_next_node", decide_next_node)
+    search(resume=search.checkpoint)
+
+    # The chosen child is visited once more, the other one is not
+    assert sorted(child.visits for child in resumed_tree(search).children) == [1, 2]
+
+
+def test_resume_after_decision_keeps_the_decision(search, monkeypatch):
+    generate_children = mcts.invoke_llm_to_generate_children
+
+    def crash_on_second_expansion(options, db_bench_options, device_information, results, node):
+        if search.generated:
+            search.generated.append(node.id)
+            raise Crash()
+        return generate_children(options, db_bench_options, device_information, results, node)
+
+    # Interrupted while the chosen child was being expanded
+    monkeypatch.setattr(mcts, "invoke_llm_to_generate_children", crash_on_second_expansion)
+    with pytest.raises(Crash):
+        search()
+    chosen = search.generated[-1]
+
+    decisions = []
+    monkeypatch.setattr(mcts, "invoke_llm_to_generate_children", generate_children)
+    monkeypatch.setattr(mcts, "decide_next_node", lambda root, insights=None: decisions.append(root) or mcts.select_node(root))
+    search(resume=search.checkpoint)
+
+    root = resumed_tree(search)
+    assert decisions == []
+    assert search.generated[-1] == chosen
+    assert root.nodes[chosen].visits == 2
+    assert len(root.nodes[chosen].children) == 2
+
+
+def test_new_search_checkpoints_the_root_database(tmp_path, monkeypatch):
+    # main benchmarked the root in path_of_db(), next to the directories of the nodes
+    database_path = tmp_path / "db"
+    (database_path / "1234").mkdir(parents=True)
+    (database_path / "CURRENT").write_text("MANIFEST-000001\n")
+    (database_path / "000001.sst").write_text("data")
+    monkeypatch.setenv("DB_PATH", str(database_path))
+    monkeypatch.setattr(db_checkpoint, "DB_CHECKPOINT", "inherit")
+    monkeypatch.setattr(db_checkpoint, "LDB_PATH", str(tmp_path / "missing_ldb"))
+    monkeypatch.setattr(constants, "TREE_CHECKPOINT_FILE_DIR", str(tmp_path / "tree_checkpoint.json"))
+
+    root, _ = mcts.start_search("mcts", None, "[DBOptions]\n  max_background_jobs=2\n", "", {"ops_per_sec": 1000})
+    child = add_child(root, "[DBOptions]\n  max_background_jobs=4\n")
+
+    checkpoint_path = db_checkpoint.inherited_checkpoint(child, "readrandom")
+    assert checkpoint_path == db_checkpoint.db_checkpoint_path(root.id)
+    assert sorted(os.listdir(checkpoint_path)) == ["000001.sst", "CURRENT"]
+
+
+def test_inherited_result_is_only_reused_from_the_same_start(monkeypatch):
+    benchmarked = []
+    monkeypatch.setattr(constants, "SUCCESSIVE_HALVING", False)
+    monkeypatch.setattr(constants, "TEST_NAME", "readrandom")
+    monkeypatch.setattr(db_checkpoint, "DB_CHECKPOINT", "inherit")
+    monkeypatch.setattr(mcts, "benchmark_nodes", fake_runner(1.0, benchmarked))
+    root = make_root()
+    options = "[DBOptions]\n  max_background_jobs=4\n"
+    first, sibling = add_child(root, options), add_child(root, options)
+    mcts.evaluate_children(root.children, root)
+
+    # The sibling continues from the same database, the grandchild from the database of its parent
+    later = add_child(first, options)
+    mcts.evaluate_children(first.children, root)
+
+    assert benchmarked == [first.id, later.id]
+    assert sibling.score == first.score
+
+
+def test_hot_swap_segments_are_screening_results(monkeypatch):
+    monkeypatch.setattr(constants, "HOT_SWAP", True)
+    monkeypatch.setattr(constants, "SUCCESSIVE_HALVING", False)
+    monkeypatch.setattr(mcts, "benchmark_nodes", fake_runner(1.0, []))
+    # One sample per second for the parent segment and the two sibling segments
+    segment = benchmark_runner.HOT_SWAP_SEGMENT_SECONDS
+    output = SimpleNamespace(graph_times=list(range(3 * segment)), graph_ops=[3000] * (3 * segment), thread_samples=[[]])
+    monkeypatch.setattr(benchmark_runner, "db_bench_node", lambda *args, **kwargs: (output, 0, 0, None, {}))
+    with open(os.path.join(constants.DEFAULT_OPTION_FILE_DIR, constants.INITIAL_OPTIONS_FILE_NAME)) as f:
+        options = f.read()
+    root = make_root()
+    root.full_option = root.db_option = options
+    children = []
+    for jobs in (4, 8):
+        child = add_child(root, options.replace("max_background_jobs=2", f"max_background_jobs={jobs}"))
+        child.db_option = child.full_option
+        children.append(child)
+
+    mcts.evaluate_children(root.children, root)
+
+    for child in children:
+        assert 0 < child.fidelity < 1
+        assert eval(child.score.split("\n")[0])["fidelity"] == child.fidelity
+        assert child.value_count == 0
+        assert child not in root.transpositions.values()
+    assert samples_from_tree(root).keys() == {root.id}
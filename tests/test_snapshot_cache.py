@@ -0,0 +1,86 @@
+import os
+import sys
+
+import pytest
+
+import rocksdb.snapshot_cache as snapshot_cache
+from utils.constants import DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME
+
+# Writes a database of --num bytes and counts the loads, like a db_bench fillrandom
+FAKE_LOAD = """
+import os
+import sys
+
+args = dict(arg[2:].split("=", 1) for arg in sys.argv[2:] if "=" in arg)
+os.makedirs(args["db"], exist_ok=True)
+with open(os.path.join(args["db"], "CURRENT"), "w") as f:
+    f.write("MANIFEST-000001\\n")
+with open(os.path.join(args["db"], "000001.sst"), "wb") as f:
+    f.write(b"x" * int(args["num"]))
+with open(sys.argv[1], "a") as f:
+    f.write("load\\n")
+"""
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot_cache, "SNAPSHOT_CACHE", True)
+    monkeypatch.setattr(snapshot_cache, "SNAPSHOT_LOAD_OPTIONS", "candidate")
+    monkeypatch.setattr(snapshot_cache, "SNAPSHOT_CACHE_DIR", str(tmp_path / "snapshots"))
+    script = tmp_path / "load.py"
+    script.write_text(FAKE_LOAD)
+    loads = tmp_path / "loads.txt"
+    with open(os.path.join(DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME)) as f:
+        options = f.read()
+
+    def load(name, options=options, num=1000):
+        options_path = tmp_path / f"{name}.ini"
+        options_path.write_text(options)
+        database_path = tmp_path / "db" / name
+        command = [sys.executable, str(script), str(loads), f"--db={database_path}", f"--options_file={options_path}", f"--num={num}", "--benchmarks=fillrandom"]
+        snapshot_cache.preload_database(command, str(database_path))
+        return database_path
+
+    load.options = options
+    load.count = lambda: len(loads.read_text().splitlines()) if loads.exists() else 0
+    return load
+
+
+def test_candidates_loaded_with_other_options_get_their_own_snapshot(loader):
+    first = loader("first")
+    same = loader("same")
+    loader("second", loader.options.replace("max_background_jobs=2", "max_background_jobs=8"))
+
+    assert loader.count() == 2
+    assert (same / "000001.sst").stat().st_ino == (first / "000001.sst").stat().st_ino
+
+
+def test_initial_load_options_share_the_snapshot(loader, monkeypatch):
+    monkeypatch.setattr(snapshot_cache, "SNAPSHOT_LOAD_OPTIONS", "initial")
+    first = loader("first")
+    second = loader("second", loader.options.replace("write_buffer_size=67108864", "write_buffer_size=134217728"))
+
+    assert loader.count() == 1
+    assert (second / "000001.sst").stat().st_ino == (first / "000001.sst").stat().st_ino
+
+
+def test_least_recently_used_snapshot_is_evicted(loader, monkeypatch):
+    # Room for two snapshots of 1MB
+    monkeypatch.setattr(snapshot_cache, "SNAPSHOT_CACHE_BUDGET_GB", 2.5 / 1024)
+    size = 1024 * 1024
+    loader("a", num=size)
+    loader("b", num=size + 1)
+    # A hit makes "a" the most recently used
+    loader("a2", num=size)
+    loader("c", num=size + 2)
+
+    entries = os.listdir(snapshot_cache.SNAPSHOT_CACHE_DIR)
+    snapshots = [entry for entry in entries if not entry.endswith(".lock")]
+    assert len(snapshots) == 2
+    # The lock files of the evicted snapshots are deleted with them
+    assert sorted(entry for entry in entries if entry.endswith(".lock")) == sorted(f"{entry}.lock" for entry in snapshots)
+    loads = loader.count()
+    loader("a3", num=size)
+    assert loader.count() == loads
+    loader("b2", num=size + 1)
+    assert loader.count() == loads + 1
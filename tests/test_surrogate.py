@@ -0,0 +1,21 @@
+import os
+
+from search.search_utils import Node
+from search.surrogate import samples_from_tree
+from utils.constants import DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME
+
+
+def test_screening_runs_are_not_training_samples():
+    with open(os.path.join(DEFAULT_OPTION_FILE_DIR, INITIAL_OPTIONS_FILE_NAME)) as f:
+        options = f.read()
+    root = Node(full_option=options, reasoning="", parent=None, score={"ops_per_sec": 1000})
+    full = Node(full_option=options, reasoning="", parent=root, score=str({"ops_per_sec": 1100, "fidelity": 1.0}))
+    full.fidelity = 1.0
+    screened = Node(full_option=options, reasoning="", parent=root, score=str({"ops_per_sec": 5000, "fidelity": 0.11}))
+    screened.fidelity = 0.11
+    root.add_child(full)
+    root.add_child(screened)
+
+    samples = samples_from_tree(root)
+
+    assert set(samples) == {root.id, full.id}
@@ -0,0 +1,85 @@
+import struct
+
+from trace_analyzer.analyzer import TailTraceAnalyzer
+from trace_analyzer.trace_reader import TraceReader
+
+# Encoded the way rocksdb/trace_replay/trace_replay.cc writes the records
+
+
+def varint32(value):
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def length_prefixed(data):
+    return varint32(len(data)) + data
+
+
+def record(timestamp, trace_type, payload):
+    return struct.pack("<QBI", timestamp, trace_type, len(payload)) + payload
+
+
+def query(timestamp, trace_type, bits, *fields):
+    payload_map = sum(1 << bit for bit in bits)
+    return record(timestamp, trace_type, struct.pack("<Q", payload_map) + b"".join(fields))
+
+
+def write_trace(path):
+    # kTypeValue, kTypeColumnFamilyValue on column family 1 and kTypeDeletion
+    batch = (
+        struct.pack("<QI", 1, 3)
+        + b"\x01" + length_prefixed(b"key1") + length_prefixed(b"v" * 100)
+        + b"\x05" + varint32(1) + length_prefixed(b"key2") + length_prefixed(b"v" * 10)
+        + b"\x00" + length_prefixed(b"key3")
+    )
+    multi_get_cf_ids = struct.pack("<II", 0, 0)
+    multi_get_keys = length_prefixed(b"key4") + length_prefixed(b"key5")
+    records = [
+        record(1_000_000, 1, b"Trace Version: 0.2\tRocksDB Version: 8.8\tFormat: Timestamp OpType Payload\n"),
+        # kTraceWrite with kWriteBatchData
+        query(1_000_000, 3, [1], length_prefixed(batch)),
+        # kTraceGet with kGetCFID and kGetKey
+        query(2_000_000, 4, [2, 3], struct.pack("<I", 0), length_prefixed(b"key1")),
+        # kTraceIteratorSeek with kIterCFID, kIterKey and kIterLowerBound
+        query(3_000_000, 5, [4, 5, 6], struct.pack("<I", 0), length_prefixed(b"key2"), length_prefixed(b"key0")),
+        # kTraceIteratorSeekForPrev with kIterCFID and kIterKey
+        query(4_000_000, 6, [4, 5], struct.pack("<I", 0), length_prefixed(b"key3")),
+        # kTraceMultiGet with kMultiGetSize, kMultiGetCFIDs and kMultiGetKeys
+        query(5_000_000, 13, [8, 9, 10], struct.pack("<I", 2), length_prefixed(multi_get_cf_ids), length_prefixed(multi_get_keys)),
+        record(6_000_000, 2, b""),
+    ]
+    path.write_bytes(b"".join(records))
+
+
+def test_reader_decodes_a_rocksdb_trace(tmp_path):
+    trace_path = tmp_path / "tracefile"
+    write_trace(trace_path)
+    reader = TraceReader(str(trace_path))
+
+    accesses = list(reader.accesses())
+
+    assert reader.version == (0, 2)
+    assert reader.ended
+    assert accesses == [
+        (1_000_000, "put", b"key1", 100),
+        (1_000_000, "put", b"key2", 10),
+        (1_000_000, "delete", b"key3", 0),
+        (2_000_000, "get", b"key1", 0),
+        (3_000_000, "iterator_seek", b"key2", 0),
+        (4_000_000, "iterator_seekForPrev", b"key3", 0),
+        (5_000_000, "multiget", b"key4", 0),
+        (5_000_000, "multiget", b"key5", 0),
+    ]
+
+
+def test_tail_analyzer_counts_the_accesses(tmp_path):
+    trace_path = tmp_path / "tracefile"
+    write_trace(trace_path)
+    analyzer = TailTraceAnalyzer(str(trace_path), 6)
+
+    assert analyzer.update() == 8
+    assert len(analyzer.window_frame()) > 0
@@ -0,0 +1,24 @@
+from search.search_utils import Node
+from search.tree_policy import backpropagate, select_node
+
+
+def benchmarked_child(root, ops_per_sec, fidelity=None):
+    child = Node(full_option=f"child {ops_per_sec}", reasoning="", parent=root, score=str({"ops_per_sec": ops_per_sec}))
+    child.fidelity = fidelity
+    root.add_child(child)
+    backpropagate(child, root)
+    return child
+
+
+def test_low_fidelity_score_is_not_backpropagated():
+    root = Node(full_option="root", reasoning="", parent=None, score={"ops_per_sec": 1000})
+    backpropagate(root, root)
+    full = benchmarked_child(root, 1100, fidelity=1.0)
+    # A short run on a small preload looks much faster than it is
+    screened = benchmarked_child(root, 5000, fidelity=0.11)
+
+    assert screened.reward is None
+    assert screened.value_count == 0
+    assert root.max_reward == full.reward == 1.1
+    assert root.value_count == 2
+    assert select_node(root)[0] is full
@@ -1,15 +1,122 @@
 import os
 import subprocess
 from utils.utils import log_update
-from utils.constants import TRACE_ANALYZER_PATH, OUTPUT_PATH
+from utils.constants import TRACE_ANALYZER_PATH, OUTPUT_PATH, NATIVE_TRACE_ANALYZER
 from trace_analyzer.trace_converter import convert_txt_to_csv, convert_txt_to_csv_windows
-from trace_analyzer.trace_summarizer import generate_summary, generate_summary_windows, generate_summary_row
+from trace_analyzer.trace_summarizer import generate_summary, generate_summary_windows, generate_summary_row, generate_pattern_message, summarize_windows
+from trace_analyzer.trace_reader import TraceReader
+from trace_analyzer.trace_features import TraceFeatureExtractor
 import base64
 from gpt.gpt_request import send_gpt_request
 import re
 import json
 import pandas as pd
 
+# Window size of the per-window features, like -output_ml_features_windows_size
+TRACE_WINDOW_SECONDS = 10
+
+
+class TailTraceAnalyzer:
+    """Follow a tracefile that is still being written and keep the features of its last windows."""
+
+    def __init__(self, tracefile_path, max_windows):
+        self.tracefile_path = tracefile_path
+        self.max_windows = max_windows
+        self.reset()
+
+    def reset(self):
+        self.reader = TraceReader(self.tracefile_path)
+        self.extractor = TraceFeatureExtractor(TRACE_WINDOW_SECONDS, self.max_windows, track_distributions=False)
+        self.inode = None
+
+    def update(self):
+        '''
+        Decode the records appended since the last update
+
+        Parameters:
+        - None
+
+        Returns:
+        - int: The number of new key accesses
+        '''
+        stat = os.stat(self.tracefile_path)
+        # A new benchmark run recreates the tracefile
+        if self.inode is not None and (stat.st_ino != self.inode or stat.st_size < self.reader.offset):
+            log_update(f"[TAL] {self.tracefile_path} was recreated, restarting the tail analysis")
+            self.reset()
+        self.inode = stat.st_ino
+
+        count = 0
+        for timestamp, operation, key, value_size in self.reader.accesses():
+            self.extractor.add(timestamp, operation, key, value_size)
+            count += 1
+        return count
+
+    def window_frame(self):
+        # The open window is the most recent activity, it is summarized even though it is partial
+        return self.extractor.window_frame(include_open=True)
+
+    def first_window(self):
+        # Number of the first window still kept in the ring buffer
+        return self.extractor.window_count - len(self.extractor.rows) + 1
+
+
+# Tail analyzers of the tracefiles followed during dynamic tuning, by path
+tail_analyzers = {}
+
+
+def extract_trace_features(tracefile_path, max_windows=None):
+    '''
+    Stream the binary tracefile through the feature extractor
+
+    Parameters:
+    - tracefile_path (str): The path of tracefile
+    - max_windows (int): Only keep the features of the last max_windows windows
+
+    Returns:
+    - TraceFeatureExtractor: The extractor holding the features of the trace read so far
+    '''
+    extractor = TraceFeatureExtractor(TRACE_WINDOW_SECONDS, max_windows)
+    for timestamp, operation, key, value_size in TraceReader(tracefile_path).accesses():
+        extractor.add(timestamp, operation, key, value_size)
+    extractor.finish()
+    return extractor
+
+def analyze_tracefile_native(tracefile_path):
+    '''
+    Function to create a workload summary from tracefile without trace_analyzer and intermediate files.
+
+    Parameters:
+    - tracefile_path (str): The path of tracefile
+
+    Returns:
+    - A workload summary from tracefile.
+    '''
+    log_update("[TAL] Read tracefile")
+    print("[TAL] Read tracefile")
+    extractor = extract_trace_features(tracefile_path)
+    log_update(f"[TAL] Finish analyze tracefile, {extractor.window_count} windows")
+    print("[TAL] Finish analyze tracefile")
+
+    return summarize_windows(
+        extractor.window_count,
+        generate_pattern_message(extractor.distributions("key_count")),
+        generate_pattern_message(extractor.distributions("key_size")),
+        generate_pattern_message(extractor.distributions("value_size")),
+    )
+
+def summarize_last_n_windows(data, n, first_window=1):
+    trace_result_summary = ["The workload information is as follows:\n"]
+    trace_result_summary.append(f"Here is the converted summary of the last {n} windows ({TRACE_WINDOW_SECONDS} seconds each) of the trace:\n")
+    column_names = data.columns.tolist()
+
+    last_windows = data.tail(n)
+    first_window += len(data) - len(last_windows)
+    for count, (_, row) in enumerate(last_windows.iterrows(), first_window):
+        row_summary = generate_summary_row(row, column_names)
+        trace_result_summary.append(f"Time window {count}:{row_summary}\n")
+
+    return "".join(trace_result_summary)
 
 def analyze_tracefile(tracefile_path):
     '''
@@ -21,6 +128,8 @@ def analyze_tracefile(tracefile_path):
     Returns:
     - A workload summary from tracefile.
     '''
+    if NATIVE_TRACE_ANALYZER:
+        return analyze_tracefile_native(tracefile_path)
 
     # Convert ml_feature.txt or ml_feature_windows.txt to ml_feature.csv
     output_csv = f"{OUTPUT_PATH}/trace_data/ml_feature.csv"
@@ -101,6 +210,14 @@ def analyze_tracefile(tracefile_path):
     return trace_result
 
 def analyze_last_n_tracefile_windows(tracefile_path, n=2):
+    if NATIVE_TRACE_ANALYZER:
+        analyzer = tail_analyzers.get(tracefile_path)
+        if analyzer is None or analyzer.max_windows < n:
+            analyzer = tail_analyzers[tracefile_path] = TailTraceAnalyzer(tracefile_path, n)
+        new_accesses = analyzer.update()
+        log_update(f"[TAL] Decoded {new_accesses} new accesses of the tracefile from offset {analyzer.reader.offset}")
+        return summarize_last_n_windows(analyzer.window_frame(), n, analyzer.first_window())
+
     # Create trace data folder
     os.makedirs(f"{OUTPUT_PATH}/trace_data_dyn", exist_ok=True)
 
@@ -167,24 +284,10 @@ def analyze_last_n_tracefile_windows(tracefile_path, n=2):
     else:
         raise FileNotFoundError("Neither 'ml_feature_windows.txt' nor 'ml_feature.txt' was found.")
 
-    trace_result_summary = ["The workload information is as follows:\n"]
-    if os.path.exists(input_txt_windows):
-        trace_result_summary.append("Here is the converted summary of the last 2 windows (10 seconds each) of the trace:\n")
-        data = pd.read_csv(f"{OUTPUT_PATH}/trace_data_dyn/ml_feature_windows.csv")
-        column_names = data.columns.tolist()
-
-        count = 0
-        for index, row in data.iterrows():
-            count += 1
-            if count <= len(data) - n:
-                continue
-
-            row_summary = generate_summary_row(row, column_names)
-            trace_result_summary.append(f"Time window {count}:{row_summary}\n")
-
-    trace_result = "".join(trace_result_summary)
-
-    return trace_result
+    if not os.path.exists(input_txt_windows):
+        return "The workload information is as follows:\n"
+    data = pd.read_csv(f"{OUTPUT_PATH}/trace_data_dyn/ml_feature_windows.csv")
+    return summarize_last_n_windows(data, n)
 
 def encode_image(image_path):
   with open(image_path, "rb") as image_file:
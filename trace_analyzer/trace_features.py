@@ -0,0 +1,191 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from trace_analyzer.trace_summarizer import operations
+
+# Per operation features of a window, named like the columns of ml_feature_windows.csv
+FEATURES = [
+    "access_count", "unique_keys", "key_size_average", "key_size_median", "key_size_variance",
+    "value_size_average", "value_size_median", "value_size_variance", "mean", "mode", "median",
+    "quartiles[0]", "quartiles[2]",
+]
+WINDOW_COLUMNS = [f"{operation}_{feature}" for operation in operations for feature in FEATURES]
+# Bucket width of the value size distribution, the default -value_interval of trace_analyzer
+VALUE_SIZE_INTERVAL = 8
+# Number of per-window key arrays kept before they are merged
+MAX_PENDING_KEY_ARRAYS = 64
+
+
+def add_bincount(total, values):
+    counts = np.bincount(values)
+    if len(counts) > len(total):
+        counts[:len(total)] += total
+        return counts
+    total[:len(counts)] += counts
+    return total
+
+
+class KeyCounter:
+    """Access count of every key, merged from the unique keys of each window."""
+
+    def __init__(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.pending = []
+
+    def add(self, keys, counts):
+        self.pending.append((keys, counts))
+        if len(self.pending) >= MAX_PENDING_KEY_ARRAYS:
+            self.compact()
+
+    def compact(self):
+        if not self.pending:
+            return
+        keys = np.concatenate([self.keys] + [keys for keys, _ in self.pending])
+        counts = np.concatenate([self.counts] + [counts for _, counts in self.pending])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        self.pending = []
+
+    def distribution(self):
+        '''
+        Number of keys accessed each number of times
+
+        Parameters:
+        - None
+
+        Returns:
+        - tuple: (access counts, number of keys) arrays
+        '''
+        self.compact()
+        return np.unique(self.counts, return_counts=True)
+
+
+class TraceFeatureExtractor:
+    """Compute the per-window access features and the key and value distributions of a stream of trace accesses."""
+
+    def __init__(self, window_seconds=10, max_windows=None, track_distributions=True):
+        self.window_micros = int(window_seconds * 1_000_000)
+        # The whole-trace distributions are not needed when only the last windows are summarized
+        self.track_distributions = track_distributions
+        self.start = None
+        self.window_index = 0
+        self.window_count = 0
+        # Only the last max_windows rows are kept when it is set
+        self.rows = deque(maxlen=max_windows)
+        self.key_counts = {operation: KeyCounter() for operation in operations}
+        self.key_sizes = {operation: np.zeros(0, dtype=np.int64) for operation in operations}
+        self.value_sizes = {operation: np.zeros(0, dtype=np.int64) for operation in operations}
+        self.reset_window()
+
+    def reset_window(self):
+        # Key hashes, key sizes and value sizes of the open window
+        self.window = {operation: ([], [], []) for operation in operations}
+        self.window_accesses = 0
+
+    def add(self, timestamp, operation, key, value_size):
+        '''
+        Add a key access
+
+        Parameters:
+        - timestamp (int): The time of the access in microseconds
+        - operation (str): The operation, one of trace_summarizer.operations
+        - key (bytes): The accessed key
+        - value_size (int): The size of the written value, 0 for reads
+
+        Returns:
+        - None
+        '''
+        if self.start is None:
+            self.start = timestamp
+        index = (timestamp - self.start) // self.window_micros
+        while index > self.window_index:
+            self.close_window()
+
+        hashes, key_sizes, value_sizes = self.window[operation]
+        hashes.append(hash(key))
+        key_sizes.append(len(key))
+        value_sizes.append(value_size)
+        self.window_accesses += 1
+
+    def window_row(self, accumulate):
+        row = np.zeros(len(WINDOW_COLUMNS))
+        for position, operation in enumerate(operations):
+            hashes, key_sizes, value_sizes = self.window[operation]
+            if not hashes:
+                continue
+            keys, counts = np.unique(np.array(hashes, dtype=np.int64), return_counts=True)
+            key_sizes = np.array(key_sizes, dtype=np.int64)
+            value_sizes = np.array(value_sizes, dtype=np.int64)
+            row[position * len(FEATURES):(position + 1) * len(FEATURES)] = [
+                len(hashes), len(keys),
+                key_sizes.mean(), np.median(key_sizes), key_sizes.var(),
+                value_sizes.mean(), np.median(value_sizes), value_sizes.var(),
+                counts.mean(), np.bincount(counts).argmax(), np.median(counts),
+                np.percentile(counts, 25), np.percentile(counts, 75),
+            ]
+            if accumulate:
+                self.key_counts[operation].add(keys, counts)
+                self.key_sizes[operation] = add_bincount(self.key_sizes[operation], key_sizes)
+                self.value_sizes[operation] = add_bincount(self.value_sizes[operation], -(-value_sizes // VALUE_SIZE_INTERVAL))
+        return row
+
+    def close_window(self):
+        self.rows.append(self.window_row(accumulate=self.track_distributions))
+        self.window_count += 1
+        self.window_index += 1
+        self.reset_window()
+
+    def finish(self):
+        '''
+        Close the last, partial window
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        if self.window_accesses > 0:
+            self.close_window()
+
+    def window_frame(self, include_open=False):
+        '''
+        Per-window features of the closed windows
+
+        Parameters:
+        - include_open (bool): Append the features of the open window, if it has accesses
+
+        Returns:
+        - pd.DataFrame: One row per window, with the columns used by trace_summarizer
+        '''
+        rows = list(self.rows)
+        if include_open and self.window_accesses > 0:
+            rows.append(self.window_row(accumulate=False))
+        return pd.DataFrame(rows, columns=WINDOW_COLUMNS)
+
+    def distributions(self, pattern_name):
+        '''
+        Whole-trace distribution of every operation, like the *accessed_{pattern_name}_distribution.txt files of trace_analyzer
+
+        Parameters:
+        - pattern_name (str): key_count, key_size or value_size
+
+        Returns:
+        - dict: (values, frequencies) arrays by operation, for the operations present in the trace
+        '''
+        result = {}
+        for operation in operations:
+            if pattern_name == "key_count":
+                values, frequencies = self.key_counts[operation].distribution()
+            else:
+                histogram = self.key_sizes[operation] if pattern_name == "key_size" else self.value_sizes[operation]
+                values = np.nonzero(histogram)[0]
+                frequencies = histogram[values]
+                if pattern_name == "value_size":
+                    values = values * VALUE_SIZE_INTERVAL
+            if len(values) > 0:
+                result[operation] = (values, frequencies)
+        return result
@@ -0,0 +1,254 @@
+import re
+import struct
+
+# rocksdb/trace_record.h: TraceType
+TRACE_NONE = 0
+TRACE_BEGIN = 1
+TRACE_END = 2
+TRACE_WRITE = 3
+TRACE_GET = 4
+TRACE_ITERATOR_SEEK = 5
+TRACE_ITERATOR_SEEK_FOR_PREV = 6
+TRACE_MULTI_GET = 13
+
+# trace_replay/trace_replay.h: TracePayloadType, the bit of every field in the payload map
+PAYLOAD_EMPTY = 0
+PAYLOAD_WRITE_BATCH_DATA = 1
+PAYLOAD_GET_CF_ID = 2
+PAYLOAD_GET_KEY = 3
+PAYLOAD_ITER_CF_ID = 4
+PAYLOAD_ITER_KEY = 5
+PAYLOAD_ITER_LOWER_BOUND = 6
+PAYLOAD_ITER_UPPER_BOUND = 7
+PAYLOAD_MULTI_GET_SIZE = 8
+PAYLOAD_MULTI_GET_CF_IDS = 9
+PAYLOAD_MULTI_GET_KEYS = 10
+
+# db/dbformat.h: ValueType tags of the WriteBatch records
+TAG_DELETION = 0x0
+TAG_VALUE = 0x1
+TAG_MERGE = 0x2
+TAG_LOG_DATA = 0x3
+TAG_CF_DELETION = 0x4
+TAG_CF_VALUE = 0x5
+TAG_CF_MERGE = 0x6
+TAG_SINGLE_DELETION = 0x7
+TAG_CF_SINGLE_DELETION = 0x8
+TAG_BEGIN_PREPARE_XID = 0x9
+TAG_END_PREPARE_XID = 0xA
+TAG_COMMIT_XID = 0xB
+TAG_ROLLBACK_XID = 0xC
+TAG_NOOP = 0xD
+TAG_CF_RANGE_DELETION = 0xE
+TAG_RANGE_DELETION = 0xF
+TAG_CF_BLOB_INDEX = 0x10
+TAG_BLOB_INDEX = 0x11
+TAG_BEGIN_PERSISTED_PREPARE_XID = 0x12
+TAG_BEGIN_UNPREPARE_XID = 0x13
+TAG_COMMIT_XID_AND_TIMESTAMP = 0x15
+TAG_WIDE_COLUMN_ENTITY = 0x16
+TAG_CF_WIDE_COLUMN_ENTITY = 0x17
+
+# Timestamp (Fixed64), type (1 byte), payload size (Fixed32)
+RECORD_HEADER = struct.Struct("<QBI")
+WRITE_BATCH_HEADER_SIZE = 12
+VERSION_PATTERN = re.compile(rb"Trace Version: (\d+)\.(\d+)")
+
+
+def decode_varint32(data, offset):
+    result = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def decode_slice(data, offset):
+    length, offset = decode_varint32(data, offset)
+    return data[offset:offset + length], offset + length
+
+
+def decode_write_batch(rep):
+    '''
+    Decode the operations of a WriteBatch representation
+
+    Parameters:
+    - rep (bytes): The WriteBatch data: sequence (Fixed64), count (Fixed32) and the records
+
+    Returns:
+    - list: (operation, key, value size) of every record
+    '''
+    accesses = []
+    offset = WRITE_BATCH_HEADER_SIZE
+    while offset < len(rep):
+        tag = rep[offset]
+        offset += 1
+        if tag in (TAG_CF_VALUE, TAG_CF_DELETION, TAG_CF_SINGLE_DELETION, TAG_CF_MERGE,
+                   TAG_CF_RANGE_DELETION, TAG_CF_BLOB_INDEX, TAG_CF_WIDE_COLUMN_ENTITY):
+            _, offset = decode_varint32(rep, offset)
+
+        if tag in (TAG_VALUE, TAG_CF_VALUE, TAG_BLOB_INDEX, TAG_CF_BLOB_INDEX, TAG_WIDE_COLUMN_ENTITY, TAG_CF_WIDE_COLUMN_ENTITY):
+            key, offset = decode_slice(rep, offset)
+            value, offset = decode_slice(rep, offset)
+            accesses.append(("put", key, len(value)))
+        elif tag in (TAG_MERGE, TAG_CF_MERGE):
+            key, offset = decode_slice(rep, offset)
+            value, offset = decode_slice(rep, offset)
+            accesses.append(("merge", key, len(value)))
+        elif tag in (TAG_DELETION, TAG_CF_DELETION):
+            key, offset = decode_slice(rep, offset)
+            accesses.append(("delete", key, 0))
+        elif tag in (TAG_SINGLE_DELETION, TAG_CF_SINGLE_DELETION):
+            key, offset = decode_slice(rep, offset)
+            accesses.append(("singledelete", key, 0))
+        elif tag in (TAG_RANGE_DELETION, TAG_CF_RANGE_DELETION):
+            begin_key, offset = decode_slice(rep, offset)
+            end_key, offset = decode_slice(rep, offset)
+            accesses.append(("rangedelete", begin_key, len(end_key)))
+        elif tag in (TAG_LOG_DATA, TAG_END_PREPARE_XID, TAG_COMMIT_XID, TAG_ROLLBACK_XID):
+            _, offset = decode_slice(rep, offset)
+        elif tag == TAG_COMMIT_XID_AND_TIMESTAMP:
+            _, offset = decode_slice(rep, offset)
+            _, offset = decode_slice(rep, offset)
+        elif tag in (TAG_NOOP, TAG_BEGIN_PREPARE_XID, TAG_BEGIN_PERSISTED_PREPARE_XID, TAG_BEGIN_UNPREPARE_XID):
+            continue
+        else:
+            # Unknown record, the rest of the batch cannot be decoded
+            break
+    return accesses
+
+
+def payload_fields(payload):
+    # Fields follow the payload map (Fixed64) in the order of their bits
+    payload_map = struct.unpack_from("<Q", payload, 0)[0]
+    bits = [bit for bit in range(64) if payload_map & (1 << bit)]
+    return bits, 8
+
+
+def decode_record(trace_type, payload):
+    '''
+    Decode the key accesses of a trace record (trace format 0.2)
+
+    Parameters:
+    - trace_type (int): The TraceType of the record
+    - payload (bytes): The payload of the record
+
+    Returns:
+    - list: (operation, key, value size) of every access, the operation names match trace_summarizer.operations
+    '''
+    if trace_type not in (TRACE_WRITE, TRACE_GET, TRACE_ITERATOR_SEEK, TRACE_ITERATOR_SEEK_FOR_PREV, TRACE_MULTI_GET):
+        return []
+
+    bits, offset = payload_fields(payload)
+    accesses = []
+    multi_get_size = 0
+    for bit in bits:
+        if bit in (PAYLOAD_GET_CF_ID, PAYLOAD_ITER_CF_ID):
+            offset += 4
+        elif bit == PAYLOAD_WRITE_BATCH_DATA:
+            rep, offset = decode_slice(payload, offset)
+            accesses.extend(decode_write_batch(rep))
+        elif bit == PAYLOAD_GET_KEY:
+            key, offset = decode_slice(payload, offset)
+            accesses.append(("get", key, 0))
+        elif bit == PAYLOAD_ITER_KEY:
+            key, offset = decode_slice(payload, offset)
+            operation = "iterator_seek" if trace_type == TRACE_ITERATOR_SEEK else "iterator_seekForPrev"
+            accesses.append((operation, key, 0))
+        elif bit in (PAYLOAD_ITER_LOWER_BOUND, PAYLOAD_ITER_UPPER_BOUND):
+            _, offset = decode_slice(payload, offset)
+        elif bit == PAYLOAD_MULTI_GET_SIZE:
+            multi_get_size = struct.unpack_from("<I", payload, offset)[0]
+            offset += 4
+        elif bit == PAYLOAD_MULTI_GET_CF_IDS:
+            # One slice of Fixed32 column family ids
+            _, offset = decode_slice(payload, offset)
+        elif bit == PAYLOAD_MULTI_GET_KEYS:
+            # One slice of length prefixed keys
+            keys, offset = decode_slice(payload, offset)
+            key_offset = 0
+            for _ in range(multi_get_size):
+                key, key_offset = decode_slice(keys, key_offset)
+                accesses.append(("multiget", key, 0))
+    return accesses
+
+
+class TraceReader:
+    """Stream the records of a binary RocksDB query trace, including one that is still being written."""
+
+    def __init__(self, trace_path, chunk_size=1 << 20):
+        self.trace_path = trace_path
+        self.chunk_size = chunk_size
+        # End of the last complete record
+        self.offset = 0
+        self.version = None
+        self.ended = False
+
+    def records(self):
+        '''
+        Read the complete records after the current offset
+
+        A record cut at the end of the file is left for the next call.
+
+        Parameters:
+        - None
+
+        Returns:
+        - generator: (timestamp in microseconds, TraceType, payload) of every new record
+        '''
+        with open(self.trace_path, "rb") as f:
+            f.seek(self.offset)
+            buffer = b""
+            position = 0
+            while not self.ended:
+                if len(buffer) - position < RECORD_HEADER.size:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        return
+                    buffer = buffer[position:] + chunk
+                    position = 0
+                    continue
+                timestamp, trace_type, payload_size = RECORD_HEADER.unpack_from(buffer, position)
+                end = position + RECORD_HEADER.size + payload_size
+                if end > len(buffer):
+                    chunk = f.read(max(self.chunk_size, end - len(buffer)))
+                    if not chunk:
+                        return
+                    buffer = buffer[position:] + chunk
+                    position = 0
+                    continue
+
+                payload = buffer[position + RECORD_HEADER.size:end]
+                position = end
+                self.offset += RECORD_HEADER.size + payload_size
+
+                if trace_type == TRACE_BEGIN:
+                    self.read_header(payload)
+                    continue
+                if trace_type == TRACE_END:
+                    self.ended = True
+                    return
+                yield timestamp, trace_type, payload
+
+    def read_header(self, payload):
+        match = VERSION_PATTERN.search(payload)
+        self.version = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+        if self.version < (0, 2):
+            raise ValueError(f"Trace format {self.version[0]}.{self.version[1]} of {self.trace_path} is not supported, 0.2 or later is required")
+
+    def accesses(self):
+        '''
+        Read the key accesses of the new records
+
+        Parameters:
+        - None
+
+        Returns:
+        - generator: (timestamp in microseconds, operation, key, value size) of every access
+        '''
+        for timestamp, trace_type, payload in self.records():
+            for operation, key, value_size in decode_record(trace_type, payload):
+                yield timestamp, operation, key, value_size
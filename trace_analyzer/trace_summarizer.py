@@ -1,9 +1,8 @@
 import pandas as pd
 from utils.constants import OUTPUT_PATH
 import numpy as np
-from scipy.optimize import curve_fit
-from scipy.stats import zipf, uniform, norm, expon
 import glob
+import hashlib
 import os
 
 operations = ["get", "put", "delete", "singledelete", "rangedelete", "merge", "iterator_seek", "iterator_seekForPrev", "multiget"]
@@ -159,38 +158,79 @@ def generate_summary(csv_file_path):
 
     return summary
 
+# Column of the value and of the frequency by the number of columns of a distribution file line
+# Key distribution: "access_count: <count> num: <keys>", key size: "<size> <count>",
+# value size: "Number_of_value_size_between <low> and <high> is: <count>"
+DISTRIBUTION_COLUMNS = {4: (1, 3), 2: (0, 1), 6: (3, 5)}
+ZIPF_THETAS = np.array([0.5, 0.8, 1.0, 1.2, 1.5, 1.8, 2.0, 2.5, 3.0])
+# Candidate decay rates of the two-term exponential, relative to the range of the values
+EXPONENTIAL_RATES = -np.logspace(-2, 2, 41)
+# Fitted distributions by content digest, distribution files are analyzed again for every summary
+data_cache = {}
+fit_cache = {}
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def read_data(file_path):
-    access_count = []
-    frequency = []
+    digest = file_digest(file_path)
+    if digest in data_cache:
+        return data_cache[digest]
+
     with open(file_path, 'r') as file:
+        first_line = file.readline()
+    columns = DISTRIBUTION_COLUMNS.get(len(first_line.split()))
+    if columns is None:
+        # Empty file or unknown format
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
 
-        # Check if the file is empty
-        if not file.read(1):
-            return [], []
-
-        for line in file:
-            parts = line.strip().split()
-
-            # Hardcoded for now. Must be changed in the future for a general solution
-            if len(parts) == 4:
-                # Key distribution has 4 parts
-                access_count.append(int(parts[1]))
-                frequency.append(int(parts[3]))
-            elif len(parts) == 2:
-                # Key Size distribution has 2 parts
-                access_count.append(int(parts[0]))
-                frequency.append(int(parts[1]))
-            elif len(parts) == 6:
-                # Value Size distribution has 6 parts
-                access_count.append(int(parts[3]))
-                frequency.append(int(parts[5]))
-
-    return np.array(access_count), np.array(frequency)
+    # Hardcoded for now. Must be changed in the future for a general solution
+    data = np.loadtxt(file_path, usecols=columns, dtype=np.int64, ndmin=2)
+    data_cache[digest] = (data[:, 0], data[:, 1])
+    return data_cache[digest]
 
 def fit_distribution(data_file):
     # Load data
     access_count, frequency = read_data(data_file)
-
+    return fit_distribution_data(access_count, frequency)
+
+def fit_two_term_exponential(x, y):
+    '''
+    Least squares fit of a * exp(b * x) + c * exp(d * x)
+
+    The amplitudes are solved in closed form for every pair of candidate rates at once.
+
+    Parameters:
+    - x (np.ndarray): The values
+    - y (np.ndarray): The normalized frequencies
+
+    Returns:
+    - np.ndarray: The fitted curve at x
+    '''
+    span = (x.max() - x.min()) or 1.0
+    rates = EXPONENTIAL_RATES / span
+    b, d = np.triu_indices(len(rates))
+    e = np.exp(rates[:, None] * (x - x.min())[None, :])
+    # Normal equations of the amplitudes for every pair of rates
+    gram = e @ e.T
+    projections = e @ y
+    s11, s22, s12 = gram[b, b], gram[d, d], gram[b, d]
+    t1, t2 = projections[b], projections[d]
+    determinant = s11 * s22 - s12 ** 2
+    singular = np.abs(determinant) <= 1e-12 * s11 * s22
+    safe = np.where(singular, 1.0, determinant)
+    a = np.where(singular, t1 / s11, (s22 * t1 - s12 * t2) / safe)
+    c = np.where(singular, 0.0, (s11 * t2 - s12 * t1) / safe)
+    # Residual sum of squares expanded, so the curves are only built for the best pair
+    residuals = a ** 2 * s11 + c ** 2 * s22 + 2 * a * c * s12 - 2 * a * t1 - 2 * c * t2 + y @ y
+    best = np.argmin(residuals)
+    return a[best] * e[b[best]] + c[best] * e[d[best]]
+
+def fit_distribution_data(access_count, frequency):
     if len(access_count) == 0:
         return "Does not contain any data points.", [access_count, frequency]
     elif len(access_count) == 1:
@@ -199,81 +239,43 @@ def fit_distribution(data_file):
         # This is effectively the prompt to the LLM
         return "Identify and leverage the patttern based on the access distribution that we provide next", [access_count, frequency]
 
+    access_count = np.asarray(access_count)
+    frequency = np.asarray(frequency)
+    digest = hashlib.sha256(access_count.astype(np.int64).tobytes() + frequency.astype(np.int64).tobytes()).hexdigest()
+    if digest in fit_cache:
+        return fit_cache[digest], [access_count, frequency]
+
+    x = access_count.astype(float)
     # Normalize frequencies to create a probability distribution
     frequency_normalized = frequency / np.sum(frequency)
 
-    # Define the two-term exponential function
-    def two_term_exponential(x, a, b, c, d):
-        return a * np.exp(b * x) + c * np.exp(d * x)
-
-    # Fit the data to the two-term exponential model
-    initial_guess = [1.0, 1.0, 1.0, 1.0]
-    popt_exp, _ = curve_fit(two_term_exponential, access_count, frequency_normalized, p0=initial_guess, maxfev=100000)
-
-    # Fit Uniform distribution
-    uniform_start, uniform_width = uniform.fit(access_count, floc=0)
-
-    # Fit Gaussian (Normal) distribution
-    mu, sigma = norm.fit(access_count)
-
-    # Fit Exponential distribution
-    loc_exp, scale_exp = expon.fit(access_count, floc=0)
-
-    # Fit and evaluate Zipfian distribution for different theta values
-    def fit_zipf(x, s):
-        return zipf.pmf(x, s) / np.sum(zipf.pmf(np.arange(1, len(x) + 1), s))
-
-    theta_values = [0.5, 0.8, 1.0, 1.2, 1.5, 1.8, 2.0, 2.5, 3.0]
-    metrics_zipf = {}
-    for theta in theta_values:
-        y_fit_zipf = fit_zipf(access_count, theta)
-        r_squared = 1 - np.sum((frequency_normalized - y_fit_zipf) ** 2) / np.sum((frequency_normalized - np.mean(frequency_normalized)) ** 2)
-        rmse = np.sqrt(np.mean((frequency_normalized - y_fit_zipf) ** 2))
-        metrics_zipf[theta] = {'R^2': r_squared, 'RMSE': rmse}
-
-    # Calculate goodness-of-fit metrics
-    def calculate_r_squared(y_true, y_pred):
-        ss_res = np.sum((y_true - y_pred) ** 2)
-        ss_tot = np.sum((y_true - np.mean(y_true)) ** 2)
-        return 1 - (ss_res / ss_tot)
-
-    def calculate_rmse(y_true, y_pred):
-        return np.sqrt(np.mean((y_true - y_pred) ** 2))
-
-    # Predicted values for access_count
-    y_pred_exp = two_term_exponential(access_count, *popt_exp)
-    y_pred_uniform = uniform.pdf(access_count, uniform_start, uniform_width)
-    y_pred_gauss = norm.pdf(access_count, mu, sigma)
-    y_pred_expon = expon.pdf(access_count, loc_exp, scale_exp)
-
-    # Fitness metrics for each distribution
-    metrics = {
-        'Two-Term Exponential': {
-            'R^2': calculate_r_squared(frequency_normalized, y_pred_exp),
-            'RMSE': calculate_rmse(frequency_normalized, y_pred_exp)
-        },
-        'Uniform': {
-            'R^2': calculate_r_squared(frequency_normalized, y_pred_uniform),
-            'RMSE': calculate_rmse(frequency_normalized, y_pred_uniform)
-        },
-        'Gaussian': {
-            'R^2': calculate_r_squared(frequency_normalized, y_pred_gauss),
-            'RMSE': calculate_rmse(frequency_normalized, y_pred_gauss)
-        },
-        'Exponential': {
-            'R^2': calculate_r_squared(frequency_normalized, y_pred_expon),
-            'RMSE': calculate_rmse(frequency_normalized, y_pred_expon)
-        }
-    }
-
-    # Combine Zipfian metrics
-    for theta, zipf_metrics in metrics_zipf.items():
-        metrics[f'Zipf (theta={theta})'] = zipf_metrics
-
-    # Identify the best fit
-    best_fit = min(metrics.items(), key=lambda item: item[1]['RMSE'])
-
-    return best_fit[0], [access_count, frequency]
+    # Maximum likelihood fits in closed form
+    uniform_width = x.max() if x.max() > 0 else 1.0
+    mu, sigma = x.mean(), x.std() or 1.0
+    scale_exp = x.mean() if x.mean() > 0 else 1.0
+    names = ['Two-Term Exponential', 'Uniform', 'Gaussian', 'Exponential']
+    predictions = [
+        fit_two_term_exponential(x, frequency_normalized),
+        np.where((x >= 0) & (x <= uniform_width), 1.0 / uniform_width, 0.0),
+        np.exp(-0.5 * ((x - mu) / sigma) ** 2) / (sigma * np.sqrt(2 * np.pi)),
+        np.where(x >= 0, np.exp(-x / scale_exp) / scale_exp, 0.0),
+    ]
+
+    # Zipfian distribution for every theta, normalized over the ranks 1..len(x)
+    log_ranks = np.log(np.arange(1, len(x) + 1))
+    normalization = np.exp(-ZIPF_THETAS[:, None] * log_ranks[None, :]).sum(axis=1)
+    with np.errstate(divide='ignore'):
+        log_x = np.log(np.where(x >= 1, x, np.nan))
+    zipf_predictions = np.nan_to_num(np.exp(-ZIPF_THETAS[:, None] * log_x[None, :])) / normalization[:, None]
+    names += [f'Zipf (theta={theta})' for theta in ZIPF_THETAS.tolist()]
+
+    # Goodness of fit of every candidate at once, the best fit has the lowest RMSE
+    predictions = np.vstack([np.vstack(predictions), zipf_predictions])
+    rmse = np.sqrt(np.mean((predictions - frequency_normalized[None, :]) ** 2, axis=1))
+    best_fit = names[int(np.nanargmin(rmse))]
+
+    fit_cache[digest] = best_fit
+    return best_fit, [access_count, frequency]
 
 def generate_pattern_message_from_trace(pattern_name):
     # Define the file path pattern
@@ -287,12 +289,9 @@ def generate_pattern_message_from_trace(pattern_name):
     # Find all matching files
     txt_files = glob.glob(filename_pattern)
     
-    # Dictionary to store results
-    results = {}
-    pattern_info_dict = {}
-
-    # Process each file
     # Process each file and map to operations
+    distributions = {}
+    unmatched = {}
     for txt_file in txt_files:
         operation_matched = None
         for operation in operations:
@@ -301,17 +300,35 @@ def generate_pattern_message_from_trace(pattern_name):
                 break
         
         if operation_matched:
-            acc, freq = read_data(txt_file)
-            pattern_info_dict[operation_matched] = [acc, freq]
-
-            try:
-                best_fit, _ = fit_distribution(txt_file)
-                results[operation_matched] = best_fit
-            except Exception as e:
-                results[operation_matched] = f"Error: {str(e)}"
+            distributions[operation_matched] = read_data(txt_file)
         else:
             # Handle cases where no operation matches (optional)
-            results[txt_file] = "Operation not matched"
+            unmatched[txt_file] = "Operation not matched"
+
+    results, pattern_info_dict = generate_pattern_message(distributions)
+    results.update(unmatched)
+    return results, pattern_info_dict
+
+def generate_pattern_message(distributions):
+    '''
+    Fit the distribution of every operation
+
+    Parameters:
+    - distributions (dict): (values, frequencies) arrays by operation
+
+    Returns:
+    - results (dict): The best fitting distribution by operation
+    - pattern_info_dict (dict): [values, frequencies] by operation
+    '''
+    results = {}
+    pattern_info_dict = {}
+    for operation, (acc, freq) in distributions.items():
+        pattern_info_dict[operation] = [acc, freq]
+        try:
+            best_fit, _ = fit_distribution_data(acc, freq)
+            results[operation] = best_fit
+        except Exception as e:
+            results[operation] = f"Error: {str(e)}"
 
     return results, pattern_info_dict
 
@@ -345,12 +362,28 @@ def generate_summary_windows(csv_file_path):
     # Read the CSV file
     data = pd.read_csv(csv_file_path, index_col=False)
 
-    # Get column names
-    column_names = data.columns.tolist()
+    key_access = generate_pattern_message_from_trace("key_count")
+    key_size = generate_pattern_message_from_trace("key_size")
+    value_size = generate_pattern_message_from_trace("value_size")
+
+    return summarize_windows(len(data), key_access, key_size, value_size)
+
+def summarize_windows(window_count, key_access, key_size, value_size):
+    '''
+    Build the workload summary from the fitted distributions
+
+    Parameters:
+    - window_count (int): The number of 10 second windows of the trace
+    - key_access (tuple): The results of generate_pattern_message for the key access counts
+    - key_size (tuple): The results of generate_pattern_message for the key sizes
+    - value_size (tuple): The results of generate_pattern_message for the value sizes
 
-    key_access_message, key_access_pattern_info_dict = generate_pattern_message_from_trace("key_count")
-    key_size_message, key_size_pattern_info_dict = generate_pattern_message_from_trace("key_size")
-    value_size_message, value_size_pattern_info_dict = generate_pattern_message_from_trace("value_size")
+    Returns:
+    - str: The workload summary
+    '''
+    key_access_message, key_access_pattern_info_dict = key_access
+    key_size_message, key_size_pattern_info_dict = key_size
+    value_size_message, value_size_pattern_info_dict = value_size
 
     # Dictionary to store summaries
     summaries = ["The workload information is as follows:\n"]
@@ -372,7 +405,7 @@ def generate_summary_windows(csv_file_path):
         summaries.append(f"Value Size (bytes) Ceiling: {value_size_pattern_info_dict[operation][0]}\n")
         summaries.append(f"Frequency: {value_size_pattern_info_dict[operation][1]}\n")
    
-    summaries.append(f"The benchmark running time is: {len(data)*10} seconds.\n")
+    summaries.append(f"The benchmark running time is: {window_count*10} seconds.\n")
 
     # summaries.append("\n\nHere is the converted string from the csv file:\n")
     # summaries.append("Each time window equals to 10 seconds.\n")
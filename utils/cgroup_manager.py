@@ -26,6 +26,13 @@ class CGroupManager:
         cpu_max_path = os.path.join(self.cgroup_path, "cpu.max")
         subprocess.run(["sudo", self.helper_script, "write", cpu_max_path, str(quota)], check=True)
 
+    def set_cpuset(self, cpus):
+        """Pin the cgroup to a CPU list such as "0-1" or "2,3"."""
+        subtree_control_path = os.path.join(self.cgroup_base_path, "cgroup.subtree_control")
+        subprocess.run(["sudo", self.helper_script, "write", subtree_control_path, "+cpuset"], check=True)
+        cpuset_path = os.path.join(self.cgroup_path, "cpuset.cpus")
+        subprocess.run(["sudo", self.helper_script, "write", cpuset_path, str(cpus)], check=True)
+
     def set_memory_limit(self, limit):
         """Set the memory limit in bytes."""
         memory_max_path = os.path.join(self.cgroup_path, "memory.max")
@@ -2,18 +2,106 @@ import time
 import os
 import threading
 
+import numpy as np
+
+from utils.constants import CGROUP_SAMPLE_INTERVAL, CGROUP_HISTORY_SECONDS
+
+# Columns of a sample. Rates are per second over the sampling interval, pressures are the
+# percentage of the interval in which some (or all) tasks of the cgroup stalled on the resource
+SAMPLE_FIELDS = [
+    "time",
+    "cpu_usage_percent",
+    "memory_bytes",
+    "memory_anon_bytes",
+    "memory_file_bytes",
+    "memory_dirty_bytes",
+    "memory_writeback_bytes",
+    "io_read_bytes_per_sec",
+    "io_write_bytes_per_sec",
+    "io_read_ops_per_sec",
+    "io_write_ops_per_sec",
+    "cpu_pressure_some_percent",
+    "memory_pressure_some_percent",
+    "memory_pressure_full_percent",
+    "io_pressure_some_percent",
+    "io_pressure_full_percent",
+]
+FIELD_INDEX = {field: index for index, field in enumerate(SAMPLE_FIELDS)}
+# Cgroup files read on every sample
+SAMPLED_FILES = ["cpu.stat", "memory.current", "memory.stat", "io.stat", "cpu.pressure", "memory.pressure", "io.pressure"]
+READ_SIZE = 64 * 1024
+
+
+class SampleRingBuffer:
+    """Fixed-size history of samples, the oldest ones are overwritten."""
+
+    def __init__(self, capacity, width):
+        self.samples = np.full((capacity, width), np.nan)
+        self.capacity = capacity
+        self.next = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, sample):
+        with self.lock:
+            self.samples[self.next] = sample
+            self.next = (self.next + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def last(self, n=None):
+        """Get a copy of the last n samples (all of them by default), oldest first."""
+        with self.lock:
+            n = self.count if n is None else max(0, min(n, self.count))
+            indices = (self.next - n + np.arange(n)) % self.capacity
+            return self.samples[indices].copy()
+
+
+def parse_keyed_values(text):
+    # "key value" lines of cpu.stat and memory.stat
+    values = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            values[parts[0]] = int(parts[1])
+    return values
+
+
+def parse_io_stat(text):
+    # One "MAJ:MIN rbytes=.. wbytes=.. rios=.. wios=.. dbytes=.. dios=.." line per device, summed
+    totals = {"rbytes": 0, "wbytes": 0, "rios": 0, "wios": 0}
+    for line in text.splitlines():
+        for field in line.split()[1:]:
+            key, _, value = field.partition("=")
+            if key in totals:
+                totals[key] += int(value)
+    return totals
+
+
+def parse_pressure(text):
+    # "some avg10=.. avg60=.. avg300=.. total=<usec>" and "full ..." lines
+    totals = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if parts and parts[-1].startswith("total="):
+            totals[parts[0]] = int(parts[-1].split("=")[1])
+    return totals
+
 
 class CGroupMonitor:
-    def __init__(self, cgroup_name, cgroup_base_path="/sys/fs/cgroup"):
+    def __init__(self, cgroup_name, cgroup_base_path="/sys/fs/cgroup", history_seconds=CGROUP_HISTORY_SECONDS):
         self.cgroup_name = cgroup_name
         self.cgroup_base_path = cgroup_base_path
         self.cgroup_path = os.path.join(cgroup_base_path, cgroup_name)
+        self.history_seconds = history_seconds
 
         self.monitoring = False
-        self.cpu_usage_percentages = []
-        self.memory_usage = []
+        self.interval = CGROUP_SAMPLE_INTERVAL
+        self.history = None
+        self.file_descriptors = {}
         self.monitor_thread = None
         self.start_time = None
+        self.memory_limit = 0
+        self.num_cores = os.cpu_count()
 
     def get_cpu_usage_us(self):
         """Get the cumulative CPU usage in microseconds."""
@@ -61,7 +149,7 @@ class CGroupMonitor:
         except FileNotFoundError:
             pass
         return 0
-    
+
     def get_swap_limit(self):
         """Get the swap limit in bytes."""
         swap_max_path = os.path.join(self.cgroup_path, "memory.swap.max")
@@ -72,62 +160,175 @@ class CGroupMonitor:
             pass
         return
 
-    def _monitor(self, interval):
-        """Internal method to monitor CPU and memory usage."""
-        previous_cpu_usage = self.get_cpu_usage_us()
-        while self.monitoring:
-            time.sleep(interval)
+    def _open_files(self):
+        """Open the sampled cgroup files once, missing controllers are skipped."""
+        for name in SAMPLED_FILES:
+            try:
+                self.file_descriptors[name] = os.open(os.path.join(self.cgroup_path, name), os.O_RDONLY)
+            except OSError:
+                pass
 
-            # CPU percentage calculation
-            current_cpu_usage = self.get_cpu_usage_us()
-            delta_cpu_usage = current_cpu_usage - previous_cpu_usage
-            previous_cpu_usage = current_cpu_usage
+    def _close_files(self):
+        for fd in self.file_descriptors.values():
+            os.close(fd)
+        self.file_descriptors = {}
 
-            quota, period = self.get_cpu_limit()
-            num_cores = quota / period if quota else os.cpu_count()
-            total_cpu_time_available = num_cores * (interval * 1000000)
-            cpu_usage_percentage = (delta_cpu_usage / total_cpu_time_available) * 100
+    def _read(self, name):
+        """Read a cgroup file from the start of its open descriptor, None if it is not available."""
+        fd = self.file_descriptors.get(name)
+        if fd is None:
+            return None
+        try:
+            return os.pread(fd, READ_SIZE, 0).decode()
+        except OSError:
+            return None
 
-            # Store results
-            self.cpu_usage_percentages.append(cpu_usage_percentage)
-            self.memory_usage.append(self.get_memory_usage())
+    def _read_counters(self):
+        """Read the cumulative counters and the current memory usage."""
+        counters = {"time": time.monotonic()}
+        cpu_stat = self._read("cpu.stat")
+        if cpu_stat is not None:
+            counters["cpu_usage_usec"] = parse_keyed_values(cpu_stat).get("usage_usec", 0)
+        memory_current = self._read("memory.current")
+        if memory_current is not None:
+            counters["memory_bytes"] = int(memory_current.strip())
+        memory_stat = self._read("memory.stat")
+        if memory_stat is not None:
+            stat = parse_keyed_values(memory_stat)
+            for key in ("anon", "file", "dirty", "writeback"):
+                counters[f"memory_{key}_bytes"] = stat.get(key, np.nan)
+        io_stat = self._read("io.stat")
+        if io_stat is not None:
+            counters.update({f"io_{key}": value for key, value in parse_io_stat(io_stat).items()})
+        for resource in ("cpu", "memory", "io"):
+            pressure = self._read(f"{resource}.pressure")
+            if pressure is not None:
+                for kind, total in parse_pressure(pressure).items():
+                    counters[f"{resource}_pressure_{kind}_usec"] = total
+        return counters
 
-    def start_monitoring(self, interval=1):
-        """Start monitoring CPU and memory usage."""
+    def _sample(self, previous, current):
+        """Turn two consecutive counter readings into a sample row."""
+        elapsed = current["time"] - previous["time"]
+        sample = np.full(len(SAMPLE_FIELDS), np.nan)
+        sample[FIELD_INDEX["time"]] = current["time"] - self.start_monotonic
+
+        def rate(counter):
+            if counter in current and counter in previous and elapsed > 0:
+                return (current[counter] - previous[counter]) / elapsed
+            return np.nan
+
+        sample[FIELD_INDEX["cpu_usage_percent"]] = rate("cpu_usage_usec") / (self.num_cores * 1000000) * 100
+        for field in ("memory_bytes", "memory_anon_bytes", "memory_file_bytes", "memory_dirty_bytes", "memory_writeback_bytes"):
+            sample[FIELD_INDEX[field]] = current.get(field, np.nan)
+        sample[FIELD_INDEX["io_read_bytes_per_sec"]] = rate("io_rbytes")
+        sample[FIELD_INDEX["io_write_bytes_per_sec"]] = rate("io_wbytes")
+        sample[FIELD_INDEX["io_read_ops_per_sec"]] = rate("io_rios")
+        sample[FIELD_INDEX["io_write_ops_per_sec"]] = rate("io_wios")
+        for resource, kind in (("cpu", "some"), ("memory", "some"), ("memory", "full"), ("io", "some"), ("io", "full")):
+            sample[FIELD_INDEX[f"{resource}_pressure_{kind}_percent"]] = rate(f"{resource}_pressure_{kind}_usec") / 1000000 * 100
+        return sample
+
+    def _monitor(self, interval):
+        """Internal method to sample the cgroup at a fixed interval."""
+        previous = self._read_counters()
+        next_sample = time.monotonic()
+        while self.monitoring:
+            # Sleep until the next tick so reading the files does not shift the sampling period
+            next_sample += interval
+            time.sleep(max(0, next_sample - time.monotonic()))
+
+            current = self._read_counters()
+            self.history.append(self._sample(previous, current))
+            previous = current
+
+    def start_monitoring(self, interval=None):
+        """Start sampling the cgroup every interval seconds."""
         if self.monitoring:
             raise RuntimeError("Monitoring is already running.")
 
+        self.interval = interval or CGROUP_SAMPLE_INTERVAL
+        self.history = SampleRingBuffer(max(1, int(self.history_seconds / self.interval)), len(SAMPLE_FIELDS))
+
+        # The limits do not change during a run, they are read once
+        quota, period = self.get_cpu_limit()
+        self.num_cores = quota / period if quota else os.cpu_count()
+        try:
+            self.memory_limit = self.get_memory_limit()
+        except ValueError:
+            # memory.max is "max"
+            self.memory_limit = 0
+        self._open_files()
+
         self.monitoring = True
-        self.cpu_usage_percentages = []
-        self.memory_usage = []
         self.start_time = time.time()
-        self.monitor_thread = threading.Thread(target=self._monitor, args=(interval,), daemon=True)
+        self.start_monotonic = time.monotonic()
+        self.monitor_thread = threading.Thread(target=self._monitor, args=(self.interval,), daemon=True)
         self.monitor_thread.start()
 
-    def get_last_n_stats(self, n=1):
-        """Get the last n stats recorded. Returns same format as stop_monitoring."""
-        if not self.monitoring:
-            raise RuntimeError("Monitoring is not running.")
-        
-        avg_cpu = sum(self.cpu_usage_percentages[-n:]) / n if self.cpu_usage_percentages else 0
-        avg_memory = sum(self.memory_usage[-n:]) / n if self.memory_usage else 0
-        avg_memory_gb = avg_memory / (1024 * 1024 * 1024)
-        avg_memory_percent = (avg_memory / self.get_memory_limit()) * 100 if self.get_memory_limit() else 0
+    def samples(self, seconds=None):
+        """Get the samples of the last seconds (all recorded samples by default) as a (samples, fields) array."""
+        if self.history is None:
+            return np.empty((0, len(SAMPLE_FIELDS)))
+        n = None if seconds is None else int(round(seconds / self.interval))
+        return self.history.last(n)
+
+    def percentile(self, field, q, seconds=None):
+        """Get the q-th percentile of a sample field over the last seconds."""
+        values = self.samples(seconds)[:, FIELD_INDEX[field]]
+        values = values[~np.isnan(values)]
+        return float(np.percentile(values, q)) if len(values) else 0.0
+
+    def _summarize(self, samples):
+        """Summarize samples into the usage statistics of a run."""
+        def column(field):
+            values = samples[:, FIELD_INDEX[field]]
+            return values[~np.isnan(values)]
+
+        def average(field):
+            values = column(field)
+            return float(values.mean()) if len(values) else 0.0
 
-        max_cpu = max(self.cpu_usage_percentages[-n:], default=0)
-        max_memory = max(self.memory_usage[-n:], default=0)
-        max_memory_gb = max_memory / (1024 * 1024 * 1024)
-        max_memory_percent = (max_memory / self.get_memory_limit()) * 100 if self.get_memory_limit() else 0
+        def maximum(field):
+            values = column(field)
+            return float(values.max()) if len(values) else 0.0
+
+        def p99(field):
+            values = column(field)
+            return float(np.percentile(values, 99)) if len(values) else 0.0
+
+        gib = 1024 * 1024 * 1024
+        mib = 1024 * 1024
+        avg_memory = average("memory_bytes")
+        max_memory = maximum("memory_bytes")
 
         return {
-            "average_cpu_usage_percent": round(avg_cpu, 2),
-            "average_memory_usage_gib": round(avg_memory_gb, 2),
-            "average_memory_usage_percent": round(avg_memory_percent, 2),
-            "max_cpu_usage_percent": round(max_cpu, 2),
-            "max_memory_usage_gib": round(max_memory_gb, 2),
-            "max_memory_usage_percent": round(max_memory_percent, 2)
+            "average_cpu_usage_percent": round(average("cpu_usage_percent"), 2),
+            "average_memory_usage_gib": round(avg_memory / gib, 2),
+            "average_memory_usage_percent": round(avg_memory / self.memory_limit * 100, 2) if self.memory_limit else 0,
+            "max_cpu_usage_percent": round(maximum("cpu_usage_percent"), 2),
+            "max_memory_usage_gib": round(max_memory / gib, 2),
+            "max_memory_usage_percent": round(max_memory / self.memory_limit * 100, 2) if self.memory_limit else 0,
+            "p99_cpu_usage_percent": round(p99("cpu_usage_percent"), 2),
+            "average_memory_dirty_mib": round(average("memory_dirty_bytes") / mib, 2),
+            "average_io_read_mib_per_sec": round(average("io_read_bytes_per_sec") / mib, 2),
+            "average_io_write_mib_per_sec": round(average("io_write_bytes_per_sec") / mib, 2),
+            "average_io_read_iops": round(average("io_read_ops_per_sec"), 2),
+            "average_io_write_iops": round(average("io_write_ops_per_sec"), 2),
+            "average_cpu_pressure_percent": round(average("cpu_pressure_some_percent"), 2),
+            "average_memory_pressure_percent": round(average("memory_pressure_some_percent"), 2),
+            "average_io_pressure_percent": round(average("io_pressure_some_percent"), 2),
+            "max_io_pressure_percent": round(maximum("io_pressure_some_percent"), 2),
+            "average_io_full_pressure_percent": round(average("io_pressure_full_percent"), 2),
         }
 
+    def get_last_n_stats(self, n=1):
+        """Get the stats of the last n seconds. Returns same format as stop_monitoring."""
+        if not self.monitoring:
+            raise RuntimeError("Monitoring is not running.")
+
+        return self._summarize(self.samples(n))
+
     def stop_monitoring(self):
         """Stop monitoring and return average and max usage stats."""
         if not self.monitoring:
@@ -136,24 +337,9 @@ class CGroupMonitor:
         self.monitoring = False
         self.monitor_thread.join()
         self.monitor_thread = None
+        self._close_files()
         total_time = time.time() - self.start_time
 
-        avg_cpu = sum(self.cpu_usage_percentages) / len(self.cpu_usage_percentages) if self.cpu_usage_percentages else 0
-        avg_memory = sum(self.memory_usage) / len(self.memory_usage) if self.memory_usage else 0
-        avg_memory_gb = avg_memory / (1024 * 1024 * 1024)
-        avg_memory_percent = (avg_memory / self.get_memory_limit()) * 100 if self.get_memory_limit() else 0
-
-        max_cpu = max(self.cpu_usage_percentages, default=0)
-        max_memory = max(self.memory_usage, default=0)
-        max_memory_gb = max_memory / (1024 * 1024 * 1024)
-        max_memory_percent = (max_memory / self.get_memory_limit()) * 100 if self.get_memory_limit() else 0
-
-        return {
-            "average_cpu_usage_percent": round(avg_cpu, 2),
-            "average_memory_usage_gib": round(avg_memory_gb, 2),
-            "average_memory_usage_percent": round(avg_memory_percent, 2),
-            "max_cpu_usage_percent": round(max_cpu, 2),
-            "max_memory_usage_gib": round(max_memory_gb, 2),
-            "monitoring_duration_s": round(total_time, 2),
-            "max_memory_usage_percent": round(max_memory_percent, 2)
-        }
+        stats = self._summarize(self.samples())
+        stats["monitoring_duration_s"] = round(total_time, 2)
+        return stats
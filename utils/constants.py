@@ -114,11 +114,26 @@ env_SIDE_CHECKER = str2bool(os.getenv("SIDE_CHECKER", True))
 env_ERROR_CORRECTION_COUNT = os.getenv("ERROR_CORRECTION_COUNT", 2)
 env_FINETUNE_ITERATION = os.getenv("FINETUNE_ITERATION", 2)
 env_DYNAMIC_OPTION_TUNING = os.getenv("DYNAMIC_OPTION_TUNING", False)
+# Sequential test that stops candidates dominated by the parent's interval throughput
+env_EARLY_STOP = str2bool(os.getenv("EARLY_STOP", False))
+env_EARLY_STOP_CONFIDENCE = os.getenv("EARLY_STOP_CONFIDENCE", 0.95)
+env_EARLY_STOP_MIN_SECONDS = os.getenv("EARLY_STOP_MIN_SECONDS", 30)
+# Stop a run once its steady-state throughput is known within the relative precision, DURATION becomes an upper bound
+env_STEADY_STATE = str2bool(os.getenv("STEADY_STATE", False))
+env_STEADY_STATE_PRECISION = os.getenv("STEADY_STATE_PRECISION", 0.02)
+env_STEADY_STATE_MIN_SECONDS = os.getenv("STEADY_STATE_MIN_SECONDS", 60)
 env_LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
 env_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+env_LLM_MAX_CONCURRENCY = os.getenv("LLM_MAX_CONCURRENCY", 4)
+env_LLM_MAX_RETRIES = os.getenv("LLM_MAX_RETRIES", 5)
+env_LLM_CACHE = os.getenv("LLM_CACHE", "on")
+env_LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache/responses.sqlite")
+env_LLM_CACHE_TTL = os.getenv("LLM_CACHE_TTL", 0)
+env_LLM_CACHE_MAX_ENTRIES = os.getenv("LLM_CACHE_MAX_ENTRIES", 10000)
 env_RAG = str2bool(os.getenv("RAG", False))
 env_ABSTRACTION = str2bool(os.getenv("ABSTRACTION", False))
 env_TRACEFILE_PATH = os.getenv("TRACEFILE_PATH", None)
+env_NATIVE_TRACE_ANALYZER = str2bool(os.getenv("NATIVE_TRACE_ANALYZER", True))
 env_PRE_LOAD_CMD = os.getenv("PRE_LOAD_CMD", None)
 # If the pre-load db path is set, Sesame will simply copy the db to the db path
 # If the pre-load db path is not set, Sesame will run the pre-load command
@@ -127,6 +142,43 @@ env_ENABLE_MCTS = str2bool(os.getenv("ENABLE_MCTS", True))
 env_ENABLE_ONE_SHOT = str2bool(os.getenv("ENABLE_ONE_SHOT", True))
 env_ENABLE_UNKNOWN = str2bool(os.getenv("ENABLE_UNKNOWN", False))
 env_LOAD_RECORDS = str2bool(os.getenv("LOAD_RECORDS", False))
+env_SELECTION_POLICY = os.getenv("SELECTION_POLICY", "llm")
+env_EXPLORATION_CONSTANT = os.getenv("EXPLORATION_CONSTANT", 1.0)
+env_SURROGATE = str2bool(os.getenv("SURROGATE", False))
+env_SURROGATE_CANDIDATES = os.getenv("SURROGATE_CANDIDATES", 6)
+env_SURROGATE_MIN_SAMPLES = os.getenv("SURROGATE_MIN_SAMPLES", 5)
+env_SURROGATE_KAPPA = os.getenv("SURROGATE_KAPPA", 1.0)
+env_SURROGATE_RECORDS = os.getenv("SURROGATE_RECORDS", "records/*/records.txt")
+env_PARALLEL_SLOTS = os.getenv("PARALLEL_SLOTS", 1)
+env_SLOT_CPUS = os.getenv("SLOT_CPUS", 2)
+env_OPTION_SCHEDULE = str2bool(os.getenv("OPTION_SCHEDULE", False))
+env_RESULTS_STORE = str2bool(os.getenv("RESULTS_STORE", True))
+env_RESULTS_STORE_PATH = os.getenv("RESULTS_STORE_PATH", "results/results.sqlite")
+env_FIO_CACHE_MAX_AGE_DAYS = os.getenv("FIO_CACHE_MAX_AGE_DAYS", 30)
+env_FIO_RUNTIME = os.getenv("FIO_RUNTIME", 20)
+env_CGROUP_SAMPLE_INTERVAL = os.getenv("CGROUP_SAMPLE_INTERVAL", 0.25)
+env_CGROUP_HISTORY_SECONDS = os.getenv("CGROUP_HISTORY_SECONDS", 3600)
+# Preloaded databases are cached by load parameters and restored with hardlinks/reflinks
+# "candidate" loads with the candidate options file, "initial" loads every candidate with the initial options file
+env_SNAPSHOT_CACHE = str2bool(os.getenv("SNAPSHOT_CACHE", True))
+env_SNAPSHOT_LOAD_OPTIONS = os.getenv("SNAPSHOT_LOAD_OPTIONS", "candidate")
+env_SNAPSHOT_CACHE_BUDGET_GB = os.getenv("SNAPSHOT_CACHE_BUDGET_GB", 100)
+# Successive halving: children first run at HALVING_MIN_FIDELITY of the duration and size, the best 1/HALVING_ETA are promoted
+env_SUCCESSIVE_HALVING = str2bool(os.getenv("SUCCESSIVE_HALVING", False))
+env_HALVING_ETA = os.getenv("HALVING_ETA", 3)
+# The default 1/eta^2 spends about as much time on each of the three rungs
+env_HALVING_MIN_FIDELITY = os.getenv("HALVING_MIN_FIDELITY", 0.11)
+# Checks of a candidate before the database is reset: "schema" checks the options against the models, "probe" also loads them with db_bench
+env_PREFLIGHT = os.getenv("PREFLIGHT", "probe")
+# Hot swap: siblings that only change mutable options run as segments of one db_bench run of their parent, switched with SetOptions
+env_HOT_SWAP = str2bool(os.getenv("HOT_SWAP", False))
+env_HOT_SWAP_SEGMENT_SECONDS = os.getenv("HOT_SWAP_SEGMENT_SECONDS", 60)
+env_HOT_SWAP_SETTLE_SECONDS = os.getenv("HOT_SWAP_SETTLE_SECONDS", 10)
+# Database checkpoints of the nodes: "save" keeps the end state of every run, "inherit" also starts children from the state of their parent
+env_DB_CHECKPOINT = os.getenv("DB_CHECKPOINT", "off")
+env_DB_CHECKPOINT_BUDGET_GB = os.getenv("DB_CHECKPOINT_BUDGET_GB", 50)
+# Tree checkpoint of an interrupted search to continue from
+env_RESUME = os.getenv("RESUME", "")
 
 
 # Parse the arguments. They replace the environment variables if they are set
@@ -144,11 +196,25 @@ parser.add_argument('-s', '--side_checker', type=str2bool, default=env_SIDE_CHEC
 parser.add_argument('-ec', '--error_correction_count', type=int, default=env_ERROR_CORRECTION_COUNT, help='Specify the error correction count')
 parser.add_argument('-f', '--finetune_iteration', type=int, default=env_FINETUNE_ITERATION, help='Specify the Number of Fine-Tuning Iterations')
 parser.add_argument('-dt', '--dynamic_option_tuning', type=str2bool, default=env_DYNAMIC_OPTION_TUNING, help='Specify if dynamic option tuning is enabled')
+parser.add_argument('--option_schedule', type=str2bool, default=env_OPTION_SCHEDULE, help='Specify if children can carry a schedule of option changes replayed while they are benchmarked')
+parser.add_argument('--early_stop', type=str2bool, default=env_EARLY_STOP, help='Specify if candidates dominated by the parent throughput are stopped early')
+parser.add_argument('--early_stop_confidence', type=float, default=env_EARLY_STOP_CONFIDENCE, help='Specify the confidence level of the early stop test')
+parser.add_argument('--early_stop_min_seconds', type=int, default=env_EARLY_STOP_MIN_SECONDS, help='Specify the minimum run time in seconds before a candidate can be stopped early')
+parser.add_argument('--steady_state', type=str2bool, default=env_STEADY_STATE, help='Specify if runs are scored on their steady-state throughput and stop once it is known')
+parser.add_argument('--steady_state_precision', type=float, default=env_STEADY_STATE_PRECISION, help='Specify the relative half width of the steady-state confidence interval')
+parser.add_argument('--steady_state_min_seconds', type=int, default=env_STEADY_STATE_MIN_SECONDS, help='Specify the minimum run time in seconds before steady-state detection can stop a run')
 parser.add_argument('-m', '--llm_model', type=str, default=env_LLM_MODEL, help='Specify the LLM model to use')
 parser.add_argument('-e', '--embedding_model', type=str, default=env_EMBEDDING_MODEL, help='Specify the embedding model to use')
+parser.add_argument('--llm_max_concurrency', type=int, default=env_LLM_MAX_CONCURRENCY, help='Specify the maximum number of LLM requests in flight')
+parser.add_argument('--llm_max_retries', type=int, default=env_LLM_MAX_RETRIES, help='Specify the number of retries of a failed LLM request')
+parser.add_argument('--llm_cache', type=str, choices=["off", "on", "replay"], default=env_LLM_CACHE, help='Specify if LLM responses are cached, replay only answers from the cache')
+parser.add_argument('--llm_cache_path', type=str, default=env_LLM_CACHE_PATH, help='Specify the path of the LLM response cache database')
+parser.add_argument('--llm_cache_ttl', type=int, default=env_LLM_CACHE_TTL, help='Specify the time to live of cached LLM responses in seconds, 0 keeps them forever')
+parser.add_argument('--llm_cache_max_entries', type=int, default=env_LLM_CACHE_MAX_ENTRIES, help='Specify the number of cached LLM responses kept, 0 for no limit')
 parser.add_argument('-r', '--rag', type=str2bool, default=env_RAG, help='Specify if RAG is enabled')
 parser.add_argument('-a', '--abstraction', type=str2bool, default=env_ABSTRACTION, help='Specify if using Abstraction or not')
 parser.add_argument('--tracefile_path', type=str, default=env_TRACEFILE_PATH, help='Specify the path of the tracefile')
+parser.add_argument('--native_trace_analyzer', type=str2bool, default=env_NATIVE_TRACE_ANALYZER, help='Specify if the tracefile is read in process instead of with trace_analyzer')
 parser.add_argument('--pre_load_cmd', type=str, default=env_PRE_LOAD_CMD, help='Specify the pre-load command')
 parser.add_argument('--pre_load_db_path', type=str, default=env_PRE_LOAD_DB_PATH, help='Specify the pre-load db path')
 parser.add_argument('--enable_mcts', type=str2bool, default=env_ENABLE_MCTS, help='Specify if MCTS is enabled')
@@ -158,6 +224,34 @@ parser.add_argument('-exp', '--examples', type=str, default=env_EXAMPLES_PATH, h
 parser.add_argument('-ins', '--insights', type=str, default=env_INSIGHTS_PATH, help='Specify the insights path')
 parser.add_argument('--enable_unknown', type=str2bool, default=env_ENABLE_UNKNOWN, help='Specify if unknown is enabled')
 parser.add_argument('--load_records', type=str2bool, default=env_LOAD_RECORDS, help='Specify if load records is enabled')
+parser.add_argument('--selection_policy', type=str, choices=["llm", "uct", "puct"], default=env_SELECTION_POLICY, help='Specify how the next node to explore is selected')
+parser.add_argument('--exploration_constant', type=float, default=env_EXPLORATION_CONSTANT, help='Specify the exploration constant of the UCT and PUCT tree policies')
+parser.add_argument('--surrogate', type=str2bool, default=env_SURROGATE, help='Specify if a surrogate model screens the generated children before they are benchmarked')
+parser.add_argument('--surrogate_candidates', type=int, default=env_SURROGATE_CANDIDATES, help='Specify the number of children generated for the surrogate to screen')
+parser.add_argument('--surrogate_min_samples', type=int, default=env_SURROGATE_MIN_SAMPLES, help='Specify the number of benchmarked configurations needed to train the surrogate')
+parser.add_argument('--surrogate_kappa', type=float, default=env_SURROGATE_KAPPA, help='Specify the weight of the prediction uncertainty when ranking candidates')
+parser.add_argument('--surrogate_records', type=str, default=env_SURROGATE_RECORDS, help='Specify the glob of the records files used to train the surrogate')
+parser.add_argument('--parallel_slots', type=int, default=env_PARALLEL_SLOTS, help='Specify the number of sibling nodes benchmarked at the same time')
+parser.add_argument('--slot_cpus', type=int, default=env_SLOT_CPUS, help='Specify the number of CPU cores pinned to each benchmark slot')
+parser.add_argument('--results_store', type=str2bool, default=env_RESULTS_STORE, help='Specify if benchmarks, nodes and LLM usage are recorded in the results store')
+parser.add_argument('--results_store_path', type=str, default=env_RESULTS_STORE_PATH, help='Specify the path of the results store database shared by all runs')
+parser.add_argument('--fio_cache_max_age_days', type=float, default=env_FIO_CACHE_MAX_AGE_DAYS, help='Specify the age in days after which the cached fio profile of a device is rerun, 0 keeps it forever')
+parser.add_argument('--fio_runtime', type=int, default=env_FIO_RUNTIME, help='Specify the runtime in seconds of every fio profile job')
+parser.add_argument('--cgroup_sample_interval', type=float, default=env_CGROUP_SAMPLE_INTERVAL, help='Specify the interval in seconds between two samples of the benchmark cgroup')
+parser.add_argument('--cgroup_history_seconds', type=int, default=env_CGROUP_HISTORY_SECONDS, help='Specify how many seconds of cgroup samples are kept')
+parser.add_argument('--snapshot_cache', type=str2bool, default=env_SNAPSHOT_CACHE, help='Specify if preloaded databases are cached and restored from snapshots')
+parser.add_argument('--snapshot_load_options', type=str, choices=["candidate", "initial"], default=env_SNAPSHOT_LOAD_OPTIONS, help='Specify which options file is used to preload the database, with initial all the candidates share one snapshot')
+parser.add_argument('--snapshot_cache_budget_gb', type=float, default=env_SNAPSHOT_CACHE_BUDGET_GB, help='Specify the disk space in GB of the snapshot cache before the least recently used snapshots are evicted')
+parser.add_argument('--successive_halving', type=str2bool, default=env_SUCCESSIVE_HALVING, help='Specify if children are screened with short runs before the best are run at full size')
+parser.add_argument('--halving_eta', type=int, default=env_HALVING_ETA, help='Specify the fraction 1/eta of the children promoted to the next fidelity')
+parser.add_argument('--halving_min_fidelity', type=float, default=env_HALVING_MIN_FIDELITY, help='Specify the fraction of the duration and number of entries of the first successive halving runs')
+parser.add_argument('--preflight', type=str, choices=["off", "schema", "probe"], default=env_PREFLIGHT, help='Specify how candidates are validated before the database is reset and preloaded')
+parser.add_argument('--hot_swap', type=str2bool, default=env_HOT_SWAP, help='Specify if siblings changing only mutable options are benchmarked in segments of a single run')
+parser.add_argument('--hot_swap_segment_seconds', type=int, default=env_HOT_SWAP_SEGMENT_SECONDS, help='Specify the duration in seconds of every hot swap segment')
+parser.add_argument('--hot_swap_settle_seconds', type=int, default=env_HOT_SWAP_SETTLE_SECONDS, help='Specify the seconds at the start of a hot swap segment left out of its throughput')
+parser.add_argument('--db_checkpoint', type=str, choices=["off", "save", "inherit"], default=env_DB_CHECKPOINT, help='Specify if the databases of the nodes are checkpointed and if children continue from the checkpoint of their parent')
+parser.add_argument('--db_checkpoint_budget_gb', type=float, default=env_DB_CHECKPOINT_BUDGET_GB, help='Specify the disk space in GB of the database checkpoints before the least recently used are evicted')
+parser.add_argument('--resume', type=str, default=env_RESUME, help='Specify the tree checkpoint of an interrupted search to resume')
 parser.add_argument('--sine_write_rate_interval_milliseconds', type=int, default=env_SINE_WRITE_RATE_INTERVAL_MILLISECONDS, help='Specify the sine write rate interval in milliseconds')
 parser.add_argument('--sine_a', type=float, default=env_SINE_A, help='Specify the sine parameter a')
 parser.add_argument('--sine_b', type=float, default=env_SINE_B, help='Specify the sine parameter b')
@@ -181,17 +275,59 @@ SIDE_CHECKER = args.side_checker
 ERROR_CORRECTION_COUNT = args.error_correction_count
 FINETUNE_ITERATION = args.finetune_iteration
 DYNAMIC_OPTION_TUNING = args.dynamic_option_tuning
+OPTION_SCHEDULE = args.option_schedule
+EARLY_STOP = args.early_stop
+EARLY_STOP_CONFIDENCE = args.early_stop_confidence
+EARLY_STOP_MIN_SECONDS = args.early_stop_min_seconds
+STEADY_STATE = args.steady_state
+STEADY_STATE_PRECISION = args.steady_state_precision
+STEADY_STATE_MIN_SECONDS = args.steady_state_min_seconds
 LLM_MODEL = args.llm_model
 EMBEDDING_MODEL = args.embedding_model
+LLM_MAX_CONCURRENCY = args.llm_max_concurrency
+LLM_MAX_RETRIES = args.llm_max_retries
+LLM_CACHE = args.llm_cache
+LLM_CACHE_PATH = args.llm_cache_path
+LLM_CACHE_TTL = args.llm_cache_ttl
+LLM_CACHE_MAX_ENTRIES = args.llm_cache_max_entries
 RAG = args.rag
 ABSTRACTION = args.abstraction
 TRACEFILE_PATH = args.tracefile_path
+NATIVE_TRACE_ANALYZER = args.native_trace_analyzer
 PRE_LOAD_CMD = args.pre_load_cmd
 PRE_LOAD_DB_PATH = args.pre_load_db_path
 ENABLE_MCTS = args.enable_mcts
 ENABLE_ONE_SHOT = args.enable_one_shot
 ENABLE_UNKNOWN = args.enable_unknown
 LOAD_RECORDS = args.load_records
+SELECTION_POLICY = args.selection_policy
+EXPLORATION_CONSTANT = args.exploration_constant
+SURROGATE = args.surrogate
+SURROGATE_CANDIDATES = args.surrogate_candidates
+SURROGATE_MIN_SAMPLES = args.surrogate_min_samples
+SURROGATE_KAPPA = args.surrogate_kappa
+SURROGATE_RECORDS = args.surrogate_records
+PARALLEL_SLOTS = args.parallel_slots
+SLOT_CPUS = args.slot_cpus
+RESULTS_STORE = args.results_store
+RESULTS_STORE_PATH = args.results_store_path
+FIO_CACHE_MAX_AGE_DAYS = args.fio_cache_max_age_days
+FIO_RUNTIME = args.fio_runtime
+CGROUP_SAMPLE_INTERVAL = args.cgroup_sample_interval
+CGROUP_HISTORY_SECONDS = args.cgroup_history_seconds
+SNAPSHOT_CACHE = args.snapshot_cache
+SNAPSHOT_LOAD_OPTIONS = args.snapshot_load_options
+SNAPSHOT_CACHE_BUDGET_GB = args.snapshot_cache_budget_gb
+SUCCESSIVE_HALVING = args.successive_halving
+HALVING_ETA = args.halving_eta
+HALVING_MIN_FIDELITY = args.halving_min_fidelity
+PREFLIGHT = args.preflight
+HOT_SWAP = args.hot_swap
+HOT_SWAP_SEGMENT_SECONDS = args.hot_swap_segment_seconds
+HOT_SWAP_SETTLE_SECONDS = args.hot_swap_settle_seconds
+DB_CHECKPOINT = args.db_checkpoint
+DB_CHECKPOINT_BUDGET_GB = args.db_checkpoint_budget_gb
+RESUME = args.resume
 SINE_WRITE_RATE_INTERVAL_MILLISECONDS = args.sine_write_rate_interval_milliseconds
 SINE_A = args.sine_a
 SINE_B = args.sine_b
@@ -207,23 +343,29 @@ SINE_D = args.sine_d
 # FIO_RESULT_PATH = os.path.join(HOME_PATH, f"fio/fio_output_{DEVICE}.txt")
 
 DB_BENCH_PATH = f"/home/alice/rocksdb-8.8.1/db_bench"
+LDB_PATH = f"/home/alice/rocksdb-8.8.1/ldb"
 TRACE_ANALYZER_PATH = f"/home/alice/rocksdb-8.8.1/trace_analyzer"
 DB_PATH = f"/home/alice/gpt_project/db"
+SNAPSHOT_CACHE_DIR = f"/home/alice/gpt_project/snapshot_cache"
 FIO_RESULT_PATH = f"/home/alice/fio/fio_output_{DEVICE}.txt"
 
 DEFAULT_OPTION_FILE_DIR = "options_files/default_options_files"
 INITIAL_OPTIONS_FILE_NAME = f"dbbench_default_options-{VERSION}.ini"
 OPTIONS_FILE_DIR = f"{OUTPUT_PATH}/options_file.ini"
 RECORDS_FILE_DIR = f"{RECORDS_PATH}/records.txt"
+TREE_CHECKPOINT_FILE_DIR = f"{OUTPUT_PATH}/tree_checkpoint.json"
 EXAMPLES_FILE_DIR = f"{EXAMPLES_PATH}/examples.txt"
 POSITIVE_INSIGHTS_FILE_DIR = f"{INSIGHTS_PATH}/positive_insights.txt"
 NEGATIVE_INSIGHTS_FILE_DIR = f"{INSIGHTS_PATH}/negative_insights.txt"
 
 # Path Constants docker
 # DB_BENCH_PATH = f"/rocksdb-{VERSION}/db_bench"
+# LDB_PATH = f"/rocksdb-{VERSION}/ldb"
 # TRACE_ANALYZER_PATH = f"/rocksdb-{VERSION}/trace_analyzer"
 # DB_PATH = f"/{DEVICE}/gpt_project/db"
+# SNAPSHOT_CACHE_DIR = f"/{DEVICE}/gpt_project/snapshot_cache"
 # FIO_RESULT_PATH = f"data/fio/fio_output_{DEVICE}.txt"
 # DEFAULT_OPTION_FILE_DIR = "options_files/default_options_files"
 # INITIAL_OPTIONS_FILE_NAME = f"dbbench_default_options-{VERSION}.ini"
 # OPTIONS_FILE_DIR = f"{OUTPUT_PATH}/options_file.ini"
+# TREE_CHECKPOINT_FILE_DIR = f"{OUTPUT_PATH}/tree_checkpoint.json"
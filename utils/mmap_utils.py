@@ -2,22 +2,71 @@ import mmap
 import os
 import struct
 import re
+import threading
 import time
 
 from utils.utils import log_update
+from options_files.ops_options_file import canonical_value, parse_option_file_to_dict, parse_db_bench_args_to_dict
 
 mmap_file_path = "/tmp/mmap_file.mmap"
-mmap_size = 1024
+mmap_size = 4096
 
-def create_mmap_file():
-    if not(os.path.exists(mmap_file_path)):
-        with open(mmap_file_path, "wb") as f:
+# Layout of the dynamic options file, mirrored by LoadAndApplyDynamicOptions in db_bench_dynamic_opts/db_bench_tool.cc
+# Header: magic, version, sequence, field count, entry size, sequence applied by db_bench
+# The sequence is a seqlock: odd while the table is being written, even once it is complete
+MMAP_MAGIC = 0x504F4452  # "RDOP"
+MMAP_VERSION = 1
+HEADER = struct.Struct("<IIQIIQ32x")
+SEQUENCE_OFFSET = 8
+# Entry: option name, value type, scope, value (8 byte number or NUL terminated string)
+NAME_SIZE = 48
+VALUE_SIZE = 24
+ENTRY = struct.Struct(f"<{NAME_SIZE}sBB6x{VALUE_SIZE}s")
+MAX_FIELDS = (mmap_size - HEADER.size) // ENTRY.size
+
+TYPE_INT64 = 1
+TYPE_UINT64 = 2
+TYPE_DOUBLE = 3
+TYPE_BOOL = 4
+TYPE_STRING = 5
+
+SCOPE_DB = 0
+SCOPE_CF = 1
+
+# Options that SetDBOptions and SetOptions accept on an open database (RocksDB 8.8)
+MUTABLE_DB_OPTIONS = [
+    'max_background_jobs', 'max_background_compactions', 'max_background_flushes', 'max_subcompactions',
+    'avoid_flush_during_shutdown', 'writable_file_max_buffer_size', 'delayed_write_rate', 'max_total_wal_size',
+    'delete_obsolete_files_period_micros', 'stats_dump_period_sec', 'stats_persist_period_sec',
+    'stats_history_buffer_size', 'max_open_files', 'bytes_per_sync', 'wal_bytes_per_sync', 'strict_bytes_per_sync',
+    'compaction_readahead_size',
+]
+MUTABLE_CF_OPTIONS = [
+    'write_buffer_size', 'max_write_buffer_number', 'arena_block_size', 'memtable_prefix_bloom_size_ratio',
+    'memtable_whole_key_filtering', 'memtable_huge_page_size', 'max_successive_merges', 'inplace_update_num_locks',
+    'disable_auto_compactions', 'soft_pending_compaction_bytes_limit', 'hard_pending_compaction_bytes_limit',
+    'level0_file_num_compaction_trigger', 'level0_slowdown_writes_trigger', 'level0_stop_writes_trigger',
+    'max_compaction_bytes', 'target_file_size_base', 'target_file_size_multiplier', 'max_bytes_for_level_base',
+    'max_bytes_for_level_multiplier', 'ttl', 'periodic_compaction_seconds', 'compression', 'bottommost_compression',
+    'sample_for_compression', 'report_bg_io_stats', 'paranoid_file_checks', 'check_flush_compaction_key_order',
+    'enable_blob_files', 'min_blob_size', 'blob_file_size', 'blob_compression_type', 'enable_blob_garbage_collection',
+    'blob_garbage_collection_age_cutoff', 'blob_garbage_collection_force_threshold', 'blob_compaction_readahead_size',
+    'blob_file_starting_level', 'memtable_max_range_deletions', 'experimental_mempurge_threshold',
+    'bottommost_file_compaction_delay',
+]
+
+def write_header(m, sequence, field_count=0):
+    struct.pack_into(HEADER.format, m, 0, MMAP_MAGIC, MMAP_VERSION, sequence, field_count, ENTRY.size, 0)
+
+def create_mmap_file(path=mmap_file_path):
+    if not(os.path.exists(path)) or os.path.getsize(path) < mmap_size:
+        with open(path, "wb") as f:
             f.write(b'\x00' * mmap_size)
     else:
-        log_update("MMap file already exists. Setting top bit to 0 to avoid db_bench reads.")
-        with open(mmap_file_path, "r+b") as f:
-            with mmap.mmap(f.fileno(), mmap_size, access=mmap.ACCESS_WRITE) as m:
-                m[0] = 0
+        log_update("MMap file already exists. Resetting the sequence to avoid db_bench reads.")
+    with open(path, "r+b") as f:
+        with mmap.mmap(f.fileno(), mmap_size, access=mmap.ACCESS_WRITE) as m:
+            write_header(m, 0)
 
 def add_mmap_file_to_option(option_file, mmap_str):
     '''
@@ -45,145 +94,230 @@ def add_mmap_file_to_option(option_file, mmap_str):
     
     return updated_option_file
 
-def convert_option_string_to_list(data):
+def encode_dynamic_option(key, value):
     '''
-    Convert the string to a mmap specific list of integers
+    Encode an option value as a typed entry value
+
+    Parameters:
+    - key (str): The option name
+    - value (str): The option value
+
+    Returns:
+    - tuple: (type, encoded value), None if the value does not fit an entry
     '''
-    dataKey = [
-        'max_open_files', 
-        'max_total_wal_size', 
-        'delete_obsolete_files_period_micros', # Currently ignored
-        'max_background_jobs', 
-        'max_background_compactions', 
-        'max_subcompactions', 
-        'stats_dump_period_sec', 
-        'compaction_readahead_size', 
-        'writable_file_max_buffer_size', 
-        'bytes_per_sync', 
-        'wal_bytes_per_sync', 
-        'delayed_write_rate', 
-        'avoid_flush_during_shutdown', 
-        'write_buffer_size', 
-        'compression', 
-        'level0_file_num_compaction_trigger', 
-        'max_bytes_for_level_base', 
-        'disable_auto_compactions', 
-        'memtable_max_range_deletions', 
-    ]
-    
-    # Extract key-value pairs from the input string using regex
-    options = {}
-    pattern = re.compile(r'(\w+)\s*=\s*([\w\.\-]+)')
-    for match in pattern.finditer(data):
-        key, value = match.groups()
-        options[key] = value
-    
-    # Create the list of values based on dataKey
-    result = []
-    for key in dataKey:
-        if key in options:
-            if options[key].lower() == 'false':
-                value = 0
-            elif options[key].lower() == 'true':
-                value = 1
-            elif 'no' in options[key].lower():
-                value = 0
-            elif 'snappy' in options[key].lower():
-                value = 1
-            elif 'zlib' in options[key].lower():
-                value = 2
-            elif 'bzip2' in options[key].lower():
-                value = 3
-            elif 'lz4' in options[key].lower():
-                value = 4
-            elif 'lz4hc' in options[key].lower():
-                value = 5
-            elif 'xpress' in options[key].lower():
-                value = 6
-            elif 'zstd' in options[key].lower():
-                value = 7
-            else:
-                try:
-                    value = int(options[key])
-                    if not(-2147483648 <= value <= 2147483647):
-                        log_update(f"Value for {key} is out of boundaries: {value}. Clamping applied.")
-                        value = max(-2147483648, min(2147483647, value))
-                except:
-                    log_update(f"Error converting value of {key} to integer: " + options[key])
-                    log_update("Forcing value to 0 for key: " + key)
-                    value = 0
+    value = canonical_value(value)
+    if value in ('true', 'false'):
+        return TYPE_BOOL, struct.pack('<q', value == 'true')
+    try:
+        number = int(value)
+        if number < -(1 << 63) or number >= (1 << 64):
+            raise ValueError
+        if number >= (1 << 63):
+            return TYPE_UINT64, struct.pack('<Q', number)
+        return TYPE_INT64, struct.pack('<q', number)
+    except ValueError:
+        pass
+    try:
+        return TYPE_DOUBLE, struct.pack('<d', float(value))
+    except ValueError:
+        pass
+    encoded = value.encode()
+    if len(encoded) >= VALUE_SIZE:
+        log_update(f"Value of {key} is too long for the dynamic options file: {value}")
+        return None
+    return TYPE_STRING, encoded
+
+def dynamic_option_fields(data):
+    '''
+    Extract the mutable options to push to the running db_bench
+
+    Parameters:
+    - data (str or dict): An options file, or a dictionary of option names and values
+
+    Returns:
+    - list: (name, scope, type, encoded value) of every mutable option
+    '''
+    if isinstance(data, str):
+        # Extract key-value pairs from the input string using regex
+        pattern = re.compile(r'(\w+)\s*=\s*([\w\.\-]+)')
+        data = {key: value for key, value in pattern.findall(data)}
+
+    fields = []
+    for key, value in data.items():
+        if key in MUTABLE_DB_OPTIONS:
+            scope = SCOPE_DB
+        elif key in MUTABLE_CF_OPTIONS:
+            scope = SCOPE_CF
         else:
-            log_update("Error key not found in options file: " + key)
-            log_update("Forcing value to 0 for key: " + key)
-            value = 0  # Default value if key is not found
-        
-        result.append(value)
-    
-    return result
+            continue
+        encoded = encode_dynamic_option(key, value)
+        if encoded is not None:
+            fields.append((key, scope) + encoded)
+
+    if len(fields) > MAX_FIELDS:
+        log_update(f"Only the first {MAX_FIELDS} of {len(fields)} dynamic options fit in the mmap file")
+        fields = fields[:MAX_FIELDS]
+    return fields
 
-def write_to_mmap_file(data):
+def write_to_mmap_file(data, path=mmap_file_path):
     '''
-    The file is memory mapped and we do not perform any error checking. 
-    All operations are type and order sensistive.
-    The data is written in the following order:
-        int max_open_file = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 1);
-        int max_total_wal_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 5);
-        int delete_obsolete_files_period_micros = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 9);
-        int max_background_jobs = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 13);
-        int max_background_compactions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 17);
-        int max_subcompactions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 21);
-        int stats_dump_period_sec = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 25);
-        int compaction_readahead_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 29);
-        int writable_file_max_buffer_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 33);
-        int bytes_per_sync = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 37);
-        int wal_bytes_per_sync = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 41);
-        int delayed_write_rate = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 45);
-        int avoid_flush_during_shutdown = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 49);
-
-        int write_buffer_size = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 53);
-        int compression = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 57);
-        int level0_file_num_compaction_trigger = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 61);
-        int max_bytes_for_level_base = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 65);
-        int disable_auto_compactions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 69);
-        int memtable_max_range_deletions = *reinterpret_cast<int*>(mmap_dynamic_file_addr_ + 73);
+    Publish options to the running db_bench through the memory mapped file
+
+    The table is written under the seqlock: db_bench only applies a table whose sequence
+    is even and did not change while it was copied, so a partially written table is never applied.
+
+    Parameters:
+    - data (str or dict): An options file, or a dictionary of option names and values
+    - path (str): The dynamic options file of the db_bench process
+
+    Returns:
+    - int: The sequence number of the published options
     '''
+    fields = dynamic_option_fields(data)
 
-    if type(data) == str:
-        data = convert_option_string_to_list(data)
-    
-    with open(mmap_file_path, "r+b") as f:
+    with open(path, "r+b") as f:
         with mmap.mmap(f.fileno(), mmap_size, access=mmap.ACCESS_WRITE) as m:
-            
-            # Set ready flag to 0 while writing
-            m[0] = 0 
-
-            # Write compaction speed and cache size after the flag
-            m.seek(1)  # Move to position 1 after the flag byte
-            for i in range(len(data)):
-                m.write(struct.pack('i', data[i]))
-
-            m[0] = 1  # Flag to indicate "ready"
-
-# create_mmap_file()
-# data = [
-#     -1, # max_open_files
-#     0, # max_total_wal_size
-#     216, # delete_obsolete_files_period_micros ->  Currently Ignored
-#     2, # max_background_jobs
-#     -1, # max_background_compactions
-#     1, # max_subcompactions
-#     600, # stats_dump_period_sec
-#     2097152, # compaction_readahead_size
-#     1048576, # writable_file_max_buffer_size
-#     0, # bytes_per_sync
-#     0, # wal_bytes_per_sync
-#     8388608, # delayed_write_rate
-#     0, # avoid_flush_during_shutdown
-#     67108864, # write_buffer_size
-#     0, # compression
-#     4, # level0_file_num_compaction_trigger
-#     268435456, # max_bytes_for_level_base
-#     0, # disable_auto_compactions
-#     0 # memtable_max_range_deletions
-# ]
-# write_to_mmap_file(data)
+            magic, version, sequence, _, _, _ = HEADER.unpack_from(m, 0)
+            if magic != MMAP_MAGIC or version != MMAP_VERSION:
+                sequence = 0
+                write_header(m, sequence)
+            # An odd sequence is left by a writer that died while writing
+            sequence += sequence % 2
+
+            struct.pack_into('<Q', m, SEQUENCE_OFFSET, sequence + 1)
+            for index, (key, scope, value_type, value) in enumerate(fields):
+                ENTRY.pack_into(m, HEADER.size + index * ENTRY.size, key.encode(), value_type, scope, value)
+            struct.pack_into('<I', m, 16, len(fields))
+            struct.pack_into('<Q', m, SEQUENCE_OFFSET, sequence + 2)
+
+    log_update(f"Published {len(fields)} dynamic options with sequence {sequence + 2}: {[field[0] for field in fields]}")
+    return sequence + 2
+
+def applied_mmap_sequence(path=mmap_file_path):
+    '''
+    Read the sequence of the last options applied by db_bench
+
+    Parameters:
+    - path (str): The dynamic options file of the db_bench process
+
+    Returns:
+    - int: The sequence number, 0 before any options were applied
+    '''
+    with open(path, "rb") as f:
+        return HEADER.unpack(f.read(HEADER.size))[5]
+
+def parse_option_schedule(schedule):
+    '''
+    Convert the option schedule of an action into the schedule replayed during the benchmark
+
+    Parameters:
+    - schedule (list): OptionChange entries with an offset in seconds and "key=value" option strings
+
+    Returns:
+    - list: (offset in seconds, {option: value}) sorted by offset, only with mutable options
+    '''
+    parsed = []
+    for change in schedule or []:
+        options = {}
+        for option in change.options:
+            key, separator, value = option.partition("=")
+            key, value = key.strip(), value.strip()
+            if not separator or (key not in MUTABLE_DB_OPTIONS and key not in MUTABLE_CF_OPTIONS):
+                log_update(f"Dropping {option} from the option schedule, it cannot be changed while db_bench runs")
+                continue
+            options[key] = value
+        if options:
+            parsed.append((max(0.0, float(change.offset_seconds)), options))
+    return sorted(parsed, key=lambda change: change[0])
+
+def mutable_changes(parent_options, parent_db_bench_args, child_options, child_db_bench_args):
+    '''
+    Find the changes of a child configuration that can be applied to a database running the parent one
+
+    Parameters:
+    - parent_options (str): The options file of the parent
+    - parent_db_bench_args (list): The db_bench arguments of the parent
+    - child_options (str): The options file of the child
+    - child_db_bench_args (list): The db_bench arguments of the child
+
+    Returns:
+    - dict: {option: (parent value, child value)} of the changed options,
+            None if a change needs a restart: an immutable option, a removed option or other db_bench arguments
+    '''
+    parent_args = {key: canonical_value(value) for key, value in parse_db_bench_args_to_dict(parent_db_bench_args).items()}
+    child_args = {key: canonical_value(value) for key, value in parse_db_bench_args_to_dict(child_db_bench_args).items()}
+    if parent_args != child_args:
+        return None
+
+    parent = parse_option_file_to_dict(parent_options)
+    child = parse_option_file_to_dict(child_options)
+    changes = {}
+    for section in set(parent) | set(child):
+        parent_section = parent.get(section, {})
+        child_section = child.get(section, {})
+        if section.startswith("DBOptions"):
+            mutable = MUTABLE_DB_OPTIONS
+        elif section.startswith("CFOptions"):
+            mutable = MUTABLE_CF_OPTIONS
+        else:
+            mutable = []
+        for key in set(parent_section) | set(child_section):
+            parent_value = canonical_value(parent_section.get(key, ""))
+            child_value = canonical_value(child_section.get(key, ""))
+            if parent_value == child_value:
+                continue
+            if key not in mutable or key not in child_section:
+                return None
+            changes[key] = (parent_value, child_value)
+    return changes
+
+class OptionScheduleReplayer:
+    """Push a time-indexed list of option changes to a running db_bench through its dynamic options file."""
+
+    def __init__(self, schedule, path=mmap_file_path):
+        self.schedule = schedule
+        self.path = path
+        self.stopped = threading.Event()
+        self.thread = None
+        self.applied = []
+
+    def start(self):
+        '''
+        Start replaying the schedule, offsets are relative to this call
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        '''
+        self.start_time = time.monotonic()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for offset, options in self.schedule:
+            # Event.wait returns early when the benchmark ends before the change is due
+            if self.stopped.wait(max(0.0, self.start_time + offset - time.monotonic())):
+                return
+            sequence = write_to_mmap_file(options, self.path)
+            self.applied.append((offset, sequence))
+            log_update(f"[SPM] Schedule at {offset}s (sequence {sequence}): {options}")
+
+    def stop(self):
+        '''
+        Stop the replay and report the changes that were published
+
+        Parameters:
+        - None
+
+        Returns:
+        - list: (offset in seconds, sequence) of every published change
+        '''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        pending = len(self.schedule) - len(self.applied)
+        if pending:
+            log_update(f"[SPM] The benchmark ended before {pending} scheduled option changes")
+        return self.applied
@@ -0,0 +1,278 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.constants import RESULTS_STORE, RESULTS_STORE_PATH, OUTPUT_PATH, TEST_NAME, VERSION, DEVICE
+from utils.utils import log_update
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    test_name TEXT,
+    version TEXT,
+    device TEXT,
+    output_path TEXT
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    run_id TEXT NOT NULL,
+    node_id INTEGER NOT NULL,
+    parent_id INTEGER,
+    config_hash TEXT,
+    options TEXT,
+    db_bench_args TEXT,
+    option_schedule TEXT,
+    reasoning TEXT,
+    PRIMARY KEY (run_id, node_id)
+);
+CREATE TABLE IF NOT EXISTS benchmarks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    node_id INTEGER NOT NULL,
+    created REAL NOT NULL,
+    is_error INTEGER NOT NULL,
+    ops_per_sec REAL,
+    p99_micros REAL,
+    micros_per_op REAL,
+    total_seconds REAL,
+    data_speed REAL,
+    data_speed_unit TEXT,
+    stopped_early TEXT,
+    interval_times BLOB,
+    interval_ops BLOB,
+    histograms TEXT,
+    telemetry TEXT,
+    results TEXT
+);
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    model TEXT,
+    total_tokens INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cached_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS benchmarks_node ON benchmarks (run_id, node_id);
+CREATE INDEX IF NOT EXISTS nodes_config_hash ON nodes (config_hash);
+CREATE INDEX IF NOT EXISTS runs_test_name ON runs (test_name);
+"""
+
+
+def encode_series(values):
+    # Interval series are stored as float64 arrays, read back with np.frombuffer
+    return np.asarray(values, dtype=np.float64).tobytes()
+
+
+def decode_series(blob):
+    return np.frombuffer(blob, dtype=np.float64) if blob is not None else np.zeros(0)
+
+
+class ResultsStore:
+    """SQLite store of the nodes, benchmarks and LLM usage of every tuning run."""
+
+    def __init__(self, path, run_id):
+        self.run_id = run_id
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(
+            "INSERT OR IGNORE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, time.time(), TEST_NAME, VERSION, DEVICE, OUTPUT_PATH),
+        )
+        self.connection.commit()
+
+    def execute(self, statement, parameters=()):
+        with self.lock:
+            self.connection.execute(statement, parameters)
+            self.connection.commit()
+
+    def record_node(self, node):
+        '''
+        Record the configuration of a node, replacing the previous record of the same node
+
+        Parameters:
+        - node (Node): The node
+
+        Returns:
+        - None
+        '''
+        self.execute(
+            "INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.run_id,
+                node.id,
+                node.parent.id if node.parent is not None else None,
+                node.config_hash,
+                node.full_option if isinstance(node.full_option, str) else None,
+                json.dumps(node.db_bench_option or []),
+                json.dumps(node.option_schedule) if node.option_schedule else None,
+                node.reasoning if isinstance(node.reasoning, str) else None,
+            ),
+        )
+
+    def record_benchmark(self, node, results, is_error, histograms=None, telemetry=None):
+        '''
+        Append the results of a benchmark of a node
+
+        Parameters:
+        - node (Node): The benchmarked node
+        - results (dict): The parsed benchmark results
+        - is_error (bool): True if the benchmark failed
+        - histograms (dict): The latency HistogramBlock of every operation
+        - telemetry (dict): The cgroup statistics of the run
+
+        Returns:
+        - None
+        '''
+        self.record_node(node)
+        times, ops = results.get("ops_per_second_graph") or ([], [])
+        histograms = {
+            operation: {
+                "count": histogram.count,
+                "average": histogram.average,
+                "std_dev": histogram.std_dev,
+                "min": histogram.min,
+                "median": histogram.median,
+                "max": histogram.max,
+                "percentiles": histogram.percentiles,
+            }
+            for operation, histogram in (histograms or {}).items()
+        }
+        scalars = {key: value for key, value in results.items() if key != "ops_per_second_graph"}
+        self.execute(
+            "INSERT INTO benchmarks (run_id, node_id, created, is_error, ops_per_sec, p99_micros, micros_per_op, total_seconds, "
+            "data_speed, data_speed_unit, stopped_early, interval_times, interval_ops, histograms, telemetry, results) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.run_id,
+                node.id,
+                time.time(),
+                int(is_error),
+                results.get("ops_per_sec"),
+                results.get("p99_micros"),
+                results.get("micros_per_op"),
+                results.get("total_seconds"),
+                results.get("data_speed"),
+                results.get("data_speed_unit"),
+                results.get("stopped_early"),
+                encode_series(times),
+                encode_series(ops),
+                json.dumps(histograms),
+                json.dumps(telemetry or {}),
+                json.dumps(scalars, default=str),
+            ),
+        )
+
+    def record_llm_usage(self, model, usage):
+        '''
+        Append the token usage of an LLM response
+
+        Parameters:
+        - model (str): The model that answered
+        - usage: The usage of the chat completion
+
+        Returns:
+        - None
+        '''
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.execute(
+            "INSERT INTO llm_usage (run_id, created, model, total_tokens, prompt_tokens, completion_tokens, cached_tokens) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                self.run_id,
+                time.time(),
+                model,
+                usage.total_tokens,
+                usage.prompt_tokens,
+                usage.completion_tokens,
+                getattr(details, "cached_tokens", None),
+            ),
+        )
+
+    def query(self, statement, parameters=()):
+        '''
+        Run a read-only query
+
+        Parameters:
+        - statement (str): The SQL query
+        - parameters (tuple): The query parameters
+
+        Returns:
+        - list: The rows as sqlite3.Row
+        '''
+        with self.lock:
+            return self.connection.execute(statement, parameters).fetchall()
+
+    def benchmarked_configurations(self, test_name=TEST_NAME, exclude_current_run=True):
+        '''
+        Get the successful full-size benchmarks of a workload with their configuration
+
+        Parameters:
+        - test_name (str): The workload
+        - exclude_current_run (bool): Leave out the benchmarks of this run
+
+        Returns:
+        - list: Rows with run_id, node_id, config_hash, options, db_bench_args, ops_per_sec and p99_micros
+        '''
+        return self.query(
+            "SELECT b.run_id, b.node_id, n.config_hash, n.options, n.db_bench_args, b.ops_per_sec, b.p99_micros "
+            "FROM benchmarks b JOIN nodes n ON n.run_id = b.run_id AND n.node_id = b.node_id "
+            "JOIN runs r ON r.run_id = b.run_id "
+            "WHERE r.test_name = ? AND b.is_error = 0 AND b.ops_per_sec > 0 AND n.options IS NOT NULL AND b.run_id != ? "
+            # Successive halving screening runs and hot swap segments record their fidelity
+            "AND COALESCE(json_extract(b.results, '$.fidelity'), 1) >= 1",
+            (test_name, self.run_id if exclude_current_run else ""),
+        )
+
+    def interval_series(self, run_id, node_id):
+        '''
+        Get the per-interval throughput of the last benchmark of a node
+
+        Parameters:
+        - run_id (str): The run
+        - node_id (int): The node
+
+        Returns:
+        - tuple: (times, ops per second) arrays
+        '''
+        rows = self.query(
+            "SELECT interval_times, interval_ops FROM benchmarks WHERE run_id = ? AND node_id = ? ORDER BY id DESC LIMIT 1",
+            (run_id, node_id),
+        )
+        if not rows:
+            return np.zeros(0), np.zeros(0)
+        return decode_series(rows[0]["interval_times"]), decode_series(rows[0]["interval_ops"])
+
+
+store = None
+store_lock = threading.Lock()
+
+
+def results_store():
+    '''
+    Get the results store of this run, opened on first use
+
+    Parameters:
+    - None
+
+    Returns:
+    - ResultsStore: The store, None when --results_store is disabled
+    '''
+    global store
+    if not RESULTS_STORE:
+        return None
+    with store_lock:
+        if store is None:
+            store = ResultsStore(RESULTS_STORE_PATH, os.path.basename(os.path.normpath(OUTPUT_PATH)))
+            log_update(f"[RST] Recording results of run {store.run_id} in {RESULTS_STORE_PATH}")
+    return store
@@ -1,117 +1,289 @@
 import subprocess
-import re
+import hashlib
+import json
 import os
+import tempfile
+import time
 
+from utils.constants import FIO_CACHE_MAX_AGE_DAYS, FIO_RUNTIME
+from utils.utils import path_of_db
 
-def fio_run(test_type, file_path):
+# Bumped whenever the job file changes, older cached profiles are then rerun
+FIO_PROFILE_VERSION = 2
+# (name, rw, block size, iodepth) of every job, run one after the other in a single fio invocation
+FIO_JOBS = [
+    ("randwrite", "randwrite", "4k", 1),
+    ("randwrite_qd8", "randwrite", "4k", 8),
+    ("randwrite_qd32", "randwrite", "4k", 32),
+    ("write", "write", "4k", 1),
+    ("randread", "randread", "4k", 1),
+    ("randread_qd8", "randread", "4k", 8),
+    ("randread_qd32", "randread", "4k", 32),
+    ("read", "read", "4k", 1),
+]
+LATENCY_PERCENTILES = ["50.000000", "99.000000", "99.900000"]
+
+
+def existing_parent(path):
+    '''
+    Function to find the closest existing directory of a path
+
+    Parameters:
+    - path: string containing a path that may not exist yet
+
+    Returns:
+    - path: string containing the closest existing directory
+    '''
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def read_sys_file(path):
+    try:
+        with open(path, "r") as file:
+            return file.read().strip()
+    except OSError:
+        return ""
+
+
+def mount_of(path):
+    '''
+    Function to find the mount point and filesystem holding a path
+
+    Parameters:
+    - path: string containing an existing path
+
+    Returns:
+    - (mount_point, filesystem, source): strings from /proc/self/mountinfo, empty if unknown
+    '''
+    device = os.stat(path).st_dev
+    device_id = f"{os.major(device)}:{os.minor(device)}"
+    best = ("", "", "")
+    for line in read_sys_file("/proc/self/mountinfo").splitlines():
+        # id parent major:minor root mount_point options [optional fields] - filesystem source super_options
+        fields = line.split()
+        if len(fields) < 10 or fields[2] != device_id:
+            continue
+        separator = fields.index("-")
+        mount_point = fields[4]
+        if path.startswith(mount_point) and len(mount_point) >= len(best[0]):
+            best = (mount_point, fields[separator + 1], fields[separator + 2])
+    return best
+
+
+def device_fingerprint(path):
+    '''
+    Function to identify the block device and filesystem a path is stored on
+
+    Parameters:
+    - path: string containing the directory that is profiled
+
+    Returns:
+    - fingerprint: dict with the device model, serial, size and rotational flag, the filesystem and the mount point
+    '''
+    path = existing_parent(path)
+    device = os.stat(path).st_dev
+    mount_point, filesystem, source = mount_of(path)
+    fingerprint = {
+        "mount_point": mount_point,
+        "filesystem": filesystem,
+        "source": source,
+    }
+
+    block = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    if os.path.exists(block):
+        block = os.path.realpath(block)
+        # Partitions keep the device attributes in their parent
+        if os.path.exists(os.path.join(block, "partition")):
+            block = os.path.dirname(block)
+        fingerprint.update({
+            "device": os.path.basename(block),
+            "model": read_sys_file(os.path.join(block, "device/model")),
+            "serial": read_sys_file(os.path.join(block, "device/serial")) or read_sys_file(os.path.join(block, "serial")),
+            "wwid": read_sys_file(os.path.join(block, "device/wwid")) or read_sys_file(os.path.join(block, "wwid")),
+            "size_sectors": read_sys_file(os.path.join(block, "size")),
+            "rotational": read_sys_file(os.path.join(block, "queue/rotational")),
+        })
+    return fingerprint
+
+
+def fingerprint_key(fingerprint):
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def fio_job_file(target_dir):
     '''
-    Function to run fio benchmark
+    Function to build the fio job file of the device profile
 
     Parameters:
-    - test_type: string containing the type of test to run
+    - target_dir: string containing the directory the test file is written to
 
     Returns:
-    - parsed_res: string containing the parsed result of the fio test
-    '''
-    command = [
-        "fio",
-        "--name=test",
-        "--ioengine=posixaio",
-        f"--rw={test_type}",
-        "--bs=4k",
-        "--numjobs=1",
-        "--size=10G",
-        "--runtime=60",
-        "--time_based"
+    - job_file: string containing the fio job file
+    '''
+    lines = [
+        "[global]",
+        "ioengine=libaio",
+        "direct=1",
+        "size=10G",
+        f"runtime={FIO_RUNTIME}",
+        "time_based",
+        "group_reporting",
+        f"directory={target_dir}",
+        "filename=fio_profile.test",
+        f"percentile_list={':'.join(p.rstrip('0').rstrip('.') for p in LATENCY_PERCENTILES)}",
+        "",
     ]
+    for name, rw, block_size, iodepth in FIO_JOBS:
+        lines += [
+            f"[{name}]",
+            # Run the jobs one after the other
+            "stonewall",
+            f"rw={rw}",
+            f"bs={block_size}",
+            f"iodepth={iodepth}",
+            "",
+        ]
+    return "\n".join(lines)
 
-    print("[FIO] running fio test now", test_type + "\n")
-    proc = subprocess.run(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
 
-    output = proc.stdout.decode()
-    print("[FIO] output :", output)
+def parse_fio_json(fio_json):
+    '''
+    Function to extract the bandwidth, IOPS and latency percentiles of every job
 
-    parsed_res = parse_fio_output(output, test_type)
+    Parameters:
+    - fio_json: dict containing the fio JSON output
 
-    directory = os.path.dirname(file_path)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    Returns:
+    - jobs: list of dicts with the results of every job
+    '''
+    settings = {name: (rw, block_size, iodepth) for name, rw, block_size, iodepth in FIO_JOBS}
+    jobs = []
+    for job in fio_json.get("jobs", []):
+        name = job["jobname"]
+        rw, block_size, iodepth = settings.get(name, (name, "", 1))
+        direction = "write" if "write" in rw else "read"
+        stats = job[direction]
+        percentiles = stats.get("clat_ns", {}).get("percentile", {})
+        jobs.append({
+            "name": name,
+            "rw": rw,
+            "block_size": block_size,
+            "iodepth": iodepth,
+            "bandwidth_kib": stats["bw"],
+            "iops": stats["iops"],
+            "latency_mean_us": stats.get("lat_ns", {}).get("mean", 0) / 1000,
+            "latency_percentiles_us": {p.rstrip("0").rstrip("."): percentiles.get(p, 0) / 1000 for p in LATENCY_PERCENTILES},
+        })
+    return jobs
 
-    with open(file_path, "a") as file:
-        file.write(parsed_res + '\n')
 
-    return parsed_res
+def summarize_fio_jobs(jobs):
+    '''
+    Function to describe the device profile for the prompts
 
+    Parameters:
+    - jobs: list of dicts returned by parse_fio_json
 
-def get_fio_result(file_path):
+    Returns:
+    - result_string: string with one line per job
     '''
-    Function to get the fio result
+    lines = []
+    for job in jobs:
+        mib = job["bandwidth_kib"] / 1024
+        mb = job["bandwidth_kib"] * 1024 / 1000000
+        latency = ", ".join(f"p{p} {value:.0f}us" for p, value in job["latency_percentiles_us"].items())
+        lines.append(
+            f"{job['rw']} {job['block_size']} iodepth {job['iodepth']} bandwidth is {mib:.1f}MiB/s ({mb:.1f}MB/s), "
+            f"{job['iops']:.0f} IOPS, direct I/O latency {latency}"
+        )
+    return "\n".join(lines)
+
+
+def fio_run(target_dir):
+    '''
+    Function to run the fio profile as a single job file
 
     Parameters:
-    - file_path: string containing the path to the fio result file
+    - target_dir: string containing the directory on the profiled device
 
     Returns:
-    - content: string containing the content of the fio result
+    - jobs: list of dicts with the results of every job
     '''
-    if (os.path.exists(file_path) and os.path.getsize(file_path) != 0):
-        print("[FIO] File exists and is not empty. Reading file.")
-        with open(file_path, 'r') as file:
-            content = file.read()
-        return content
+    with tempfile.NamedTemporaryFile("w", suffix=".fio", delete=False) as job_file:
+        job_file.write(fio_job_file(target_dir))
 
-     # List of test types
-    test_types = ["randwrite", "randread", "read", "write"]
-    combined_result = []
-    for test_type in test_types:
-        fio_result = fio_run(test_type, file_path)
-        combined_result.append(fio_result)
+    print(f"[FIO] running the fio profile in {target_dir}, {len(FIO_JOBS)} jobs of {FIO_RUNTIME}s")
+    try:
+        proc = subprocess.run(
+            ["fio", "--output-format=json", job_file.name],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    finally:
+        os.remove(job_file.name)
+        delete_test_file(target_dir)
 
-    combined_result = "\n".join(combined_result)
-    print(f"[FIO] result : \n {combined_result}")
-    delete_test_file()
-    return combined_result
+    if proc.returncode != 0:
+        raise RuntimeError(f"[FIO] fio failed: {proc.stderr.decode()}")
+    output = proc.stdout.decode()
+    # fio may print warnings before the JSON document
+    return parse_fio_json(json.loads(output[output.index("{"):]))
 
 
-def parse_fio_output(fio_result, test_type):
+def get_fio_result(file_path, target_dir=None):
     '''
-    Function to parse the fio output
+    Function to get the fio result
+
+    The profile is cached next to file_path, keyed by the fingerprint of the device holding target_dir.
+    A cached profile is rerun when it is older than FIO_CACHE_MAX_AGE_DAYS or was made by another job file.
 
     Parameters:
-    - fio_result: string containing the fio result
-    - test_type: string containing the type of test to run
+    - file_path: string containing the path to the fio result file, its directory holds the cache
+    - target_dir: string containing the directory to profile, the database directory by default
 
     Returns:
-    - result_string: string containing the parsed result of the fio test
+    - content: string containing the content of the fio result
     '''
-    if test_type in ["randwrite", "write"]:
-        pattern = re.compile(r'WRITE: bw=(.*?)\s\(.*?\),\s(.*?)\s\(.*?\)')
-    elif test_type in ["randread", "read"]:
-        pattern = re.compile(r'READ: bw=(.*?)\s\(.*?\),\s(.*?)\s\(.*?\)')
-    else:
-        print(f"[FIO] Unsupported test type: {test_type}")
+    target_dir = existing_parent(target_dir or path_of_db())
+    fingerprint = device_fingerprint(target_dir)
+    cache_dir = os.path.dirname(file_path)
+    cache_path = os.path.join(cache_dir, f"fio_profile_{fingerprint_key(fingerprint)}.json")
 
-    match = pattern.search(fio_result)
-    if match:
-        values_list = [match.group(1), match.group(2)]
-        result_string = f"{test_type} bandwidth is {values_list[0]} ({values_list[1]})"
-        print(f"[FIO] result string : {result_string}")
-    else:
-        print("[FIO] Pattern not found in the fio result.")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as file:
+            cached = json.load(file)
+        age_days = (time.time() - cached["created"]) / 86400
+        if cached.get("profile_version") != FIO_PROFILE_VERSION:
+            print("[FIO] Cached profile was made by another job file. Running fio again.")
+        elif FIO_CACHE_MAX_AGE_DAYS > 0 and age_days > FIO_CACHE_MAX_AGE_DAYS:
+            print(f"[FIO] Cached profile is {age_days:.0f} days old. Running fio again.")
+        else:
+            print(f"[FIO] Reading the cached profile of {fingerprint.get('model') or fingerprint['source']} on {fingerprint['mount_point']}.")
+            return cached["summary"]
 
-    return result_string
+    jobs = fio_run(target_dir)
+    combined_result = summarize_fio_jobs(jobs)
+    print(f"[FIO] result : \n {combined_result}")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path, "w") as file:
+        json.dump({
+            "fingerprint": fingerprint,
+            "profile_version": FIO_PROFILE_VERSION,
+            "created": time.time(),
+            "jobs": jobs,
+            "summary": combined_result,
+        }, file, indent=4)
+    return combined_result
 
 
-def delete_test_file():
+def delete_test_file(target_dir):
     '''
     Function to delete the test file
     '''
-    proc = subprocess.run(
-        f'rm test.0.0',
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        shell=True
-    )
+    test_file = os.path.join(target_dir, "fio_profile.test")
+    if os.path.exists(test_file):
+        os.remove(test_file)